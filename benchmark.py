@@ -0,0 +1,404 @@
+"""CSC111 Final Project: Visualizing COVID-19 Vaccinations In the World
+Module Description
+===============================
+This module contains a benchmark suite that times every stage of building the map and measures
+how much memory each stage allocates.
+
+The benchmarks run on synthetic datasets made by copying every country in the vaccine dataset a
+number of times, so the number of countries and rows both grow by that scale. The results are
+written as JSON, so that the results of two commits can be compared with --compare.
+
+Example usage:
+
+    python benchmark.py --scales 10 100 1000 --output results.json
+    python benchmark.py --compare old_results.json results.json
+
+Only the selected stages and the stages they need the output of are run. Run the module with
+--check alone to run its doctests and python_ta instead of the benchmarks.
+
+Copyright and Usage Information
+===============================
+
+This file is Copyright (c) 2021 Zachary Lee.
+"""
+from typing import Callable, Optional
+import argparse
+import csv
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import process_vaccine_data
+import read_data
+
+# The stages of the map build that are benchmarked, in the order they run
+STAGES = ['read', 'aggregate', 'charts', 'map']
+
+# The stages whose output each stage needs
+STAGE_REQUIREMENTS = {'read': [], 'aggregate': ['read'], 'charts': ['aggregate'],
+                      'map': ['aggregate']}
+
+# The default scales of the synthetic datasets
+DEFAULT_SCALES = [10, 100, 1000]
+
+# The default number of graphs rendered in the charts stage for each copy of the countries, so
+# the number of graphs grows with the scale like the other stages
+DEFAULT_CHART_SAMPLE = 2
+
+# The image linked from every popup in the map stage, so that it measures building and saving
+# the map without rendering any graphs
+PLACEHOLDER_IMAGE = b'placeholder'
+
+
+def generate_datasets(directory: str, scale: int, vaccine_filename: str,
+                      coordinate_filename: str, continent_filename: str) -> {str: str}:
+    """Write synthetic versions of the datasets to directory, with every country copied scale
+    times, and return a dictionary of dataset names mapped to the new filenames.
+
+    Each copy of a country gets a new country code, which is also added to the coordinate and
+    continent datasets and to a country GeoJSON file with one square for each country.
+
+    Preconditions:
+        - scale >= 1
+
+    >>> directory = tempfile.mkdtemp()
+    >>> filenames = generate_datasets(directory, 2, 'datasets/country_vaccinations.csv', \
+    'datasets/countries_codes_and_coordinates.csv', \
+    'datasets/country-and-continent-codes-list-csv_csv.csv')
+    >>> vaccine_data = read_data.read_vaccine_data(filenames['vaccine'])
+    >>> vaccine_data['AFG'] == vaccine_data['AFG_1']
+    True
+    """
+    filenames = {name: os.path.join(directory, f'{name}_{scale}x.{extension}')
+                 for name, extension in [('vaccine', 'csv'), ('coordinate', 'csv'),
+                                         ('continent', 'csv'), ('country_json', 'geojson'),
+                                         ('continent_json', 'json')]}
+
+    def copy_code(code: str, copy: int) -> str:
+        return code if copy == 0 else f'{code}_{copy}'
+
+    # Groups the rows of each country, keeping the order of the file
+    with open(vaccine_filename, newline='') as file:
+        reader = csv.reader(file)
+        header = next(reader)
+        blocks = {}
+        for row in reader:
+            blocks.setdefault(row[1], []).append(row)
+
+    with open(filenames['vaccine'], 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+        for code in blocks:
+            for copy in range(scale):
+                for row in blocks[code]:
+                    writer.writerow([row[0], copy_code(code, copy)] + row[2:])
+
+    coordinates = read_data.read_coordinate_data(coordinate_filename)
+    with open(filenames['coordinate'], 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['Country', 'Alpha-2 code', 'Alpha-3 code', 'Numeric code',
+                         'Latitude (average)', 'Longitude (average)'])
+        for code in coordinates:
+            for copy in range(scale):
+                latitude, longitude = coordinates[code]
+                writer.writerow([code, '', copy_code(code, copy), '',
+                                 latitude + (copy % 10) * 0.1, longitude + (copy // 10) * 0.1])
+
+    continents = read_data.read_continent_data(continent_filename)
+    with open(filenames['continent'], 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['Continent_Name', 'Continent_Code', 'Country_Name',
+                         'Two_Letter_Country_Code', 'Three_Letter_Country_Code',
+                         'Country_Number'])
+        for continent in continents:
+            for code in continents[continent]:
+                for copy in range(scale):
+                    writer.writerow([continent, '', '', '', copy_code(code, copy), ''])
+
+    codes = [copy_code(code, copy) for code in blocks for copy in range(scale)]
+    write_square_geojson(filenames['country_json'], 'ISO_A3', codes)
+    write_square_geojson(filenames['continent_json'], 'continent', list(continents))
+
+    return filenames
+
+
+def write_square_geojson(filename: str, key: str, names: [str]) -> None:
+    """Write a GeoJSON file to filename with a small square feature for each name, where the
+    name is stored in the key property of the feature.
+    """
+    features = []
+
+    for i in range(len(names)):
+        latitude = (i // 360) % 170 - 85
+        longitude = i % 360 - 180
+        square = [[longitude, latitude], [longitude + 1, latitude],
+                  [longitude + 1, latitude + 1], [longitude, latitude + 1],
+                  [longitude, latitude]]
+        features.append({'type': 'Feature', 'properties': {key: names[i]},
+                         'geometry': {'type': 'Polygon', 'coordinates': [square]}})
+
+    with open(filename, 'w') as file:
+        json.dump({'type': 'FeatureCollection', 'features': features}, file)
+
+
+def measure(function: Callable[[], object], measure_memory: bool) -> (object, {str: float}):
+    """Call function and return its result together with the wall time and CPU time it took,
+    in seconds, and the peak memory it allocated, in bytes.
+
+    The times are measured on a separate call from the memory, since tracing the memory
+    allocations slows the function down. If measure_memory is False, the peak memory is None.
+    """
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    result = function()
+    measurements = {'wall_time': time.perf_counter() - wall_start,
+                    'cpu_time': time.process_time() - cpu_start,
+                    'peak_memory': None}
+
+    if measure_memory:
+        tracemalloc.start()
+        function()
+        measurements['peak_memory'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return result, measurements
+
+
+def run_benchmarks(scales: [int], stages: [str], chart_sample: int, measure_memory: bool,
+                   directory: str) -> [dict]:
+    """Return the results of benchmarking each stage in stages on the synthetic dataset of each
+    scale in scales. The synthetic datasets are written to directory.
+
+    Preconditions:
+        - all(stage in STAGES for stage in stages)
+    """
+    results = []
+    required_stages = get_required_stages(stages)
+
+    for scale in scales:
+        filenames = generate_datasets(directory, scale, 'datasets/country_vaccinations.csv',
+                                      'datasets/countries_codes_and_coordinates.csv',
+                                      'datasets/country-and-continent-codes-list-csv_csv.csv')
+        stage_functions = create_stage_functions(filenames, chart_sample * scale, directory)
+        outputs = {}
+
+        for stage in required_stages:
+            output, measurements = measure(lambda: stage_functions[stage](outputs),
+                                           measure_memory and stage in stages)
+            outputs[stage] = output
+            if stage in stages:
+                results.append({'scale': scale, 'stage': stage,
+                                'items': count_items(stage, output), **measurements})
+                print(format_result(results[-1]))
+
+    return results
+
+
+def get_required_stages(stages: [str]) -> [str]:
+    """Return the stages in stages and every stage they need the output of, in the order they
+    run.
+
+    Preconditions:
+        - all(stage in STAGES for stage in stages)
+
+    >>> get_required_stages(['map'])
+    ['read', 'aggregate', 'map']
+    >>> get_required_stages(['read'])
+    ['read']
+    """
+    required = set()
+    remaining = list(stages)
+
+    while remaining != []:
+        stage = remaining.pop()
+        if stage not in required:
+            required.add(stage)
+            remaining.extend(STAGE_REQUIREMENTS[stage])
+
+    return [stage for stage in STAGES if stage in required]
+
+
+def create_stage_functions(filenames: {str: str}, chart_sample: int, directory: str) \
+        -> {str: Callable[[dict], object]}:
+    """Return a dictionary of each stage mapped to a function that runs it on the datasets in
+    filenames, given the outputs of the previous stages. The charts stage renders the graphs of
+    the first chart_sample countries, or of every country if there are fewer.
+    """
+    def read(_: dict) -> tuple:
+        vaccine_data, country_names = read_data.read_vaccine_file(filenames['vaccine'])
+        return (vaccine_data, country_names,
+                read_data.read_coordinate_data(filenames['coordinate']),
+                read_data.read_continent_data(filenames['continent']))
+
+    def aggregate(outputs: dict) -> list:
+        vaccine_data, country_names, coordinate_data, continent_data = outputs['read']
+        countries = process_vaccine_data.build_country_locations(vaccine_data, country_names,
+                                                                 coordinate_data)
+        continents = process_vaccine_data.build_continent_locations(countries, continent_data)
+        return [countries, continents, country_names, coordinate_data, continent_data]
+
+    def render_stage(outputs: dict) -> [bytes]:
+        import charts
+        return charts.render_graphs(outputs['aggregate'][0][:chart_sample], processes=1)
+
+    def build_map(outputs: dict) -> int:
+        import asyncio
+        import build
+        import instrumentation
+        import vaccine_classes
+        import visualize_vaccinations
+
+        # The map is assembled and streamed to its file the same way main.py builds it
+        dataset = vaccine_classes.VaccineDataset(*outputs['aggregate'])
+        output_filename = os.path.join(directory, 'map.html')
+        graph_urls = {}
+        for kind, locations in [('countries', dataset.countries),
+                                ('continents', dataset.continents)]:
+            urls = visualize_vaccinations.create_graph_urls(
+                [PLACEHOLDER_IMAGE] * len(locations), 'graphs', directory)
+            graph_urls[kind] = dict(zip((location.name for location in locations), urls))
+
+        asyncio.run(build.assemble_map_async(
+            build.VariantSpec(output_filename), dataset, filenames, graph_urls, {},
+            instrumentation.Profiler(), None, vaccine_classes.DEFAULT_METRIC))
+        return os.path.getsize(output_filename)
+
+    return {'read': read, 'aggregate': aggregate, 'charts': render_stage, 'map': build_map}
+
+
+def count_items(stage: str, output: object) -> int:
+    """Return the number of items the stage produced: rows parsed, locations aggregated, graphs
+    rendered or bytes of HTML.
+    """
+    if stage == 'read':
+        return sum(len(series) for series in output[0].values())
+    elif stage == 'aggregate':
+        return len(output[0]) + len(output[1])
+    elif stage == 'charts':
+        return len(output)
+    else:
+        return output
+
+
+def format_result(result: dict) -> str:
+    """Return a line describing a single benchmark result.
+
+    >>> format_result({'scale': 10, 'stage': 'read', 'items': 78970, 'wall_time': 0.25, \
+    'cpu_time': 0.25, 'peak_memory': 2 ** 20})
+    '10x read: 0.250 s wall, 0.250 s CPU, 1.0 MiB peak, 78970 items'
+    """
+    if result['peak_memory'] is None:
+        memory = 'not measured'
+    else:
+        memory = f'{result["peak_memory"] / 2 ** 20:.1f} MiB peak'
+
+    return (f'{result["scale"]}x {result["stage"]}: {result["wall_time"]:.3f} s wall, '
+            f'{result["cpu_time"]:.3f} s CPU, {memory}, {result["items"]} items')
+
+
+def get_environment() -> {str: Optional[str]}:
+    """Return a description of the commit and environment the benchmarks ran in.
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {'commit': commit, 'python': platform.python_version(), 'numpy': np.__version__,
+            'machine': platform.machine(), 'cpus': str(os.cpu_count())}
+
+
+def compare_results(old_filename: str, new_filename: str) -> [str]:
+    """Return a line for each stage and scale that is in both result files, comparing the wall
+    time and peak memory of the new results to the old ones.
+    """
+    with open(old_filename) as file:
+        old = json.load(file)
+    with open(new_filename) as file:
+        new = json.load(file)
+
+    old_results = {(result['scale'], result['stage']): result for result in old['results']}
+    lines = [f'{old["environment"]["commit"]} -> {new["environment"]["commit"]}']
+
+    for result in new['results']:
+        key = (result['scale'], result['stage'])
+        if key in old_results:
+            old_result = old_results[key]
+            line = (f'{key[0]}x {key[1]}: {old_result["wall_time"]:.3f} s -> '
+                    f'{result["wall_time"]:.3f} s '
+                    f'({result["wall_time"] / max(old_result["wall_time"], 1e-9):.2f}x)')
+            if result['peak_memory'] is not None and old_result['peak_memory'] is not None:
+                line += (f', {old_result["peak_memory"] / 2 ** 20:.1f} MiB -> '
+                         f'{result["peak_memory"] / 2 ** 20:.1f} MiB')
+            lines.append(line)
+
+    return lines
+
+
+def main() -> None:
+    """Run the benchmarks or compare two result files, depending on the command line arguments.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark each stage of the map build.')
+    parser.add_argument('--scales', type=int, nargs='+', default=DEFAULT_SCALES,
+                        help='how many times to copy every country in the synthetic datasets')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES,
+                        help='the stages to report, which also runs the stages they need')
+    parser.add_argument('--chart-sample', type=int, default=DEFAULT_CHART_SAMPLE,
+                        help='the number of graphs to render in the charts stage for each '
+                             'copy of the countries')
+    parser.add_argument('--no-memory', action='store_true',
+                        help='skip measuring the peak memory of each stage')
+    parser.add_argument('--output', default='benchmark_results.json',
+                        help='the file to write the results to')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help='compare two result files instead of running the benchmarks')
+    arguments = parser.parse_args()
+
+    if arguments.compare is not None:
+        for line in compare_results(*arguments.compare):
+            print(line)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = run_benchmarks(arguments.scales, arguments.stages, arguments.chart_sample,
+                                 not arguments.no_memory, directory)
+
+    with open(arguments.output, 'w') as file:
+        json.dump({'environment': get_environment(), 'results': results}, file, indent=2)
+
+
+if __name__ == '__main__':
+    # You can uncomment the following lines for code checking/debugging purposes.
+    # However, we recommend commenting out these lines when working with the large
+    # datasets, as checking representation invariants and preconditions greatly
+    # increases the running time of the functions/methods.
+    # import python_ta.contracts
+    # python_ta.contracts.check_all_contracts()
+
+    if sys.argv[1:] != ['--check']:
+        main()
+        sys.exit()
+
+    import doctest
+    doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'extra-imports': ['typing', 'argparse', 'csv', 'json', 'os', 'platform', 'subprocess',
+                          'sys', 'tempfile', 'time', 'tracemalloc', 'numpy',
+                          'process_vaccine_data', 'read_data', 'asyncio', 'build',
+                          'instrumentation', 'vaccine_classes', 'charts',
+                          'visualize_vaccinations'],
+        # the names (strs) of imported modules
+        'allowed-io': ['generate_datasets', 'write_square_geojson', 'run_benchmarks',
+                       'compare_results', 'main'],
+        # the names (strs) of functions that call print/open/input
+        'max-line-length': 100,
+        'disable': ['E1136']
+    })
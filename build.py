@@ -0,0 +1,431 @@
+"""CSC111 Final Project: Visualizing COVID-19 Vaccinations In the World
+Module Description
+===============================
+This module contains the asyncio entry point that builds the map and saves it.
+
+The stages that mostly wait for files, such as reading and simplifying the borders, run in
+threads at the same time as the datasets are parsed and processed, and every stage runs outside
+the event loop, so several builds can run at once in the same loop. The graphs are rendered in
+memory and the map is streamed to a temporary file that then replaces the output, so builds
+that run at the same time never see each other's partial files, as long as they save their maps
+to different files.
+
+Copyright and Usage Information
+===============================
+
+This file is Copyright (c) 2021 Zachary Lee.
+"""
+from typing import Any, Callable, Iterator, Optional, TextIO
+import asyncio
+import contextlib
+import json
+import os
+import tempfile
+import folium
+import charts
+import derived_metrics
+import geometry
+import graph_cache
+import instrumentation
+import map_writer
+import process_vaccine_data
+import vaccine_classes
+import visualize_vaccinations
+
+# The zoom level of a map variant that is zoomed to a continent
+CONTINENT_ZOOM = 3
+
+
+class VariantSpec:
+    """ The options of one map in a batch build.
+    Instance Attributes:
+        - output_filename: The file the map is saved to.
+        - tiles: The names of the folium tile sets of the map. The first one is shown when the
+          map is opened.
+        - continent: The name of the continent the map is zoomed to, or None to show the whole
+          world.
+        - countries: Whether the country choropleth and markers are added to the map.
+        - continents: Whether the continent choropleth and markers are added to the map.
+        - time_slider: Whether the country choropleth with a time slider is added to the map.
+        - clustered_markers: Whether the markers of each kind of location are drawn by a single
+          clustered GeoJSON layer.
+        - derived: Whether the map shows the weekly average and growth of each location, in the
+          popups and in a choropleth of the weekly average of each country.
+
+    Representation Invariants:
+        - self.output_filename != ''
+        - self.tiles != []
+    >>> variant = VariantSpec('europe.html', continent='Europe', continents=False)
+    >>> variant.tiles
+    ['cartodbpositron', 'cartodbdark_matter']
+    """
+    output_filename: str
+    tiles: [str]
+    continent: Optional[str]
+    countries: bool
+    continents: bool
+    time_slider: bool
+    clustered_markers: bool
+    derived: bool
+
+    def __init__(self, output_filename: str, tiles: Optional[list] = None,
+                 continent: Optional[str] = None, countries: bool = True,
+                 continents: bool = True, time_slider: bool = False,
+                 clustered_markers: bool = False, derived: bool = True) -> None:
+        """Initialize a new map variant. The map has the light and dark tile sets if tiles is
+        None.
+        """
+        self.output_filename = output_filename
+        self.tiles = ['cartodbpositron', 'cartodbdark_matter'] if tiles is None else tiles
+        self.continent = continent
+        self.countries = countries
+        self.continents = continents
+        self.time_slider = time_slider
+        self.clustered_markers = clustered_markers
+        self.derived = derived
+
+
+def read_variants(filename: str) -> [VariantSpec]:
+    """Return the map variants in the JSON file called filename, which contains a list with an
+    object for each variant that maps the names of the arguments of VariantSpec to their values.
+
+    Raise ValueError if the file is not a list of variants.
+    """
+    with open(filename) as file:
+        data = json.load(file)
+
+    if not isinstance(data, list) or not all(isinstance(options, dict) for options in data):
+        raise ValueError(f'{filename} is not a list of map variants')
+
+    try:
+        return [VariantSpec(**options) for options in data]
+    except TypeError as error:
+        raise ValueError(f'{filename} contains an invalid map variant: {error}') from error
+
+
+async def build_map_async(output_filename: str = 'map.html', filenames: Optional[dict] = None,
+                          profiler: Optional[instrumentation.Profiler] = None,
+                          cache: Optional[graph_cache.GraphCache] = None,
+                          graph_directory: Optional[str] = 'graphs',
+                          time_slider: bool = False,
+                          checkpoint_directory: Optional[str] = None,
+                          snapshot_directory: Optional[str] = None,
+                          geometry_directory: Optional[str] = None,
+                          metric: str = vaccine_classes.DEFAULT_METRIC,
+                          clustered_markers: bool = False, derived: bool = True) -> None:
+    """Build the map of metric from the datasets in filenames and save it to output_filename.
+
+    This is a batch build of a single VariantSpec with the whole world, both tile sets and
+    every layer. See build_variants_async for the other arguments.
+
+    Preconditions:
+        - output_filename != ''
+        - metric in vaccine_classes.METRICS
+    """
+    variant = VariantSpec(output_filename, time_slider=time_slider,
+                          clustered_markers=clustered_markers, derived=derived)
+
+    await build_variants_async([variant], filenames, profiler, cache, graph_directory,
+                               checkpoint_directory, snapshot_directory, geometry_directory,
+                               metric)
+
+
+async def build_variants_async(variants: [VariantSpec], filenames: Optional[dict] = None,
+                               profiler: Optional[instrumentation.Profiler] = None,
+                               cache: Optional[graph_cache.GraphCache] = None,
+                               graph_directory: Optional[str] = 'graphs',
+                               checkpoint_directory: Optional[str] = None,
+                               snapshot_directory: Optional[str] = None,
+                               geometry_directory: Optional[str] = None,
+                               metric: str = vaccine_classes.DEFAULT_METRIC,
+                               parallel: bool = False) -> None:
+    """Build a map of metric from the datasets in filenames for each variant and save it to the
+    output file of the variant.
+
+    The datasets are loaded, the borders prepared and the graph of each location rendered only
+    once, and every map is then assembled from those shared results. If parallel is True, the
+    maps are assembled at the same time instead of one after another.
+
+    filenames maps the names in process_vaccine_data.DATASET_FILENAMES to the filenames of the
+    datasets, and is DATASET_FILENAMES if it is None. The graphs are saved in graph_directory,
+    relative to the directory of the output file of each variant, or embedded in the maps if it
+    is None. The graphs in those directories that none of the maps link to are removed. Each
+    stage is measured by profiler, if it is given.
+
+    The continent layers are only added if metric is in COUNT_METRICS, since rates per hundred
+    or per million people cannot be added up across countries. The weekly averages and growth
+    are only derived if metric is in CUMULATIVE_METRICS.
+
+    Raise ValueError if a variant is zoomed to a continent that is not in the datasets.
+
+    Preconditions:
+        - variants != []
+        - len({variant.output_filename for variant in variants}) == len(variants)
+        - metric in vaccine_classes.METRICS
+    """
+    if filenames is None:
+        filenames = process_vaccine_data.DATASET_FILENAMES
+    if profiler is None:
+        profiler = instrumentation.Profiler()
+
+    metrics = vaccine_classes.get_load_metrics(metric)
+    has_continents = metric in vaccine_classes.COUNT_METRICS
+
+    # The borders are read and simplified while the datasets are parsed, and the choropleths
+    # select the features they need from them
+    pending_borders = asyncio.gather(
+        run_stage(profiler, geometry.prepare_geojson, filenames['country_json'], 'ISO_A3',
+                  cache_directory=geometry_directory),
+        run_stage(profiler, geometry.prepare_geojson, filenames['continent_json'], 'continent',
+                  cache_directory=geometry_directory))
+
+    try:
+        with profiler.span('load datasets') as span:
+            dataset = await run_stage(
+                profiler, process_vaccine_data.load_dataset, filenames['vaccine'],
+                filenames['coordinate'], filenames['continent'], checkpoint_directory,
+                snapshot_directory, metrics)
+            span.add_count('rows',
+                           sum(len(country.vaccine_data) for country in dataset.countries))
+            span.add_count('countries', len(dataset.countries))
+    except BaseException:
+        # The borders are cancelled and awaited, so no task is left running after a failure
+        pending_borders.cancel()
+        await asyncio.gather(pending_borders, return_exceptions=True)
+        raise
+
+    with profiler.span('prepare borders'):
+        country_borders, continent_borders = await pending_borders
+    borders = {'country_json': country_borders, 'continent_json': continent_borders}
+
+    continent_names = {continent.name for continent in dataset.continents}
+    for variant in variants:
+        if variant.continent is not None and variant.continent not in continent_names:
+            raise ValueError(f'unknown continent: {variant.continent!r}')
+
+    # The graphs are rendered once for all the variants, and saved once in each directory that
+    # the maps are saved in
+    images = {}
+    graph_locations = {'countries': dataset.countries,
+                       'continents': charts.get_graph_continents(dataset)}
+    kinds = [kind for kind in graph_locations
+             if any(getattr(variant, kind) for variant in variants)
+             and (kind == 'countries' or has_continents)]
+
+    for kind in kinds:
+        with profiler.span(f'{kind} graphs') as span:
+            misses = 0 if cache is None else cache.misses
+            images[kind] = await run_stage(profiler, charts.render_graphs,
+                                           graph_locations[kind], None, cache, metric)
+            if cache is not None:
+                span.add_count('charts rendered', cache.misses - misses)
+
+    graph_urls = {}
+    for directory in {os.path.dirname(variant.output_filename) for variant in variants}:
+        graph_urls[directory] = {}
+        for kind in kinds:
+            urls = await run_stage(profiler, visualize_vaccinations.create_graph_urls,
+                                   images[kind], graph_directory, directory)
+            graph_urls[directory][kind] = dict(
+                zip((location.name for location in graph_locations[kind]), urls))
+
+        # The graphs of earlier builds that none of the maps link to are removed, so the
+        # directory does not keep growing as the data changes
+        if graph_directory is not None:
+            with profiler.span('prune graphs') as span:
+                linked = {url.rpartition('/')[2] for kind in kinds
+                             for url in graph_urls[directory][kind].values()}
+                span.add_count('graphs removed', await run_stage(
+                    profiler, charts.prune_graphs, os.path.join(directory, graph_directory),
+                    linked))
+
+    # The metrics are derived from the indexes of the dataset, so the continents use the series
+    # summed from their countries
+    derived = {}
+    if metric in derived_metrics.CUMULATIVE_METRICS \
+            and any(variant.derived for variant in variants):
+        with profiler.span('derived metrics') as span:
+            derived['countries'] = await run_stage(
+                profiler, derived_metrics.compute_derived_metrics,
+                dataset.get_country_index(metric))
+            if 'continents' in kinds:
+                derived['continents'] = await run_stage(
+                    profiler, derived_metrics.compute_derived_metrics,
+                    dataset.get_continent_index(metric))
+            span.add_count('days', derived['countries'].daily.shape[1])
+
+    if parallel:
+        await asyncio.gather(*(assemble_map_async(
+            variant, dataset, filenames, graph_urls[os.path.dirname(variant.output_filename)],
+            derived, profiler, geometry_directory, metric, len(variants) > 1, borders)
+            for variant in variants))
+    else:
+        for variant in variants:
+            await assemble_map_async(
+                variant, dataset, filenames, graph_urls[os.path.dirname(variant.output_filename)],
+                derived, profiler, geometry_directory, metric, len(variants) > 1, borders)
+
+
+async def assemble_map_async(variant: VariantSpec, dataset: vaccine_classes.VaccineDataset,
+                             filenames: dict, graph_urls: {str: {str: str}},
+                             derived: {str: derived_metrics.DerivedMetrics},
+                             profiler: instrumentation.Profiler,
+                             geometry_directory: Optional[str], metric: str,
+                             name_spans: bool = False,
+                             borders: Optional[dict] = None) -> None:
+    """Assemble the map of variant from dataset and save it to its output file.
+
+    graph_urls maps countries and continents to dictionaries of the names of those locations
+    mapped to the urls of their graphs, and only contains continents if metric is in
+    COUNT_METRICS. derived maps countries and continents to the metrics derived from their
+    series, if they were derived. If name_spans is True, the name of each span starts with the
+    output file, so the spans of different variants can be told apart. borders maps the keys of
+    the GeoJSON files in filenames to the borders already prepared from them, if they were.
+
+    Preconditions:
+        - metric in vaccine_classes.METRICS
+    """
+    prefix = f'{variant.output_filename}: ' if name_spans else ''
+    if borders is None:
+        borders = {}
+    has_continents = variant.continents and 'continents' in graph_urls
+    if not variant.derived:
+        derived = {}
+
+    if variant.continent is None:
+        folium_map = folium.Map(location=[0, 0], zoom_start=2, tiles=variant.tiles[0])
+    else:
+        continent = next(continent for continent in dataset.continents
+                         if continent.name == variant.continent)
+        folium_map = folium.Map(location=continent.coordinates, zoom_start=CONTINENT_ZOOM,
+                                tiles=variant.tiles[0])
+    for tiles in variant.tiles[1:]:
+        folium.TileLayer(tiles).add_to(folium_map)
+
+    # Each layer is written to the map file as soon as it is finished, so only one layer at a
+    # time is held in memory as HTML
+    with open_atomic(variant.output_filename) as file:
+        writer = map_writer.MapWriter(folium_map, file)
+
+        if variant.countries:
+            with profiler.span(prefix + 'country choropleth'):
+                await run_stage(profiler, visualize_vaccinations.add_country_data, dataset,
+                                filenames['country_json'], folium_map, geometry_directory,
+                                metric=metric, borders=borders.get('country_json'))
+                await run_stage(profiler, writer.flush)
+
+        if has_continents:
+            with profiler.span(prefix + 'continent choropleth'):
+                await run_stage(profiler, visualize_vaccinations.add_continent_data, dataset,
+                                filenames['continent_json'], folium_map, geometry_directory,
+                                metric=metric, borders=borders.get('continent_json'))
+                await run_stage(profiler, writer.flush)
+
+        if variant.countries and 'countries' in derived:
+            with profiler.span(prefix + 'country weekly average'):
+                await run_stage(profiler, visualize_vaccinations.add_country_derived_data,
+                                dataset, filenames['country_json'], folium_map,
+                                derived['countries'], geometry_directory, metric=metric,
+                                borders=borders.get('country_json'))
+                await run_stage(profiler, writer.flush)
+
+        if variant.time_slider:
+            with profiler.span(prefix + 'country time slider'):
+                await run_stage(profiler, visualize_vaccinations.add_country_time_slider,
+                                dataset, filenames['country_json'], folium_map,
+                                geometry_directory=geometry_directory, metric=metric,
+                                borders=borders.get('country_json'))
+                await run_stage(profiler, writer.flush)
+
+        if variant.countries:
+            with profiler.span(prefix + 'country markers'):
+                await run_stage(profiler, visualize_vaccinations.add_graph_markers_country,
+                                dataset, folium_map,
+                                graph_url=lambda country: graph_urls['countries'][country.name],
+                                metric=metric, clustered=variant.clustered_markers,
+                                derived=derived.get('countries'))
+                await run_stage(profiler, writer.flush)
+
+        if has_continents:
+            with profiler.span(prefix + 'continent markers'):
+                await run_stage(
+                    profiler, visualize_vaccinations.add_graph_markers_continent, dataset,
+                    folium_map,
+                    graph_url=lambda continent: graph_urls['continents'][continent.name],
+                    metric=metric, clustered=variant.clustered_markers,
+                    derived=derived.get('continents'))
+                await run_stage(profiler, writer.flush)
+
+        with profiler.span(prefix + 'save map') as span:
+            folium.LayerControl().add_to(folium_map)
+            await run_stage(profiler, writer.close)
+            span.add_count('characters written', writer.size)
+
+
+async def run_stage(profiler: instrumentation.Profiler, function: Callable, *args,
+                    **kwargs) -> Any:
+    """Return the result of calling function with args and kwargs in a separate thread, so the
+    event loop can run other builds in the meantime.
+
+    If profiler is profiling function calls, function is called in this thread instead, since
+    cProfile only profiles the thread it was started in.
+    """
+    if profiler.function_profile is not None:
+        return function(*args, **kwargs)
+
+    return await asyncio.to_thread(function, *args, **kwargs)
+
+
+@contextlib.contextmanager
+def open_atomic(filename: str) -> Iterator[TextIO]:
+    """Return a context manager that opens a temporary file in the same directory as filename
+    for writing text. The temporary file replaces the file called filename when the context
+    exits, or is removed if an error is raised.
+
+    The file is therefore never partially written, and two builds writing it at the same time
+    cannot mix their contents.
+
+    >>> filename = os.path.join(tempfile.mkdtemp(), 'map.html')
+    >>> with open_atomic(filename) as file:
+    ...     _ = file.write('<html></html>')
+    >>> with open(filename) as file:
+    ...     file.read()
+    '<html></html>'
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    file_descriptor, temporary_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+
+    try:
+        with os.fdopen(file_descriptor, 'w', encoding='UTF-8') as file:
+            yield file
+        # Temporary files are only readable by their owner, but the map is meant to be shared
+        os.chmod(temporary_path, 0o644)
+        os.replace(temporary_path, filename)
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+
+
+if __name__ == '__main__':
+    # You can uncomment the following lines for code checking/debugging purposes.
+    # However, we recommend commenting out these lines when working with the large
+    # datasets, as checking representation invariants and preconditions greatly
+    # increases the running time of the functions/methods.
+    # import python_ta.contracts
+    # python_ta.contracts.check_all_contracts()
+
+    import doctest
+    doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'extra-imports': ['typing', 'asyncio', 'contextlib', 'json', 'os', 'tempfile', 'folium',
+                          'charts', 'derived_metrics', 'geometry', 'graph_cache',
+                          'instrumentation', 'map_writer', 'process_vaccine_data',
+                          'vaccine_classes', 'visualize_vaccinations'],
+        # the names (strs) of imported modules
+        'allowed-io': ['open_atomic', 'read_variants'],
+        # the names (strs) of functions that call print/open/input
+        'max-line-length': 100,
+        'disable': ['E1136']
+    })
@@ -0,0 +1,214 @@
+"""CSC111 Final Project: Visualizing COVID-19 Vaccinations In the World
+Module Description
+===============================
+This module contains the functions that render the graph of each location as an image.
+
+The graphs are drawn with plotly and converted to images by kaleido. This module does not
+import folium, and plotly is only imported when a graph is actually rendered, so the stages
+that only read or aggregate the datasets start quickly.
+
+Copyright and Usage Information
+===============================
+
+This file is Copyright (c) 2021 Zachary Lee.
+"""
+from typing import Optional
+import concurrent.futures
+import hashlib
+import os
+import tempfile
+import numpy as np
+import graph_cache
+import vaccine_classes
+
+GRAPH_FORMAT = 'jpg'
+GRAPH_WIDTH = 500
+GRAPH_HEIGHT = 410
+
+# The label of each metric, the number its values are divided by on the map, and the unit of the
+# divided values, or None if they are not divided
+METRIC_DISPLAY = {
+    'total_vaccinations': ('Total Vaccinations', 1000000, 'In Millions'),
+    'people_vaccinated': ('People Vaccinated', 1000000, 'In Millions'),
+    'people_fully_vaccinated': ('People Fully Vaccinated', 1000000, 'In Millions'),
+    'daily_vaccinations_raw': ('Raw Daily Vaccinations', 1000, 'In Thousands'),
+    'daily_vaccinations': ('Daily Vaccinations', 1000, 'In Thousands'),
+    'total_vaccinations_per_hundred': ('Total Vaccinations Per Hundred People', 1, None),
+    'people_vaccinated_per_hundred': ('People Vaccinated Per Hundred People', 1, None),
+    'people_fully_vaccinated_per_hundred': ('People Fully Vaccinated Per Hundred People', 1,
+                                            None),
+    'daily_vaccinations_per_million': ('Daily Vaccinations Per Million People', 1, None)
+}
+
+
+def get_graph_continents(dataset: vaccine_classes.VaccineDataset) \
+        -> [vaccine_classes.Location]:
+    """Return the continents of dataset that have vaccine data, which are the continents that
+    get a marker and a graph.
+    """
+    return [continent for continent in dataset.continents
+            if continent.summary.latest_date is not None]
+
+
+def render_graphs(locations: [vaccine_classes.Location], processes: Optional[int] = None,
+                  cache: Optional[graph_cache.GraphCache] = None,
+                  metric: Optional[str] = None) -> [bytes]:
+    """Return the jpg image of the graph of metric, or of the vaccine data if metric is None,
+    for each location, in the same order as locations.
+
+    The images are rendered in memory by a pool of up to processes worker processes, so nothing
+    is written to disk and concurrent builds cannot overwrite each other's graphs. If processes
+    is 1, the images are rendered in this process instead. If a cache is given, images are read
+    from it when possible and the newly rendered images are added to it.
+
+    Preconditions:
+        - processes is None or processes >= 1
+    """
+    series_list = [location.vaccine_data if metric is None else location.get_series(metric)
+                   for location in locations]
+    graph_data = [(location.name, series.dates, series.values, series.metric)
+                  for location, series in zip(locations, series_list)]
+    images = [None] * len(graph_data)
+
+    if cache is not None:
+        keys = [create_graph_key(data) for data in graph_data]
+        for i in range(len(keys)):
+            images[i] = cache.get(keys[i])
+
+    missing = [i for i in range(len(images)) if images[i] is None]
+    missing_data = [graph_data[i] for i in missing]
+
+    if processes == 1 or len(missing_data) <= 1:
+        rendered = [render_graph(data) for data in missing_data]
+    else:
+        workers = processes or os.cpu_count() or 1
+        # Larger chunks let each worker reuse its kaleido process for several graphs
+        chunksize = max(1, len(missing_data) // (workers * 4))
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            rendered = list(executor.map(render_graph, missing_data, chunksize=chunksize))
+
+    for i, image in zip(missing, rendered):
+        images[i] = image
+        if cache is not None:
+            cache.put(keys[i], image)
+
+    return images
+
+
+def create_graph_key(graph_data: (str, np.ndarray, np.ndarray, str)) -> str:
+    """Return the cache key of the graph rendered from graph_data, which depends on the series
+    of the location and on every setting used to render the graph.
+    """
+    name, dates, values, metric = graph_data
+    settings = f'{create_graph_title(name, metric)}|{GRAPH_FORMAT}|{GRAPH_WIDTH}|{GRAPH_HEIGHT}'
+
+    return graph_cache.create_key(dates.tobytes() + values.tobytes(), settings)
+
+
+def create_graph_title(name: str, metric: str = vaccine_classes.DEFAULT_METRIC) -> str:
+    """Return the title of the graph of metric for the location called name.
+
+    >>> create_graph_title('Canada')
+    'Total Vaccinations in Canada Over Time'
+    """
+    return f'{METRIC_DISPLAY[metric][0]} in {name} Over Time'
+
+
+def render_graph(graph_data: (str, np.ndarray, np.ndarray, str)) -> bytes:
+    """Return the jpg image of a metric over time, where graph_data is a tuple containing the
+    name of the location, its dates, its values and the name of the metric.
+    """
+    # plotly is only imported when a graph is rendered, since importing it takes longer than
+    # most of the other stages and many runs never render a graph
+    import plotly.graph_objects as go
+
+    name, dates, values, metric = graph_data
+
+    # The series is already sorted by date, so its columns can be plotted directly
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=dates, y=values))
+    fig.update_xaxes(title_text='Date')
+    fig.update_yaxes(title_text=METRIC_DISPLAY[metric][0])
+    title = create_graph_title(name, metric)
+    fig.update_layout(title_text=title)
+
+    return fig.to_image(format=GRAPH_FORMAT, width=GRAPH_WIDTH, height=GRAPH_HEIGHT)
+
+
+def save_graphs(images: [bytes], directory: str) -> [str]:
+    """Save each image in directory and return the name of the file of each image.
+
+    Each file is named after the hash of its image, so an image that is already saved from an
+    earlier build is not written again and browsers never show an outdated graph.
+    """
+    os.makedirs(directory, exist_ok=True)
+    filenames = []
+
+    for image in images:
+        filename = f'{hashlib.sha256(image).hexdigest()}.{GRAPH_FORMAT}'
+        path = os.path.join(directory, filename)
+
+        if not os.path.exists(path):
+            file_descriptor, temporary_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(file_descriptor, 'wb') as file:
+                file.write(image)
+            # Temporary files are only readable by their owner, but the graphs are published
+            # with the map
+            os.chmod(temporary_path, 0o644)
+            os.replace(temporary_path, path)
+
+        filenames.append(filename)
+
+    return filenames
+
+
+def prune_graphs(directory: str, filenames: set[str]) -> int:
+    """Remove every graph in directory whose file is not in filenames, and return the number of
+    graphs removed.
+
+    A graph whose data changed is saved under a new name instead of replacing the old file, so
+    the old files are removed here once no map links to them.
+
+    >>> directory = tempfile.mkdtemp()
+    >>> filenames = save_graphs([b'old', b'new'], directory)
+    >>> prune_graphs(directory, {filenames[1]})
+    1
+    >>> os.listdir(directory) == [filenames[1]]
+    True
+    """
+    removed = 0
+
+    for entry in os.scandir(directory):
+        if entry.is_file() and entry.name.endswith(f'.{GRAPH_FORMAT}') \
+                and entry.name not in filenames:
+            try:
+                os.remove(entry.path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+
+    return removed
+
+
+if __name__ == '__main__':
+    # You can uncomment the following lines for code checking/debugging purposes.
+    # However, we recommend commenting out these lines when working with the large
+    # datasets, as checking representation invariants and preconditions greatly
+    # increases the running time of the functions/methods.
+    # import python_ta.contracts
+    # python_ta.contracts.check_all_contracts()
+
+    import doctest
+    doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'extra-imports': ['typing', 'concurrent.futures', 'hashlib', 'os', 'tempfile', 'numpy',
+                          'graph_cache', 'vaccine_classes', 'plotly.graph_objects'],
+        # the names (strs) of imported modules
+        'allowed-io': ['save_graphs'],
+        # the names (strs) of functions that call print/open/input
+        'max-line-length': 100,
+        'disable': ['E1136']
+    })
@@ -0,0 +1,275 @@
+"""CSC111 Final Project: Visualizing COVID-19 Vaccinations In the World
+Module Description
+===============================
+This module contains the metrics derived from the cumulative series of every location: the
+change on each day, the average daily change over the last week and the growth of the weekly
+change compared to the week before.
+
+The series in a SeriesIndex are expanded into a matrix with a row for each location and a column
+for each day, and every metric is computed from that matrix with array operations, so all the
+locations are handled at once. The change over a window of days is the difference between the
+totals at its ends, so the average over the last week only depends on the totals a week apart
+and never has to sum the days in between.
+
+When the index is built again with new data, only the days from the first day whose totals
+changed are computed again.
+
+Copyright and Usage Information
+===============================
+
+This file is Copyright (c) 2021 Zachary Lee.
+"""
+from typing import Optional
+import datetime
+import numpy as np
+import vaccine_classes
+
+# The metrics that are cumulative totals, which are the only ones the metrics can be derived from
+CUMULATIVE_METRICS = ['total_vaccinations', 'people_vaccinated', 'people_fully_vaccinated',
+                      'total_vaccinations_per_hundred', 'people_vaccinated_per_hundred',
+                      'people_fully_vaccinated_per_hundred']
+
+# The names of the derived metrics
+DERIVED_METRICS = ['daily', 'rolling_average', 'weekly_growth']
+
+# The number of days averaged by the rolling average and compared by the weekly growth
+WINDOW = 7
+
+
+class DerivedMetrics:
+    """ The metrics derived from the series of every location in a SeriesIndex.
+
+    Each metric is a matrix with a row for each location, in the same order as the locations of
+    the index, and a column for each day from the first day with data in the index to the
+    latest. An entry is NaN if it is not defined, such as before the first date of its location
+    or when there is no earlier week to compare to.
+    Instance Attributes:
+        - index: The index the metrics are derived from.
+        - window: The number of days in a week of the rolling average and the weekly growth.
+        - start: The first day of the columns, in days since 1970-01-01.
+        - daily: The change of the total of each location on each day.
+        - rolling_average: The average daily change over the window ending on each day.
+        - weekly_growth: The change over the window ending on each day, divided by the change
+          over the window before it, minus 1. It is NaN when the earlier change is not positive.
+        - first_days: The first day with data of each location, in days since 1970-01-01.
+        - latest_days: The latest day with data of each location, in days since 1970-01-01.
+
+    Representation Invariants:
+        - self.window >= 1
+        - self.daily.shape == self.rolling_average.shape == self.weekly_growth.shape
+        - self.daily.shape[0] == len(self.index.locations)
+    >>> canada = vaccine_classes.Location('Canada', [56, -106], \
+    {datetime.date(2021, 1, day): day * 10 for day in range(1, 16)}, identifier='CAN')
+    >>> derived = compute_derived_metrics(vaccine_classes.SeriesIndex([canada]), window=2)
+    >>> derived.daily[0, :4].tolist()
+    [nan, 10.0, 10.0, 10.0]
+    >>> derived.get_latest('rolling_average').tolist()
+    [10.0]
+    """
+    index: vaccine_classes.SeriesIndex
+    window: int
+    start: int
+    daily: np.ndarray
+    rolling_average: np.ndarray
+    weekly_growth: np.ndarray
+    first_days: np.ndarray
+    latest_days: np.ndarray
+
+    def __init__(self, index: vaccine_classes.SeriesIndex, window: int, start: int,
+                 columns: (np.ndarray, np.ndarray, np.ndarray)) -> None:
+        """Initialize new derived metrics of index, where columns contains the daily change,
+        rolling average and weekly growth matrices, whose first column is the day start.
+        """
+        self.index = index
+        self.window = window
+        self.start = start
+        self.daily, self.rolling_average, self.weekly_growth = columns
+        self.first_days, self.latest_days = get_day_range(index)
+
+    def get_latest(self, metric: str) -> np.ndarray:
+        """Return the value of metric on the latest day with data of each location, or NaN for
+        a location without data.
+
+        Preconditions:
+            - metric in DERIVED_METRICS
+        """
+        matrix = getattr(self, metric)
+        has_data = self.latest_days >= self.first_days
+        values = np.full(len(self.latest_days), np.nan)
+        values[has_data] = matrix[has_data, self.latest_days[has_data] - self.start]
+
+        return values
+
+    def get_at(self, metric: str, date: datetime.date) -> np.ndarray:
+        """Return the value of metric of each location on date. The values are NaN if date is
+        before the first day with data, and the values on the latest day with data are used if
+        date is after it.
+
+        Preconditions:
+            - metric in DERIVED_METRICS
+        """
+        matrix = getattr(self, metric)
+        column = np.datetime64(date, 'D').astype(np.int64) - self.start
+        if column < 0 or matrix.shape[1] == 0:
+            return np.full(matrix.shape[0], np.nan)
+
+        return matrix[:, min(column, matrix.shape[1] - 1)].copy()
+
+    def update(self, index: vaccine_classes.SeriesIndex) -> 'DerivedMetrics':
+        """Return the derived metrics of index, which is an index of the same locations and
+        metric as self.index built again from newer data.
+
+        Only the days from the first day whose totals changed are computed, and the earlier
+        columns are copied from self. Everything is computed again if the locations or the
+        metric are different, or if a total changed before the first day of self.
+        """
+        if index.metric != self.index.metric or [location.name for location in index.locations] \
+                != [location.name for location in self.index.locations]:
+            return compute_derived_metrics(index, self.window)
+
+        end = self.start + self.daily.shape[1] - 1
+        change = find_first_change(self.index, index)
+        if change is None:
+            return DerivedMetrics(index, self.window, self.start,
+                                  (self.daily, self.rolling_average, self.weekly_growth))
+        if change < self.start:
+            return compute_derived_metrics(index, self.window)
+
+        # The columns after the last day of self are new, even if no total changed on them
+        change = min(change, end + 1)
+        first_days, latest_days = get_day_range(index)
+        has_data = latest_days >= first_days
+        new_end = max(end, int(latest_days[has_data].max(initial=end)))
+        columns = compute_columns(index, change, new_end, first_days, self.window)
+
+        kept = change - self.start
+        return DerivedMetrics(index, self.window, self.start,
+                              tuple(np.concatenate([old[:, :kept], new], axis=1)
+                                    for old, new in zip((self.daily, self.rolling_average,
+                                                         self.weekly_growth), columns)))
+
+
+def compute_derived_metrics(index: vaccine_classes.SeriesIndex, window: int = WINDOW) \
+        -> DerivedMetrics:
+    """Return the metrics derived from every series in index, over weeks of window days.
+
+    Preconditions:
+        - window >= 1
+        - index.metric is None or index.metric in CUMULATIVE_METRICS
+    """
+    first_days, latest_days = get_day_range(index)
+    has_data = latest_days >= first_days
+    if not has_data.any():
+        empty = np.empty((len(index.locations), 0))
+        return DerivedMetrics(index, window, 0, (empty, empty, empty))
+
+    start = int(first_days[has_data].min())
+    end = int(latest_days[has_data].max())
+
+    return DerivedMetrics(index, window, start,
+                          compute_columns(index, start, end, first_days, window))
+
+
+def compute_columns(index: vaccine_classes.SeriesIndex, start: int, end: int,
+                    first_days: np.ndarray, window: int) -> (np.ndarray, np.ndarray, np.ndarray):
+    """Return the daily change, rolling average and weekly growth matrices of the series in
+    index, with a column for each day from start to end, including both.
+
+    The totals are read from two windows before start, since the weekly growth on a day depends
+    on the totals up to two windows earlier.
+
+    >>> canada = vaccine_classes.Location('Canada', [56, -106], \
+    {datetime.date(2021, 1, 1): 10, datetime.date(2021, 1, 2): 30, \
+    datetime.date(2021, 1, 3): 40, datetime.date(2021, 1, 4): 80}, identifier='CAN')
+    >>> index = vaccine_classes.SeriesIndex([canada])
+    >>> first_days, _ = get_day_range(index)
+    >>> start = int(first_days[0])
+    >>> [matrix.tolist() for matrix in compute_columns(index, start, start + 3, first_days, 1)]
+    [[[nan, 20.0, 10.0, 40.0]], [[nan, 20.0, 10.0, 40.0]], [[nan, nan, -0.5, 3.0]]]
+    """
+    days = np.arange(start - 2 * window, end + 1, dtype=np.int64)
+    totals = index.get_totals_on(days.astype('datetime64[D]')).astype(np.float64)
+    totals[days[np.newaxis, :] < first_days[:, np.newaxis]] = np.nan
+
+    daily = np.full(totals.shape, np.nan)
+    daily[:, 1:] = totals[:, 1:] - totals[:, :-1]
+    weekly = np.full(totals.shape, np.nan)
+    weekly[:, window:] = totals[:, window:] - totals[:, :-window]
+
+    growth = np.full(totals.shape, np.nan)
+    previous = weekly[:, :-window]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        growth[:, window:] = np.where(previous > 0, weekly[:, window:] / previous - 1, np.nan)
+
+    return daily[:, 2 * window:], weekly[:, 2 * window:] / window, growth[:, 2 * window:]
+
+
+def get_day_range(index: vaccine_classes.SeriesIndex) -> (np.ndarray, np.ndarray):
+    """Return the first and latest day with data of each location in index, in days since
+    1970-01-01. The first day of a location without data is after its latest day.
+    """
+    has_entries = index.offsets[1:] > index.offsets[:-1]
+    _, days = vaccine_classes.split_index_keys(index.keys)
+
+    first_days = np.full(len(index.locations), np.iinfo(np.int64).max)
+    latest_days = np.full(len(index.locations), np.iinfo(np.int64).min)
+    first_days[has_entries] = days[index.offsets[:-1][has_entries]]
+    latest_days[has_entries] = days[index.offsets[1:][has_entries] - 1]
+
+    return first_days, latest_days
+
+
+def find_first_change(old: vaccine_classes.SeriesIndex, new: vaccine_classes.SeriesIndex) \
+        -> Optional[int]:
+    """Return the first day, in days since 1970-01-01, with an entry that was added, removed or
+    changed between the old and new index of the same locations, or None if every entry is the
+    same.
+
+    >>> canada = vaccine_classes.Location('Canada', [56, -106], \
+    {datetime.date(2021, 1, 1): 10, datetime.date(2021, 1, 3): 30}, identifier='CAN')
+    >>> updated = vaccine_classes.Location('Canada', [56, -106], \
+    {datetime.date(2021, 1, 1): 10, datetime.date(2021, 1, 2): 20, \
+    datetime.date(2021, 1, 3): 30}, identifier='CAN')
+    >>> day = find_first_change(vaccine_classes.SeriesIndex([canada]), \
+    vaccine_classes.SeriesIndex([updated]))
+    >>> np.datetime64(day, 'D').item()
+    datetime.date(2021, 1, 2)
+    """
+    changed_days = []
+
+    for first, second in ((old, new), (new, old)):
+        positions = np.minimum(np.searchsorted(second.keys, first.keys),
+                               max(len(second.keys) - 1, 0))
+        if len(second.keys) == 0:
+            matched = np.zeros(len(first.keys), dtype=bool)
+        else:
+            matched = (second.keys[positions] == first.keys) \
+                & (second.values[positions] == first.values)
+        changed_days.append(vaccine_classes.split_index_keys(first.keys[~matched])[1])
+
+    days = np.concatenate(changed_days)
+    if len(days) == 0:
+        return None
+
+    return int(days.min())
+
+
+if __name__ == '__main__':
+    # You can uncomment the following lines for code checking/debugging purposes.
+    # However, we recommend commenting out these lines when working with the large
+    # datasets, as checking representation invariants and preconditions greatly
+    # increases the running time of the functions/methods.
+    # import python_ta.contracts
+    # python_ta.contracts.check_all_contracts()
+
+    import doctest
+    doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'extra-imports': ['typing', 'datetime', 'numpy', 'vaccine_classes'],
+        # the names (strs) of imported modules
+        'allowed-io': [],  # the names (strs) of functions that call print/open/input
+        'max-line-length': 100,
+        'disable': ['E1136']
+    })
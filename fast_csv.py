@@ -0,0 +1,238 @@
+"""CSC111 Final Project: Visualizing COVID-19 Vaccinations In the World
+Module Description
+===============================
+This module contains functions that parse selected columns of a CSV file directly from its bytes.
+
+A file is read in large chunks of complete lines. Each chunk is stored in a uint8 array, and the
+positions of its lines and fields are found with array operations, so only the selected columns
+are ever parsed. Dates and numbers are converted straight from the bytes without creating a
+string for each field. Lines with a quoted field before the last selected column are parsed with
+the csv module instead.
+
+Copyright and Usage Information
+===============================
+
+This file is Copyright (c) 2021 Zachary Lee.
+"""
+from typing import BinaryIO, Iterator
+import csv
+import numpy as np
+
+# The number of bytes read from the file at a time
+CHUNK_SIZE = 16 * 1024 * 1024
+
+COMMA = ord(',')
+QUOTE = ord('"')
+NEWLINE = ord('\n')
+CARRIAGE_RETURN = ord('\r')
+ZERO = ord('0')
+DASH = ord('-')
+
+
+def iter_chunks(file: BinaryIO, chunk_size: int = CHUNK_SIZE,
+                complete_lines_only: bool = False) -> Iterator[np.ndarray]:
+    """Yield the rest of file as uint8 arrays that each end at the end of a line.
+
+    If complete_lines_only is True, a last line that does not end with a newline is not yielded,
+    in case it is still being written.
+
+    >>> import io
+    >>> [chunk.tobytes() for chunk in iter_chunks(io.BytesIO(b'a,b\\nc,d\\ne'), chunk_size=5)]
+    [b'a,b\\n', b'c,d\\n', b'e']
+    >>> [chunk.tobytes() for chunk in iter_chunks(io.BytesIO(b'a,b\\nc'), \
+    complete_lines_only=True)]
+    [b'a,b\\n']
+    """
+    remainder = b''
+
+    while True:
+        data = file.read(chunk_size)
+        if data == b'':
+            break
+
+        data = remainder + data
+        end = data.rfind(b'\n') + 1
+        remainder = data[end:]
+        if end > 0:
+            yield np.frombuffer(data, dtype=np.uint8, count=end)
+
+    if remainder != b'' and not complete_lines_only:
+        yield np.frombuffer(remainder, dtype=np.uint8)
+
+
+def find_lines(buffer: np.ndarray) -> (np.ndarray, np.ndarray):
+    """Return the start and end positions of each non-empty line in buffer. The end positions
+    exclude the line endings.
+
+    >>> buffer = np.frombuffer(b'ab\\r\\n\\ncd', dtype=np.uint8)
+    >>> [array.tolist() for array in find_lines(buffer)]
+    [[0, 5], [2, 7]]
+    """
+    newlines = np.flatnonzero(buffer == NEWLINE)
+    starts = np.concatenate([[0], newlines + 1])
+    ends = np.concatenate([newlines, [len(buffer)]])
+
+    # Removes the carriage returns of Windows line endings
+    has_return = (ends > starts) & (buffer[np.maximum(ends - 1, 0)] == CARRIAGE_RETURN)
+    ends = ends - has_return
+
+    non_empty = ends > starts
+    return starts[non_empty], ends[non_empty]
+
+
+def find_fields(buffer: np.ndarray, starts: np.ndarray, ends: np.ndarray, count: int) \
+        -> (np.ndarray, np.ndarray, np.ndarray):
+    """Return the start and end positions of the first count fields of each line, and whether
+    one of those fields is quoted.
+
+    Fields that are missing from a line are empty and positioned at the end of the line. The
+    positions of the fields of a line with quotes are not reliable, since a quoted field may
+    contain commas.
+
+    >>> buffer = np.frombuffer(b'a,bc,d\\n"e,f",g', dtype=np.uint8)
+    >>> starts, ends = find_lines(buffer)
+    >>> field_starts, field_ends, quoted = find_fields(buffer, starts, ends, 2)
+    >>> field_starts.tolist(), field_ends.tolist(), quoted.tolist()
+    ([[0, 2], [7, 10]], [[1, 4], [9, 12]], [False, True])
+    """
+    # The length of buffer is added as a comma that comes after every line
+    commas = np.append(np.flatnonzero(buffer == COMMA), len(buffer))
+    first_comma = np.searchsorted(commas, starts)
+    field_starts = np.empty((len(starts), count), dtype=np.int64)
+    field_ends = np.empty((len(starts), count), dtype=np.int64)
+    previous_end = starts - 1
+
+    for column in range(count):
+        comma = commas[np.minimum(first_comma + column, len(commas) - 1)]
+
+        field_starts[:, column] = np.minimum(previous_end + 1, ends)
+        field_ends[:, column] = np.where(comma < ends, comma, ends)
+        previous_end = field_ends[:, column]
+
+    # A field that contains quotes has to start with one, so only the first character of each
+    # field is checked
+    quoted = ((buffer.take(field_starts, mode='clip') == QUOTE) & (field_ends > field_starts))
+    quoted = quoted.any(axis=1)
+
+    return field_starts, field_ends, quoted
+
+
+def parse_fields(lines: [bytes], columns: [int]) -> [[str]]:
+    """Return the given columns of each line, parsed with the csv module. Missing fields are
+    empty strings.
+
+    >>> parse_fields([b'"a,b",c,d'], [0, 2])
+    [['a,b', 'd']]
+    """
+    rows = []
+
+    for row in csv.reader(line.decode('UTF-8') for line in lines):
+        rows.append([row[column] if column < len(row) else '' for column in columns])
+
+    return rows
+
+
+def gather(buffer: np.ndarray, starts: np.ndarray, width: int) -> np.ndarray:
+    """Return a matrix containing the width bytes of buffer after each position in starts.
+    Positions past the end of buffer repeat its last byte, so callers must ignore the bytes
+    after the end of each field.
+    """
+    positions = starts[:, np.newaxis] + np.arange(width)
+
+    return buffer.take(positions, mode='clip')
+
+
+def parse_dates(buffer: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Return the ISO dates (YYYY-MM-DD) between starts and ends as a datetime64[D] array. Any
+    characters after the day, such as a time, are ignored.
+
+    >>> buffer = np.frombuffer(b'2021-03-05,2020-12-15', dtype=np.uint8)
+    >>> parse_dates(buffer, np.array([0, 11]), np.array([10, 21])).tolist()
+    [datetime.date(2021, 3, 5), datetime.date(2020, 12, 15)]
+    """
+    characters = gather(buffer, starts, 10)
+    digits = characters.astype(np.int32) - ZERO
+    digit_columns = [0, 1, 2, 3, 5, 6, 8, 9]
+
+    valid = (ends - starts >= 10) & (characters[:, 4] == DASH) & (characters[:, 7] == DASH)
+    valid &= ((digits[:, digit_columns] >= 0) & (digits[:, digit_columns] <= 9)).all(axis=1)
+    if not valid.all():
+        line = np.flatnonzero(~valid)[0]
+        text = buffer[starts[line]:ends[line]].tobytes().decode('UTF-8')
+        raise ValueError(f'invalid date: {text!r}')
+
+    years = digits[:, 0] * 1000 + digits[:, 1] * 100 + digits[:, 2] * 10 + digits[:, 3]
+    months = digits[:, 5] * 10 + digits[:, 6]
+    days = digits[:, 8] * 10 + digits[:, 9]
+
+    dates = (years - 1970).astype('datetime64[Y]').astype('datetime64[M]') + (months - 1)
+    return dates.astype('datetime64[D]') + (days - 1)
+
+
+def parse_integers(buffer: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Return the numbers between starts and ends, truncated to integers, as an int64 array.
+    Empty fields are 0.
+
+    The result is the same as int(float(field)), but the fields are converted by numpy in one
+    call instead of one at a time.
+
+    >>> buffer = np.frombuffer(b'8200.0,,15,1.5e3,-2.7', dtype=np.uint8)
+    >>> parse_integers(buffer, np.array([0, 7, 8, 11, 17]), \
+    np.array([6, 7, 10, 16, 21])).tolist()
+    [8200, 0, 15, 1500, -2]
+    """
+    return parse_floats(buffer, starts, ends).astype(np.int64)
+
+
+def parse_floats(buffer: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Return the numbers between starts and ends as a float64 array. Empty fields are 0.
+
+    >>> buffer = np.frombuffer(b'1.25,,40', dtype=np.uint8)
+    >>> parse_floats(buffer, np.array([0, 5, 6]), np.array([4, 5, 8])).tolist()
+    [1.25, 0.0, 40.0]
+    """
+    fields = extract_strings(buffer, starts, ends)
+    fields[ends == starts] = b'0'
+    numbers = fields.astype(np.float64)
+
+    if not np.isfinite(numbers).all():
+        line = np.flatnonzero(~np.isfinite(numbers))[0]
+        raise ValueError(f'cannot convert {fields[line]!r} to a number')
+
+    return numbers
+
+
+def extract_strings(buffer: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Return the fields between starts and ends as a bytes array.
+
+    >>> buffer = np.frombuffer(b'AFG,OWID_ENG', dtype=np.uint8)
+    >>> extract_strings(buffer, np.array([0, 4]), np.array([3, 12])).tolist()
+    [b'AFG', b'OWID_ENG']
+    """
+    lengths = ends - starts
+    width = max(int(lengths.max(initial=0)), 1)
+    characters = gather(buffer, starts, width)
+    characters[np.arange(width) >= lengths[:, np.newaxis]] = 0
+
+    return np.ascontiguousarray(characters).view(f'S{width}').ravel()
+
+
+if __name__ == '__main__':
+    # You can uncomment the following lines for code checking/debugging purposes.
+    # However, we recommend commenting out these lines when working with the large
+    # datasets, as checking representation invariants and preconditions greatly
+    # increases the running time of the functions/methods.
+    # import python_ta.contracts
+    # python_ta.contracts.check_all_contracts()
+
+    import doctest
+    doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'extra-imports': ['typing', 'csv', 'numpy'],
+        # the names (strs) of imported modules
+        'allowed-io': [],  # the names (strs) of functions that call print/open/input
+        'max-line-length': 100,
+        'disable': ['E1136']
+    })
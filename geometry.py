@@ -0,0 +1,268 @@
+"""CSC111 Final Project: Visualizing COVID-19 Vaccinations In the World
+Module Description
+===============================
+This module contains functions that prepare the GeoJSON files for the choropleth layers before
+they are embedded in the map.
+
+The polygons are simplified with the Douglas-Peucker algorithm to a tolerance that is suitable
+for the zoom levels the map is viewed at, their coordinates are rounded to a fixed grid, and
+the features that are not in the vaccine data are dropped. Since this only depends on the
+source file and the settings, the result can be cached on disk.
+
+Copyright and Usage Information
+===============================
+
+This file is Copyright (c) 2021 Zachary Lee.
+"""
+from typing import Optional
+import hashlib
+import json
+import os
+import tempfile
+import numpy as np
+
+# The default simplification tolerance in degrees, which is below the size of a pixel up to
+# zoom level 6
+DEFAULT_TOLERANCE = 0.01
+
+# The default number of decimal places kept in each coordinate
+DEFAULT_PRECISION = 3
+
+# The simplified features of each file that has been prepared, which are kept for as long as
+# the file does not change
+_simplified_features = {}
+
+
+def prepare_geojson(filename: str, key: str, identifiers: Optional[set] = None,
+                    tolerance: float = DEFAULT_TOLERANCE, precision: int = DEFAULT_PRECISION,
+                    cache_directory: Optional[str] = None) -> dict:
+    """Return the GeoJSON data in the file called filename, with every polygon simplified to
+    tolerance, every coordinate rounded to precision decimal places and, if identifiers is not
+    None, only the features whose key property is in identifiers.
+
+    The simplified features are kept in memory for as long as the file does not change, so
+    preparing the same file again only selects the features. If cache_directory is not None,
+    they are also cached there, under a key made from the hash of the file and the settings.
+
+    Preconditions:
+        - tolerance >= 0
+        - precision >= 0
+    """
+    stat = os.stat(filename)
+    memory_key = (os.path.abspath(filename), stat.st_size, stat.st_mtime_ns, tolerance,
+                  precision)
+
+    features = _simplified_features.get(memory_key)
+    if features is None:
+        features = simplify_features(filename, tolerance, precision, cache_directory)
+        _simplified_features[memory_key] = features
+
+    return select_features({'type': 'FeatureCollection', 'features': features}, key,
+                           identifiers)
+
+
+def select_features(geojson: dict, key: str, identifiers: Optional[set] = None) -> dict:
+    """Return a copy of the GeoJSON data in geojson with only the features whose key property is
+    in identifiers, or with every feature if identifiers is None.
+
+    The features are copied, so that changes made to them by the map do not affect geojson.
+
+    >>> geojson = {'type': 'FeatureCollection', 'features': [{'type': 'Feature', \
+    'properties': {'ISO_A3': 'CAN'}, 'geometry': None}, {'type': 'Feature', \
+    'properties': {'ISO_A3': 'MEX'}, 'geometry': None}]}
+    >>> [feature['properties']['ISO_A3'] \
+    for feature in select_features(geojson, 'ISO_A3', {'MEX'})['features']]
+    ['MEX']
+    """
+    features = geojson['features']
+    if identifiers is not None:
+        features = [feature for feature in features
+                    if feature['properties'].get(key) in identifiers]
+
+    return {'type': 'FeatureCollection',
+            'features': [{'type': 'Feature', 'properties': dict(feature['properties']),
+                          'geometry': feature['geometry']} for feature in features]}
+
+
+def simplify_features(filename: str, tolerance: float, precision: int,
+                      cache_directory: Optional[str]) -> [dict]:
+    """Return the features of the GeoJSON file called filename with their polygons simplified,
+    reading them from cache_directory if they are cached there.
+    """
+    if cache_directory is not None:
+        cache_filename = os.path.join(
+            cache_directory, create_cache_key(filename, tolerance, precision) + '.geojson')
+        try:
+            with open(cache_filename) as file:
+                return json.load(file)['features']
+        except FileNotFoundError:
+            pass
+
+    with open(filename) as file:
+        data = json.load(file)
+
+    features = []
+    for feature in data['features']:
+        geometry = simplify_geometry(feature['geometry'], tolerance, precision)
+        if geometry is not None:
+            features.append({'type': 'Feature', 'properties': feature['properties'],
+                             'geometry': geometry})
+
+    if cache_directory is not None:
+        os.makedirs(cache_directory, exist_ok=True)
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=cache_directory, suffix='.tmp')
+        with os.fdopen(file_descriptor, 'w') as file:
+            json.dump({'type': 'FeatureCollection', 'features': features}, file,
+                      separators=(',', ':'))
+        os.replace(temporary_path, cache_filename)
+
+    return features
+
+
+def create_cache_key(filename: str, tolerance: float, precision: int) -> str:
+    """Return the cache key of the simplified features of the file called filename with the
+    given settings.
+    """
+    digest = hashlib.sha256()
+
+    with open(filename, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(block)
+
+    digest.update(json.dumps([tolerance, precision]).encode('UTF-8'))
+
+    return digest.hexdigest()
+
+
+def simplify_geometry(geometry: dict, tolerance: float, precision: int) -> Optional[dict]:
+    """Return a simplified copy of a Polygon or MultiPolygon geometry, or None if every polygon
+    in it becomes too small to draw. Any other geometry is returned unchanged.
+
+    >>> square = [[0, 0], [1, 0], [1, 0.001], [1, 1], [0, 1], [0, 0]]
+    >>> simplify_geometry({'type': 'Polygon', 'coordinates': [square]}, 0.01, 3)['coordinates']
+    [[[0.0, 0.0], [1.0, 0.0], [1.0, 1.0], [0.0, 1.0], [0.0, 0.0]]]
+    """
+    if geometry['type'] == 'Polygon':
+        polygon = simplify_polygon(geometry['coordinates'], tolerance, precision)
+        return None if polygon is None else {'type': 'Polygon', 'coordinates': polygon}
+    elif geometry['type'] == 'MultiPolygon':
+        polygons = [simplify_polygon(polygon, tolerance, precision)
+                    for polygon in geometry['coordinates']]
+        polygons = [polygon for polygon in polygons if polygon is not None]
+        return None if polygons == [] else {'type': 'MultiPolygon', 'coordinates': polygons}
+    else:
+        return geometry
+
+
+def simplify_polygon(rings: list, tolerance: float, precision: int) -> Optional[list]:
+    """Return the simplified rings of a polygon, where the first ring is its exterior and the
+    others are its holes. Holes that become too small are removed, and None is returned if the
+    exterior does.
+    """
+    simplified = []
+
+    for ring in rings:
+        points = simplify_ring(np.array(ring, dtype=np.float64)[:, :2], tolerance, precision)
+        if points is not None:
+            simplified.append(points.tolist())
+        elif simplified == []:
+            return None
+
+    return simplified
+
+
+def simplify_ring(points: np.ndarray, tolerance: float, precision: int) -> Optional[np.ndarray]:
+    """Return the points of a closed ring after simplifying it and rounding its coordinates, or
+    None if fewer than four points are left, so it no longer encloses an area.
+
+    >>> ring = np.array([[0, 0], [0.5, 0.002], [1, 0], [1, 1], [0, 0]], dtype=float)
+    >>> simplify_ring(ring, 0.01, 3).tolist()
+    [[0.0, 0.0], [1.0, 0.0], [1.0, 1.0], [0.0, 0.0]]
+    """
+    points = np.round(points, precision)
+
+    # Removes the points that became duplicates after rounding
+    keep = np.ones(len(points), dtype=bool)
+    keep[1:] = (points[1:] != points[:-1]).any(axis=1)
+    points = points[keep]
+
+    if len(points) < 4:
+        return None
+
+    points = points[douglas_peucker(points, tolerance)]
+
+    return points if len(points) >= 4 else None
+
+
+def douglas_peucker(points: np.ndarray, tolerance: float) -> np.ndarray:
+    """Return a boolean mask of the points of a line that are kept when it is simplified with
+    the Douglas-Peucker algorithm, which keeps the point farthest from the segment between two
+    kept points whenever it is more than tolerance away from the segment.
+
+    The first and last points are always kept. The segments are processed with a stack instead
+    of recursion, and the distances of the points between each pair are computed at once.
+
+    >>> line = np.array([[0, 0], [1, 0.1], [2, -0.1], [3, 5], [4, 6], [5, 7]], dtype=float)
+    >>> douglas_peucker(line, 0.5).tolist()
+    [True, False, True, True, False, True]
+    """
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+
+    while stack != []:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+
+        between = points[first + 1:last]
+        distances = get_segment_distances(between, points[first], points[last])
+        farthest = int(np.argmax(distances))
+
+        if distances[farthest] > tolerance:
+            middle = first + 1 + farthest
+            keep[middle] = True
+            stack.append((first, middle))
+            stack.append((middle, last))
+
+    return keep
+
+
+def get_segment_distances(points: np.ndarray, start: np.ndarray, end: np.ndarray) -> np.ndarray:
+    """Return the distance from each point to the line through start and end, or to start if
+    start and end are the same point.
+
+    >>> get_segment_distances(np.array([[1.0, 2.0]]), np.array([0.0, 0.0]), \
+    np.array([2.0, 0.0])).tolist()
+    [2.0]
+    """
+    direction = end - start
+    length = np.hypot(direction[0], direction[1])
+    offsets = points - start
+
+    if length == 0:
+        return np.hypot(offsets[:, 0], offsets[:, 1])
+
+    return np.abs(direction[0] * offsets[:, 1] - direction[1] * offsets[:, 0]) / length
+
+
+if __name__ == '__main__':
+    # You can uncomment the following lines for code checking/debugging purposes.
+    # However, we recommend commenting out these lines when working with the large
+    # datasets, as checking representation invariants and preconditions greatly
+    # increases the running time of the functions/methods.
+    # import python_ta.contracts
+    # python_ta.contracts.check_all_contracts()
+
+    import doctest
+    doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'extra-imports': ['typing', 'hashlib', 'json', 'os', 'tempfile', 'numpy'],
+        # the names (strs) of imported modules
+        'allowed-io': ['simplify_features', 'create_cache_key'],
+        # the names (strs) of functions that call print/open/input
+        'max-line-length': 100,
+        'disable': ['E1136']
+    })
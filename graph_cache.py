@@ -0,0 +1,189 @@
+"""CSC111 Final Project: Visualizing COVID-19 Vaccinations In the World
+Module Description
+===============================
+This module contains a cache that stores the rendered graph images on disk, so that graphs whose
+data has not changed since the last build do not have to be rendered again.
+
+Copyright and Usage Information
+===============================
+
+This file is Copyright (c) 2021 Zachary Lee.
+"""
+from collections import OrderedDict
+from typing import Optional
+import hashlib
+import os
+import tempfile
+
+# The default maximum total size of the cached images, in bytes
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+# The fraction of the maximum size the cache is reduced to when it is over it, so that the images
+# are removed in batches instead of one by one on every put
+LOW_WATER_FRACTION = 0.9
+
+
+class GraphCache:
+    """ A content-addressed cache of rendered graph images in a directory. When the images take
+    up more than max_size bytes, the least recently used images are removed until they take up
+    LOW_WATER_FRACTION of max_size.
+
+    The order the images were used in is kept in memory, starting from their modification
+    times when the cache is created, so the directory is only scanned once. The images another
+    build adds to a shared cache are only counted once this cache reads them.
+    Instance Attributes:
+        - directory: The directory that contains the cached images.
+        - max_size: The maximum total size of the cached images, in bytes.
+        - hits: The number of images that were found in the cache.
+        - misses: The number of images that were not found in the cache.
+
+    Representation Invariants:
+        - self.max_size >= 0
+        - self.hits >= 0
+        - self.misses >= 0
+    >>> import tempfile
+    >>> cache = GraphCache(tempfile.mkdtemp(), max_size=10)
+    >>> key = create_key(b'series', 'settings')
+    >>> cache.get(key) is None
+    True
+    >>> cache.put(key, b'image')
+    >>> cache.get(key)
+    b'image'
+    >>> cache.put(create_key(b'other series', 'settings'), b'image 2')
+    >>> cache.get(key) is None
+    True
+    >>> cache.get_report()
+    'Graph cache: 1 hits, 2 misses'
+    """
+    directory: str
+    max_size: int
+    hits: int
+    misses: int
+    _sizes: OrderedDict
+    _total_size: int
+
+    def __init__(self, directory: str, max_size: int = DEFAULT_MAX_SIZE) -> None:
+        """Initialize a new cache in directory, creating the directory if it does not exist.
+
+        Preconditions:
+            - directory != ''
+            - max_size >= 0
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(directory, exist_ok=True)
+
+        # The sizes of the images, from the least to the most recently used
+        entries = []
+        for entry in os.scandir(directory):
+            if entry.is_file() and entry.name.endswith('.img'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime_ns, entry.name, stat.st_size))
+        entries.sort()
+        self._sizes = OrderedDict((name, size) for _, name, size in entries)
+        self._total_size = sum(self._sizes.values())
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return the image stored under key, or None if it is not in the cache.
+        """
+        name = key + '.img'
+        path = os.path.join(self.directory, name)
+
+        try:
+            with open(path, 'rb') as file:
+                image = file.read()
+        except FileNotFoundError:
+            # Another build sharing the cache may have removed the image
+            self._total_size -= self._sizes.pop(name, 0)
+            self.misses += 1
+            return None
+
+        # Marks the image as recently used. Another build sharing the cache may have removed it
+        # since it was read, but the image that was read is still valid.
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        self._total_size += len(image) - self._sizes.get(name, 0)
+        self._sizes[name] = len(image)
+        self._sizes.move_to_end(name)
+        self.hits += 1
+        return image
+
+    def put(self, key: str, image: bytes) -> None:
+        """Store image under key, and remove the least recently used images if the cache is over
+        its maximum size.
+
+        The image is written to a temporary file first, so other builds that share the cache
+        never read a partially written image.
+        """
+        name = key + '.img'
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(file_descriptor, 'wb') as file:
+            file.write(image)
+        os.replace(temporary_path, os.path.join(self.directory, name))
+
+        self._total_size += len(image) - self._sizes.get(name, 0)
+        self._sizes[name] = len(image)
+        self._sizes.move_to_end(name)
+        if self._total_size > self.max_size:
+            self.evict()
+
+    def evict(self) -> None:
+        """Remove the least recently used images until they take up at most LOW_WATER_FRACTION
+        of the maximum size of the cache.
+        """
+        low_water = self.max_size * LOW_WATER_FRACTION
+
+        while self._total_size > low_water and len(self._sizes) > 0:
+            name, size = self._sizes.popitem(last=False)
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            self._total_size -= size
+
+    def get_report(self) -> str:
+        """Return a summary of the cache hits and misses.
+        """
+        return f'Graph cache: {self.hits} hits, {self.misses} misses'
+
+
+def create_key(data: bytes, settings: str) -> str:
+    """Return the cache key of an image rendered from data with the given settings.
+
+    >>> create_key(b'series', 'settings') == create_key(b'series', 'settings')
+    True
+    >>> create_key(b'series', 'settings') == create_key(b'series', 'other settings')
+    False
+    """
+    digest = hashlib.sha256(settings.encode('UTF-8'))
+    digest.update(b'\0')
+    digest.update(data)
+
+    return digest.hexdigest()
+
+
+if __name__ == '__main__':
+    # You can uncomment the following lines for code checking/debugging purposes.
+    # However, we recommend commenting out these lines when working with the large
+    # datasets, as checking representation invariants and preconditions greatly
+    # increases the running time of the functions/methods.
+    # import python_ta.contracts
+    # python_ta.contracts.check_all_contracts()
+
+    import doctest
+    doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'extra-imports': ['collections', 'typing', 'hashlib', 'os', 'tempfile'],
+        # the names (strs) of imported modules
+        'allowed-io': ['GraphCache.get', 'GraphCache.put'],
+        # the names (strs) of functions that call print/open/input
+        'max-line-length': 100,
+        'disable': ['E1136']
+    })
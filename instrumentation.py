@@ -0,0 +1,355 @@
+"""CSC111 Final Project: Visualizing COVID-19 Vaccinations In the World
+Module Description
+===============================
+This module contains a profiler that records how long each stage of building the map takes, how
+much memory it uses and how many items it processes.
+
+Each stage is measured by a span, which is used as a context manager:
+
+    with profiler.span('read datasets') as span:
+        dataset = ...
+        span.add_count('rows', 7897)
+
+When the profiler is disabled, every span is the same object and does nothing, so the
+instrumentation can stay in the code without slowing it down.
+
+Copyright and Usage Information
+===============================
+
+This file is Copyright (c) 2021 Zachary Lee.
+"""
+from typing import Optional
+import cProfile
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    # The resource module is not available on Windows, where the peak RSS is not recorded
+    resource = None
+
+# The longest time importing main.py and the modules of a command that does not build a map may
+# take, in seconds. The commands that build a map also import folium, so they are not held to it.
+IMPORT_TIME_BUDGET = 0.5
+
+# The packages that take the longest to import, which are only imported by the commands that use
+# them
+DEFERRED_PACKAGES = ['folium', 'branca', 'plotly', 'kaleido']
+
+# The modules main.py imports when each of its commands runs
+COMMAND_MODULES = {'ingest': ['read_data'], 'aggregate': [], 'charts': ['charts'],
+                   'map': ['build'], 'serve': ['server']}
+
+# The commands that do not build a map, which must be imported within IMPORT_TIME_BUDGET
+FAST_COMMANDS = ['ingest', 'aggregate', 'charts']
+
+
+class Span:
+    """ A measurement of a single stage of the map build.
+    Instance Attributes:
+        - name: The name of the stage.
+        - wall_time: The time the stage took, in seconds.
+        - cpu_time: The CPU time this process used during the stage, in seconds.
+        - peak_rss: The peak resident set size of this process at the end of the stage, in
+          bytes, or None if it is not available.
+        - peak_traced: The peak memory allocated during the stage, in bytes, or None if memory
+          allocations are not traced.
+        - counts: A dictionary of the units of the items processed in the stage mapped to how
+          many were processed.
+        - overlapped: Whether another span was open at some point during the stage. The memory
+          of the process cannot be told apart between overlapping stages, so peak_rss and
+          peak_traced are None in that case.
+
+    Representation Invariants:
+        - self.wall_time >= 0
+        - self.cpu_time >= 0
+    """
+    name: str
+    wall_time: float
+    cpu_time: float
+    peak_rss: Optional[int]
+    peak_traced: Optional[int]
+    counts: {str: int}
+    overlapped: bool
+    _trace_memory: bool
+    _open_spans: list
+    _wall_start: float
+    _cpu_start: float
+
+    def __init__(self, name: str, trace_memory: bool = False,
+                 open_spans: Optional[list] = None) -> None:
+        """Initialize a new span for the stage called name. open_spans is the list of the spans
+        of the same profiler that are open, which is shared by all of them.
+        """
+        self.name = name
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+        self.peak_rss = None
+        self.peak_traced = None
+        self.counts = {}
+        self.overlapped = False
+        self._trace_memory = trace_memory
+        self._open_spans = [] if open_spans is None else open_spans
+        self._wall_start = 0.0
+        self._cpu_start = 0.0
+
+    def __enter__(self) -> 'Span':
+        """Start measuring the stage.
+
+        The peak of the traced memory is only reset when no other span is open, since resetting
+        it would change the peak of the other spans.
+        """
+        if self._open_spans != []:
+            self.overlapped = True
+            for span in self._open_spans:
+                span.overlapped = True
+        elif self._trace_memory:
+            tracemalloc.reset_peak()
+        self._open_spans.append(self)
+        self._cpu_start = time.process_time()
+        self._wall_start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_) -> None:
+        """Stop measuring the stage.
+        """
+        self.wall_time = time.perf_counter() - self._wall_start
+        self.cpu_time = time.process_time() - self._cpu_start
+        self._open_spans.remove(self)
+        if not self.overlapped:
+            self.peak_rss = get_peak_rss()
+            if self._trace_memory:
+                self.peak_traced = tracemalloc.get_traced_memory()[1]
+
+    def add_count(self, unit: str, count: int) -> None:
+        """Record that count more items of the given unit were processed in the stage.
+        """
+        self.counts[unit] = self.counts.get(unit, 0) + count
+
+    def to_dict(self) -> dict:
+        """Return the measurements of the stage as a dictionary.
+        """
+        return {'name': self.name, 'wall_time': self.wall_time, 'cpu_time': self.cpu_time,
+                'peak_rss': self.peak_rss, 'peak_traced': self.peak_traced,
+                'overlapped': self.overlapped, 'counts': self.counts}
+
+
+class NullSpan:
+    """ A span that measures nothing, which is used when the profiler is disabled.
+    """
+
+    def __enter__(self) -> 'NullSpan':
+        """Do nothing.
+        """
+        return self
+
+    def __exit__(self, *_) -> None:
+        """Do nothing.
+        """
+
+    def add_count(self, unit: str, count: int) -> None:
+        """Do nothing.
+        """
+
+
+NULL_SPAN = NullSpan()
+
+
+class Profiler:
+    """ A profiler that records a span for each stage of the map build.
+
+    If trace_memory is True, the memory allocated by Python is traced with tracemalloc and the
+    peak of each span is recorded. The memory of a span is only recorded if no other span was
+    open during it, such as when the variants are assembled in parallel, since the memory of
+    the process would include the other stages. If profile_functions is True, every function
+    call is profiled with cProfile between start and stop.
+    Instance Attributes:
+        - enabled: Whether the spans are recorded.
+        - spans: The recorded spans, in the order they started.
+        - trace_memory: Whether memory allocations are traced.
+        - function_profile: The cProfile profile, or None if function calls are not profiled.
+
+    Representation Invariants:
+        - self.enabled or self.spans == []
+
+    >>> profiler = Profiler(enabled=True)
+    >>> with profiler.span('count') as span:
+    ...     span.add_count('items', 3)
+    >>> profiler.spans[0].counts
+    {'items': 3}
+    >>> disabled = Profiler()
+    >>> with disabled.span('count') as span:
+    ...     span.add_count('items', 3)
+    >>> disabled.spans
+    []
+    >>> with profiler.span('outer') as outer:
+    ...     with profiler.span('inner') as inner:
+    ...         pass
+    >>> outer.overlapped, inner.overlapped, inner.peak_rss
+    (True, True, None)
+    """
+    enabled: bool
+    spans: [Span]
+    trace_memory: bool
+    function_profile: Optional[cProfile.Profile]
+    _open_spans: [Span]
+
+    def __init__(self, enabled: bool = False, trace_memory: bool = False,
+                 profile_functions: bool = False) -> None:
+        """Initialize a new profiler.
+        """
+        self.enabled = enabled
+        self.spans = []
+        self.trace_memory = enabled and trace_memory
+        self.function_profile = cProfile.Profile() if enabled and profile_functions else None
+        self._open_spans = []
+
+    def span(self, name: str) -> Span:
+        """Return a new span for the stage called name, to be used as a context manager.
+        """
+        if not self.enabled:
+            return NULL_SPAN
+
+        span = Span(name, self.trace_memory, self._open_spans)
+        self.spans.append(span)
+        return span
+
+    def start(self) -> None:
+        """Start tracing memory allocations and profiling function calls, if they are enabled.
+        """
+        if self.trace_memory:
+            tracemalloc.start()
+        if self.function_profile is not None:
+            self.function_profile.enable()
+
+    def stop(self) -> None:
+        """Stop tracing memory allocations and profiling function calls.
+        """
+        if self.function_profile is not None:
+            self.function_profile.disable()
+        if self.trace_memory:
+            tracemalloc.stop()
+
+    def get_report(self) -> str:
+        """Return a table of the measurements of each span.
+
+        >>> profiler = Profiler(enabled=True)
+        >>> span = profiler.span('read datasets')
+        >>> span.wall_time, span.cpu_time, span.peak_rss = 1.5, 1.25, 100 * 2 ** 20
+        >>> span.add_count('rows', 7897)
+        >>> print(profiler.get_report())
+        read datasets                    1.500 s wall   1.250 s CPU   100.0 MiB RSS  7897 rows
+        """
+        lines = []
+
+        for span in self.spans:
+            line = f'{span.name:<30} {span.wall_time:7.3f} s wall {span.cpu_time:7.3f} s CPU'
+            if span.peak_rss is not None:
+                line += f' {span.peak_rss / 2 ** 20:7.1f} MiB RSS'
+            if span.peak_traced is not None:
+                line += f' {span.peak_traced / 2 ** 20:7.1f} MiB traced'
+            if span.overlapped:
+                line += '   overlapped, memory not recorded'
+            for unit in span.counts:
+                line += f'  {span.counts[unit]} {unit}'
+            lines.append(line)
+
+        return '\n'.join(lines)
+
+    def save(self, filename: str) -> None:
+        """Save the measurements of each span to filename as JSON.
+        """
+        with open(filename, 'w') as file:
+            json.dump({'spans': [span.to_dict() for span in self.spans]}, file, indent=2)
+
+    def save_function_profile(self, filename: str) -> None:
+        """Save the cProfile statistics to filename, so they can be read with pstats or another
+        profile viewer.
+
+        Preconditions:
+            - self.function_profile is not None
+        """
+        self.function_profile.dump_stats(filename)
+
+
+def get_peak_rss() -> Optional[int]:
+    """Return the peak resident set size of this process in bytes, or None if it is not
+    available on this platform.
+    """
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports the peak in kilobytes, but macOS reports it in bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def measure_import(module: str, repeat: int = 3) -> (float, [str]):
+    """Return the shortest time it took a new interpreter to import module in repeat tries, in
+    seconds, and the packages in DEFERRED_PACKAGES that importing it also imported.
+
+    Each try runs in a new interpreter, so no module is already imported, but the files are
+    usually cached by the operating system after the first try. module may also be several
+    modules separated by commas, which are imported together.
+    """
+    code = ('import sys, time\n'
+            'start = time.perf_counter()\n'
+            f'import {module}\n'
+            'print(time.perf_counter() - start)\n'
+            'print(" ".join(sys.modules))')
+    times = []
+    imported = set()
+
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                                check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        lines = result.stdout.splitlines()
+        times.append(float(lines[-2]))
+        imported = {name.partition('.')[0] for name in lines[-1].split()}
+
+    return min(times), [package for package in DEFERRED_PACKAGES if package in imported]
+
+
+def measure_command(command: str, repeat: int = 3) -> (float, [str]):
+    """Return the shortest time it took a new interpreter to import main.py and the modules
+    that command imports in repeat tries, in seconds, and the packages in DEFERRED_PACKAGES
+    that they imported.
+
+    Preconditions:
+        - command in COMMAND_MODULES
+
+    >>> results = {command: measure_command(command) for command in COMMAND_MODULES}
+    >>> [command for command in COMMAND_MODULES if results[command][1] != []]
+    ['map', 'serve']
+    >>> [command for command in FAST_COMMANDS if results[command][0] >= IMPORT_TIME_BUDGET]
+    []
+    """
+    return measure_import(', '.join(['main'] + COMMAND_MODULES[command]), repeat)
+
+
+if __name__ == '__main__':
+    # You can uncomment the following lines for code checking/debugging purposes.
+    # However, we recommend commenting out these lines when working with the large
+    # datasets, as checking representation invariants and preconditions greatly
+    # increases the running time of the functions/methods.
+    # import python_ta.contracts
+    # python_ta.contracts.check_all_contracts()
+
+    import doctest
+    doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'extra-imports': ['typing', 'cProfile', 'json', 'os', 'subprocess', 'sys', 'time',
+                          'tracemalloc', 'resource'],
+        # the names (strs) of imported modules
+        'allowed-io': ['Profiler.save'],
+        # the names (strs) of functions that call print/open/input
+        'max-line-length': 100,
+        'disable': ['E1136']
+    })
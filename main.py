@@ -4,39 +4,162 @@ Module Description
 The main module uses all the functions from the other modules to produce a visualization of the
 vaccination data retrieved from the datasets.
 
+Each stage of the build can also be run on its own with a command:
+    - ingest:    Parse the rows added to the vaccine dataset since it was last parsed.
+    - aggregate: Build the countries and continents, save the snapshot of the datasets and print
+                 the latest total, peak daily rate and total per hundred people of each
+                 continent.
+    - charts:    Render the graph of every location into the graph cache and graphs directory.
+    - map:       Build the map. This is the command that runs if none is given.
+    - serve:     Serve the map from a local server.
+
+The modules a command needs are only imported when it runs, so the commands that do not render
+graphs or build a map never wait for plotly or folium to be imported.
+
 Copyright and Usage Information
 ===============================
 
 This file is Copyright (c) 2021 Zachary Lee.
 """
-import folium
+import argparse
+import asyncio
+import sys
 import webbrowser
-from visualize_vaccinations import add_country_data, add_continent_data, \
-    add_graph_markers_continent, add_graph_markers_country
+from graph_cache import GraphCache
+from instrumentation import Profiler
 import process_vaccine_data
+import vaccine_classes
+
+# The files the datasets are checkpointed, saved and cached in between runs
+CHECKPOINT_DIRECTORY = '.vaccine_checkpoint'
+SNAPSHOT_DIRECTORY = '.dataset_snapshot'
+GEOMETRY_DIRECTORY = '.geometry_cache'
+GRAPH_CACHE_DIRECTORY = '.graph_cache'
+
+if __name__ == '__main__':
+    # The graphs are rendered by worker processes, which import this module again on some
+    # platforms, so the map is only built when this file is run directly.
+    parser = argparse.ArgumentParser(description='Build the vaccination map.')
+    parser.add_argument('command', nargs='?', default='map',
+                        choices=['ingest', 'aggregate', 'charts', 'map', 'serve'],
+                        help='the stage of the build to run')
+    parser.add_argument('--output', default='map.html',
+                        help='the file to save the map to, with its graphs next to it')
+    parser.add_argument('--metric', choices=list(vaccine_classes.METRICS),
+                        default=vaccine_classes.DEFAULT_METRIC,
+                        help='the column of the vaccine dataset that the map shows')
+    parser.add_argument('--time-slider', action='store_true',
+                        help='add a country choropleth with a slider that selects the day shown')
+    parser.add_argument('--cluster-markers', action='store_true',
+                        help='draw the markers from one GeoJSON layer that clusters nearby '
+                             'markers')
+    parser.add_argument('--no-derived', action='store_true',
+                        help='leave out the weekly averages and growth of each location')
+    parser.add_argument('--variants', metavar='FILE',
+                        help='build every map variant in the JSON file FILE instead of one map')
+    parser.add_argument('--parallel', action='store_true',
+                        help='assemble the map variants at the same time')
+    parser.add_argument('--serve', action='store_true',
+                        help='serve the map from a local server instead of saving it')
+    parser.add_argument('--port', type=int, default=8000, help='the port of the server')
+    parser.add_argument('--profile', action='store_true',
+                        help='print the time, memory and item count of each stage')
+    parser.add_argument('--profile-json', metavar='FILE',
+                        help='also save the measurements of each stage to FILE as JSON')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='record the peak memory allocated in each stage with tracemalloc')
+    parser.add_argument('--cprofile', metavar='FILE',
+                        help='profile every function call with cProfile and save it to FILE')
+    arguments = parser.parse_args()
+    filenames = process_vaccine_data.DATASET_FILENAMES
+    metrics = vaccine_classes.get_load_metrics(arguments.metric)
+
+    if arguments.command == 'serve' or arguments.serve:
+        import server
+
+        # The datasets are loaded once and kept in memory, and everything else is built when
+        # it is requested
+        map_server = server.MapServer(filenames, GraphCache(GRAPH_CACHE_DIRECTORY),
+                                      CHECKPOINT_DIRECTORY, SNAPSHOT_DIRECTORY,
+                                      GEOMETRY_DIRECTORY, arguments.metric)
+        print(f'Serving the map at http://localhost:{arguments.port}/')
+        webbrowser.open(f'http://localhost:{arguments.port}/', new=2)
+        server.serve(map_server, arguments.port)
+        sys.exit()
+
+    profiler = Profiler(enabled=arguments.profile or arguments.profile_json is not None
+                        or arguments.trace_memory or arguments.cprofile is not None,
+                        trace_memory=arguments.trace_memory,
+                        profile_functions=arguments.cprofile is not None)
+    cache = GraphCache(GRAPH_CACHE_DIRECTORY)
+    output_filename = None
+
+    profiler.start()
+    if arguments.command == 'ingest':
+        import read_data
+
+        with profiler.span('ingest') as span:
+            vaccine_data, _ = read_data.read_vaccine_file_incremental(
+                filenames['vaccine'], CHECKPOINT_DIRECTORY, metrics)
+            span.add_count('rows', sum(len(series) for series in vaccine_data.values()))
+            span.add_count('countries', len(vaccine_data))
+
+    elif arguments.command in ('aggregate', 'charts'):
+        with profiler.span('load datasets') as span:
+            dataset = process_vaccine_data.load_dataset(
+                filenames['vaccine'], filenames['coordinate'], filenames['continent'],
+                CHECKPOINT_DIRECTORY, SNAPSHOT_DIRECTORY, metrics)
+            span.add_count('countries', len(dataset.countries))
 
-m = folium.Map(location=[0, 0], zoom_start=2, tiles='cartodbpositron')
-folium.TileLayer('cartodbdark_matter').add_to(m)
+        if arguments.command == 'aggregate':
+            for continent in dataset.continents:
+                summary = continent.summary
+                per_hundred = '' if summary.total_per_hundred is None \
+                    else f'{summary.total_per_hundred:.2f}/100'
+                print(f'{continent.name:<15} {summary.latest_total:>15,} '
+                      f'{summary.peak_daily_rate:>13,.0f}/day {per_hundred:>11} '
+                      f'{summary.latest_date}')
+        else:
+            import charts
 
-add_country_data('datasets/country_vaccinations.csv',
-                 'datasets/countries_codes_and_coordinates.csv',
-                 'datasets/countries.geojson', m)
+            # These are the same graphs the map links to, so building it afterwards only reads
+            # them from the cache
+            locations = dataset.countries
+            if arguments.metric in vaccine_classes.COUNT_METRICS:
+                locations = locations + charts.get_graph_continents(dataset)
 
-add_continent_data('datasets/country_vaccinations.csv',
-                   'datasets/countries_codes_and_coordinates.csv',
-                   'datasets/country-and-continent-codes-list-csv_csv.csv',
-                   'datasets/continents.json', m)
+            with profiler.span('charts') as span:
+                images = charts.render_graphs(locations, cache=cache, metric=arguments.metric)
+                charts.save_graphs(images, 'graphs')
+                span.add_count('charts', len(images))
+            print(cache.get_report())
 
-add_graph_markers_country('datasets/country_vaccinations.csv',
-                          'datasets/countries_codes_and_coordinates.csv', m)
+    else:
+        import build
 
-countries = process_vaccine_data.create_country_locations(
-    'datasets/country_vaccinations.csv', 'datasets/countries_codes_and_coordinates.csv')
+        if arguments.variants is None:
+            variants = [build.VariantSpec(arguments.output, time_slider=arguments.time_slider,
+                                          clustered_markers=arguments.cluster_markers,
+                                          derived=not arguments.no_derived)]
+        else:
+            variants = build.read_variants(arguments.variants)
 
-add_graph_markers_continent(countries,
-                            'datasets/country-and-continent-codes-list-csv_csv.csv', m)
+        # The graphs are saved next to the maps and only loaded when their popup is opened
+        asyncio.run(build.build_variants_async(
+            variants, filenames, profiler=profiler, cache=cache, graph_directory='graphs',
+            checkpoint_directory=CHECKPOINT_DIRECTORY, snapshot_directory=SNAPSHOT_DIRECTORY,
+            geometry_directory=GEOMETRY_DIRECTORY, metric=arguments.metric,
+            parallel=arguments.parallel))
+        print(cache.get_report())
+        output_filename = variants[0].output_filename
+    profiler.stop()
 
-folium.LayerControl().add_to(m)
+    if profiler.enabled:
+        print(profiler.get_report())
+    if arguments.profile_json is not None:
+        profiler.save(arguments.profile_json)
+    if arguments.cprofile is not None:
+        profiler.save_function_profile(arguments.cprofile)
 
-m.save('map.html')
-webbrowser.open('map.html', new=2)
+    if output_filename is not None:
+        webbrowser.open(output_filename, new=2)
@@ -0,0 +1,150 @@
+"""CSC111 Final Project: Visualizing COVID-19 Vaccinations In the World
+Module Description
+===============================
+This module contains a writer that streams a folium map to a file one layer at a time, instead
+of rendering the whole document into a single string like folium.Map.save does.
+
+The document starts with the map itself. Each time the writer is flushed, the elements added to
+the map since the previous flush are rendered and written in their own script block, together
+with any stylesheets and scripts they need that have not been written yet, and their children
+are dropped. Only the layer being written has to be held in memory as HTML, so the peak memory
+of saving the map no longer grows with the number of markers.
+
+Copyright and Usage Information
+===============================
+
+This file is Copyright (c) 2021 Zachary Lee.
+"""
+from collections import OrderedDict
+from typing import TextIO
+import folium
+
+
+class MapWriter:
+    """ A writer that streams a folium map to a file.
+    Instance Attributes:
+        - folium_map: The map being written.
+        - file: The file the map is written to.
+        - size: The number of characters written so far.
+
+    Representation Invariants:
+        - self.size >= 0
+    >>> import io
+    >>> folium_map = folium.Map(location=[0, 0], tiles=None)
+    >>> writer = MapWriter(folium_map, io.StringIO())
+    >>> folium.Marker([1, 2]).add_to(folium_map)  # doctest: +ELLIPSIS
+    <folium.map.Marker object at ...>
+    >>> writer.flush()
+    >>> writer.close()
+    >>> writer.file.getvalue().count('L.marker(')
+    1
+    """
+    folium_map: folium.Map
+    file: TextIO
+    size: int
+    _written: set
+    _header_names: set
+
+    def __init__(self, folium_map: folium.Map, file: TextIO) -> None:
+        """Initialize a new writer and write the start of the document, including the map but
+        none of the elements that have been added to it.
+        """
+        self.folium_map = folium_map
+        self.file = file
+        self.size = 0
+        self._written = set()
+        self._header_names = set()
+
+        figure = folium_map.get_root()
+        children = folium_map._children
+        folium_map._children = OrderedDict()
+        try:
+            folium_map.render()
+        finally:
+            folium_map._children = children
+
+        self.write('<!DOCTYPE html>\n<html>\n<head>\n')
+        self.write_header()
+        self.write('</head>\n<body>\n')
+        self.write_parts(figure.html)
+        self.write('</body>\n<script>\n')
+        self.write_parts(figure.script)
+        self.write('</script>\n')
+
+    def flush(self) -> None:
+        """Render and write every element added to the map since the last flush, then drop
+        their children to free the memory they use.
+
+        The elements themselves stay in the map, since a layer control added later needs to
+        know every layer in it.
+        """
+        figure = self.folium_map.get_root()
+        elements = [element for element in self.folium_map._children.values()
+                    if element.get_name() not in self._written]
+        if elements == []:
+            return
+
+        for element in elements:
+            element.render()
+            self._written.add(element.get_name())
+
+        # The stylesheets and scripts needed by the elements can be loaded in the body, as
+        # long as they come before the script block that uses them
+        self.write_header()
+        self.write_parts(figure.html)
+        self.write('<script>\n')
+        self.write_parts(figure.script)
+        self.write('</script>\n')
+
+        for element in elements:
+            element._children = OrderedDict()
+
+    def close(self) -> None:
+        """Write every element that has not been written yet and the end of the document.
+        """
+        self.flush()
+        self.write('</html>\n')
+
+    def write_header(self) -> None:
+        """Write the entries of the header of the map that have not been written yet.
+        """
+        header = self.folium_map.get_root().header
+        for name, element in header._children.items():
+            if name not in self._header_names:
+                self.write(element.render() + '\n')
+                self._header_names.add(name)
+
+    def write_parts(self, part: folium.Element) -> None:
+        """Write every child of part, which is the html or script part of the map, and remove
+        them from it.
+        """
+        for element in part._children.values():
+            self.write(element.render() + '\n')
+        part._children = OrderedDict()
+
+    def write(self, text: str) -> None:
+        """Write text to the file.
+        """
+        self.file.write(text)
+        self.size += len(text)
+
+
+if __name__ == '__main__':
+    # You can uncomment the following lines for code checking/debugging purposes.
+    # However, we recommend commenting out these lines when working with the large
+    # datasets, as checking representation invariants and preconditions greatly
+    # increases the running time of the functions/methods.
+    # import python_ta.contracts
+    # python_ta.contracts.check_all_contracts()
+
+    import doctest
+    doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'extra-imports': ['collections', 'typing', 'folium'],
+        # the names (strs) of imported modules
+        'allowed-io': [],  # the names (strs) of functions that call print/open/input
+        'max-line-length': 100,
+        'disable': ['E1136', 'W0212']
+    })
@@ -0,0 +1,155 @@
+"""CSC111 Final Project: Visualizing COVID-19 Vaccinations In the World
+Module Description
+===============================
+This module contains a layer that draws the graph markers of many locations from a single
+GeoJSON FeatureCollection.
+
+Each location is a point feature whose properties contain its name and the source of its graph.
+The browser creates the markers from the features, groups nearby markers into clusters, and
+builds each popup from one shared function when it is opened. The map therefore contains one
+small feature for each location instead of a marker, an icon and a popup element with their own
+scripts, so the size of the map and the time it takes to build stay small for each location.
+
+Copyright and Usage Information
+===============================
+
+This file is Copyright (c) 2021 Zachary Lee.
+"""
+from typing import Optional
+from branca.element import Template
+import folium
+from folium.elements import JSCSSMixin
+from folium.plugins import MarkerCluster
+from folium.utilities import camelize
+import vaccine_classes
+
+
+class GraphMarkerLayer(JSCSSMixin, folium.map.Layer):
+    """ A layer of clustered markers that each open a popup showing the graph of a location.
+    Instance Attributes:
+        - data: The GeoJSON data of the locations, with a point feature for each location.
+        - icon_options: The options of the icon of every marker.
+        - width: The width of the graph in each popup, in pixels.
+        - height: The height of the graph in each popup, in pixels.
+
+    Representation Invariants:
+        - self.width > 0
+        - self.height > 0
+    >>> import datetime
+    >>> canada = vaccine_classes.Location('Canada', [60.0, -95.0], \
+    {datetime.date(2021, 1, 1): 100}, identifier='CAN')
+    >>> layer = GraphMarkerLayer([canada], ['graphs/canada.jpg'], 'flag', 'blue', 500, 410)
+    >>> layer.data['features'][0]['geometry']['coordinates']
+    [-95.0, 60.0]
+    """
+    data: dict
+    icon_options: dict
+    width: int
+    height: int
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = (function() {
+            var icon = L.AwesomeMarkers.icon({{ this.icon_options|tojson }});
+            var cluster = L.markerClusterGroup();
+
+            function createPopup(marker) {
+                var popup = document.createElement('div');
+                var image = document.createElement('img');
+                image.src = marker.feature.properties.graph;
+                image.alt = marker.feature.properties.name;
+                image.loading = 'lazy';
+                image.width = {{ this.width }};
+                image.height = {{ this.height }};
+                popup.appendChild(image);
+                if (marker.feature.properties.caption) {
+                    var caption = document.createElement('p');
+                    caption.innerHTML = marker.feature.properties.caption;
+                    popup.appendChild(caption);
+                }
+                return popup;
+            }
+
+            L.geoJson({{ this.data|tojson }}, {
+                pointToLayer: function(feature, latlng) {
+                    return L.marker(latlng, {icon: icon});
+                },
+                onEachFeature: function(feature, marker) {
+                    marker.bindPopup(createPopup, {maxWidth: 2650});
+                }
+            }).addTo(cluster);
+
+            return cluster;
+        })();
+        {% endmacro %}
+        """)
+
+    default_js = MarkerCluster.default_js
+    default_css = MarkerCluster.default_css
+
+    def __init__(self, locations: [vaccine_classes.Location], sources: [str], icon: str,
+                 color: str, width: int, height: int, name: str = 'Markers',
+                 show: bool = True, captions: Optional[list] = None) -> None:
+        """Initialize a new layer with a marker for each location, where sources[i] is the url
+        of the graph of locations[i]. The markers have the given glyphicon and colour. If
+        captions is not None, the popup of locations[i] shows the HTML captions[i] below its
+        graph.
+
+        Preconditions:
+            - len(locations) == len(sources)
+            - captions is None or len(captions) == len(locations)
+        """
+        super().__init__(name=name, overlay=True, show=show)
+        self._name = 'GraphMarkerLayer'
+        self.data = create_marker_features(locations, sources, captions)
+        self.icon_options = {camelize(key): value
+                             for key, value in folium.Icon(icon=icon, color=color).options.items()}
+        self.width = width
+        self.height = height
+
+
+def create_marker_features(locations: [vaccine_classes.Location], sources: [str],
+                           captions: Optional[list] = None) -> dict:
+    """Return a GeoJSON FeatureCollection with a point feature for each location, whose
+    properties are the name of the location, the url of its graph in sources and its caption
+    in captions, if captions is not None.
+
+    Preconditions:
+        - len(locations) == len(sources)
+        - captions is None or len(captions) == len(locations)
+    """
+    features = []
+
+    for i, (location, source) in enumerate(zip(locations, sources)):
+        latitude, longitude = location.coordinates
+        properties = {'name': location.name, 'graph': source}
+        if captions is not None:
+            properties['caption'] = captions[i]
+        features.append({'type': 'Feature',
+                         'geometry': {'type': 'Point', 'coordinates': [longitude, latitude]},
+                         'properties': properties})
+
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+if __name__ == '__main__':
+    # You can uncomment the following lines for code checking/debugging purposes.
+    # However, we recommend commenting out these lines when working with the large
+    # datasets, as checking representation invariants and preconditions greatly
+    # increases the running time of the functions/methods.
+    # import python_ta.contracts
+    # python_ta.contracts.check_all_contracts()
+
+    import doctest
+    doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'extra-imports': ['typing', 'branca.element', 'folium', 'folium.elements',
+                          'folium.plugins', 'folium.utilities', 'vaccine_classes'],
+        # the names (strs) of imported modules
+        'allowed-io': [],
+        # the names (strs) of functions that call print/open/input
+        'max-line-length': 100,
+        'disable': ['E1136']
+    })
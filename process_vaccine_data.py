@@ -9,10 +9,22 @@ Copyright and Usage Information
 
 This file is Copyright (c) 2021 Zachary Lee.
 """
+from typing import Optional
 import datetime
+import numpy as np
 import read_data
+import snapshot
 import vaccine_classes
 
+# The default filenames of the datasets
+DATASET_FILENAMES = {
+    'vaccine': 'datasets/country_vaccinations.csv',
+    'coordinate': 'datasets/countries_codes_and_coordinates.csv',
+    'continent': 'datasets/country-and-continent-codes-list-csv_csv.csv',
+    'country_json': 'datasets/countries.geojson',
+    'continent_json': 'datasets/continents.json'
+}
+
 CONTINENT_COORDINATES = {'North America': [54.5260, -105.2551],
                          'South America': [-8.7832, -55.4915],
                          'Africa': [-8.7832, 34.5085], 'Oceania': [-22.7359, 140.0188],
@@ -20,6 +32,67 @@ CONTINENT_COORDINATES = {'North America': [54.5260, -105.2551],
                          'Europe': [54.5260, 15.2551]}
 
 
+def load_dataset(vaccine_filename: str, coordinate_filename: str,
+                 continent_filename: str, checkpoint_directory: Optional[str] = None,
+                 snapshot_directory: Optional[str] = None,
+                 metrics: Optional[list[str]] = None) -> vaccine_classes.VaccineDataset:
+    """Read every dataset once and return a VaccineDataset containing the country and continent
+    locations built from them.
+
+    The vaccine dataset is parsed in a single pass, so building the whole map only reads each
+    file once. Every metric in metrics is loaded in that pass, or only DEFAULT_METRIC if metrics
+    is None, and the vaccine_data of each location is the series of the first metric. If
+    checkpoint_directory is given, only the rows appended to the vaccine dataset since the last
+    time it was read are parsed.
+
+    If snapshot_directory is given, the parsed datasets are loaded from the snapshot in it
+    instead, unless one of the files changed since the snapshot was saved. In that case the
+    files are parsed and a new snapshot is saved.
+
+    Preconditions:
+        - len(vaccine_filename) > 0
+        - len(coordinate_filename) > 0
+        - len(continent_filename) > 0
+        - metrics is None or metrics[0] in vaccine_classes.COUNT_METRICS
+
+    >>> dataset = load_dataset('datasets/country_vaccinations.csv', \
+    'datasets/countries_codes_and_coordinates.csv', \
+    'datasets/country-and-continent-codes-list-csv_csv.csv', \
+    metrics=['total_vaccinations', 'people_vaccinated'])
+    >>> dataset.countries[0].name
+    'Afghanistan'
+    >>> dataset.continents[0].name
+    'Asia'
+    >>> dataset.continents[0].get_series('people_vaccinated').metric
+    'people_vaccinated'
+    """
+    source_filenames = [vaccine_filename, coordinate_filename, continent_filename]
+    parsed_data = None
+    if snapshot_directory is not None:
+        parsed_data = snapshot.load_snapshot(snapshot_directory, source_filenames, metrics)
+
+    if parsed_data is not None:
+        vaccine_data, country_names, coordinate_data, continent_data = parsed_data
+    else:
+        if checkpoint_directory is None:
+            vaccine_data, country_names = read_data.read_vaccine_file(vaccine_filename, metrics)
+        else:
+            vaccine_data, country_names = read_data.read_vaccine_file_incremental(
+                vaccine_filename, checkpoint_directory, metrics)
+        coordinate_data = read_data.read_coordinate_data(coordinate_filename)
+        continent_data = read_data.read_continent_data(continent_filename)
+
+        if snapshot_directory is not None:
+            snapshot.save_snapshot(snapshot_directory, source_filenames, vaccine_data,
+                                   country_names, coordinate_data, continent_data)
+
+    countries = build_country_locations(vaccine_data, country_names, coordinate_data)
+    continents = build_continent_locations(countries, continent_data)
+
+    return vaccine_classes.VaccineDataset(countries, continents, country_names,
+                                          coordinate_data, continent_data)
+
+
 def create_country_locations(vaccine_filename: str, coordinate_filename: str) \
         -> [vaccine_classes.Location]:
     """Read the data from the vaccine dataset and the country coordinate dataset and create a
@@ -33,9 +106,22 @@ def create_country_locations(vaccine_filename: str, coordinate_filename: str) \
     'datasets/countries_codes_and_coordinates.csv')[0].name
     'Afghanistan'
     """
-    vaccine_data = read_data.read_vaccine_data(vaccine_filename)
+    vaccine_data, country_codes = read_data.read_vaccine_file(vaccine_filename)
     coordinate_data = read_data.read_coordinate_data(coordinate_filename)
-    country_codes = read_data.read_country_names(vaccine_filename)
+
+    return build_country_locations(vaccine_data, country_codes, coordinate_data)
+
+
+def build_country_locations(vaccine_data: {str: {datetime.date: int}},
+                            country_codes: {str: str},
+                            coordinate_data: {str: [float, float]}) \
+        -> [vaccine_classes.Location]:
+    """Create a Location instance for each country in vaccine_data that has coordinates.
+
+    >>> build_country_locations({'CAN': {datetime.date(2020, 12, 15): 100}}, \
+    {'CAN': 'Canada'}, {'CAN': [60.0, -95.0]})[0].name
+    'Canada'
+    """
     location_list = []
 
     for country in vaccine_data:
@@ -63,20 +149,63 @@ def create_continent_locations(countries: [vaccine_classes.Location], continent_
     'Asia'
     """
     continent_data = read_data.read_continent_data(continent_filename)
+
+    return build_continent_locations(countries, continent_data)
+
+
+def build_continent_locations(countries: [vaccine_classes.Location],
+                              continent_data: {str: [str]}) -> [vaccine_classes.Location]:
+    """Return a list containing a continent location instance for each continent in
+    continent_data.
+
+    Preconditions:
+        - all(continent in CONTINENT_COORDINATES for continent in continent_data)
+    """
+    continent_index = create_continent_index(continent_data)
+    members = {continent: [] for continent in continent_data}
+
+    for country in countries:
+        for continent in continent_index.get(country.identifier, []):
+            members[continent].append(country)
+
+    continent_totals = sum_location_groups(members)
     continent_list = []
 
     for continent in continent_data:
-        country_list = continent_data[continent]
-        sub_locations = [country for country in countries if country.identifier in country_list]
-        new_vaccine_data = sum_continent_vaccinations(sub_locations)
         continent_list.append(vaccine_classes.Location(continent, CONTINENT_COORDINATES[continent],
-                                                       new_vaccine_data, sub_locations))
+                                                       continent_totals[continent],
+                                                       members[continent]))
 
     return continent_list
 
 
-def sum_continent_vaccinations(countries: [vaccine_classes.Location]) -> {datetime.date: int}:
-    """Return a dictionary of dates mapped to total vaccinations for the continent.
+def create_continent_index(continent_data: {str: [str]}) -> {str: [str]}:
+    """Return a dictionary of country codes mapped to the continents that contain them.
+
+    Some countries, such as Russia and Turkey, belong to more than one continent. A code listed
+    more than once in the same continent is only counted once, so the country is not added to
+    that continent twice.
+
+    >>> create_continent_index({'Asia': ['RUS', 'CHN'], 'Europe': ['RUS']})['RUS']
+    ['Asia', 'Europe']
+    >>> create_continent_index({'Asia': ['CHN', 'CHN']})['CHN']
+    ['Asia']
+    """
+    continent_index = {}
+
+    for continent in continent_data:
+        for code in dict.fromkeys(continent_data[continent]):
+            if code in continent_index:
+                continent_index[code].append(continent)
+            else:
+                continent_index[code] = [continent]
+
+    return continent_index
+
+
+def sum_continent_vaccinations(countries: [vaccine_classes.Location]) \
+        -> vaccine_classes.VaccineSeries:
+    """Return a series of dates mapped to total vaccinations for the continent.
 
     Preconditions:
         - countries != []
@@ -89,25 +218,125 @@ def sum_continent_vaccinations(countries: [vaccine_classes.Location]) -> {dateti
     [datetime.date(2020, 12, 15)]
     1528500
     """
-    dates = set()
-    for country in countries:
-        for date in country.vaccine_data:
-            dates.add(date)
+    return sum_location_groups({'': countries})['']
 
-    dates = list(dates)
-    dates.sort()
-    new_vaccination_total = {current_date: 0 for current_date in dates}
 
-    for country in countries:
-        prev_total = 0
-        for date in dates:
-            if date in country.vaccine_data:
-                new_vaccination_total[date] += country.vaccine_data[date]
-                prev_total = country.vaccine_data[date]
-            else:
-                new_vaccination_total[date] += prev_total
+def sum_location_groups(groups: {str: [vaccine_classes.Location]}) \
+        -> {str: vaccine_classes.VaccineSeries}:
+    """Return a dictionary of each group name mapped to the total vaccinations of the locations
+    in that group.
+
+    Every series is aligned on one shared date axis and forward filled, so the total on a date
+    includes the latest known value of each location. A group only has entries on the dates
+    where at least one of its locations has data. Every metric in COUNT_METRICS that all the
+    locations have is added up, and the totals have the same metric as the location series.
+
+    Preconditions:
+        - all(location.vaccine_data.metric in vaccine_classes.COUNT_METRICS \
+        for group in groups for location in groups[group])
+
+    >>> canada = vaccine_classes.Location('Canada', [60.0, -95.0], \
+    {datetime.date(2020, 12, 15): 100, datetime.date(2020, 12, 17): 300}, identifier='CAN')
+    >>> mexico = vaccine_classes.Location('Mexico', [23.0, -102.0], \
+    {datetime.date(2020, 12, 16): 50}, identifier='MEX')
+    >>> totals = sum_location_groups({'North America': [canada, mexico], 'Empty': []})
+    >>> dict(totals['North America']) == {datetime.date(2020, 12, 15): 100, \
+    datetime.date(2020, 12, 16): 150, datetime.date(2020, 12, 17): 350}
+    True
+    >>> len(totals['Empty'])
+    0
+    """
+    # Each location is aligned once, even if it belongs to more than one group
+    locations = {}
+    for group in groups:
+        for location in groups[group]:
+            locations[id(location)] = location
+
+    series_list = [location.vaccine_data for location in locations.values()]
+    metric, metrics = get_shared_count_metrics(series_list)
+    axis = create_date_axis(series_list)
+    totals = {group: {name: np.zeros(len(axis), dtype=np.int64) for name in metrics}
+              for group in groups}
+    present = {group: np.zeros(len(axis), dtype=bool) for group in groups}
+    aligned = {}
+
+    for key in locations:
+        aligned[key] = {name: forward_fill(locations[key].vaccine_data.get_metric(name), axis)
+                        for name in metrics}
+
+    for group in groups:
+        for location in groups[group]:
+            for name in metrics:
+                totals[group][name] += aligned[id(location)][name][0]
+            present[group] |= aligned[id(location)][metric][1]
+
+    group_series = {}
+    for group in groups:
+        columns = {name: totals[group][name][present[group]] for name in metrics}
+        group_series[group] = vaccine_classes.VaccineSeries(axis[present[group]], columns[metric],
+                                                            columns, metric)
+
+    return group_series
+
+
+def get_shared_count_metrics(series_list: [vaccine_classes.VaccineSeries]) -> (str, [str]):
+    """Return the metric of the series in series_list and every metric in COUNT_METRICS that
+    all of them have, in the order of the columns of the first series. Return DEFAULT_METRIC
+    alone if series_list is empty.
+
+    >>> series = vaccine_classes.VaccineSeries.from_dict({datetime.date(2021, 1, 2): 1})
+    >>> get_shared_count_metrics([series])
+    ('total_vaccinations', ['total_vaccinations'])
+    """
+    if series_list == []:
+        return vaccine_classes.DEFAULT_METRIC, [vaccine_classes.DEFAULT_METRIC]
+
+    metrics = [name for name in series_list[0].columns if name in vaccine_classes.COUNT_METRICS
+               and all(name in series.columns for series in series_list)]
+
+    return series_list[0].metric, metrics
+
+
+def create_date_axis(series_list: [vaccine_classes.VaccineSeries]) -> np.ndarray:
+    """Return the sorted array of every date that appears in at least one series.
+
+    >>> series = vaccine_classes.VaccineSeries.from_dict({datetime.date(2021, 1, 2): 1})
+    >>> create_date_axis([series, series]).tolist()
+    [datetime.date(2021, 1, 2)]
+    """
+    if series_list == []:
+        return np.array([], dtype='datetime64[D]')
+
+    return np.unique(np.concatenate([series.dates for series in series_list]))
+
+
+def forward_fill(series: vaccine_classes.VaccineSeries, axis: np.ndarray) \
+        -> (np.ndarray, np.ndarray):
+    """Return a tuple containing the value of series on each date in axis and whether series has
+    an entry on that date.
+
+    Dates without an entry take the value of the latest earlier entry, or 0 if there is none.
+
+    Preconditions:
+        - all(axis[i] < axis[i + 1] for i in range(len(axis) - 1))
+
+    >>> series = vaccine_classes.VaccineSeries.from_dict({datetime.date(2021, 1, 2): 5})
+    >>> axis = np.array(['2021-01-01', '2021-01-02', '2021-01-03'], dtype='datetime64[D]')
+    >>> values, has_entry = forward_fill(series, axis)
+    >>> values.tolist(), has_entry.tolist()
+    ([0, 5, 5], [False, True, False])
+    """
+    if len(series) == 0:
+        return np.zeros(len(axis), dtype=np.int64), np.zeros(len(axis), dtype=bool)
+
+    positions = np.searchsorted(series.dates, axis, side='right') - 1
+    before_start = positions < 0
+    positions[before_start] = 0
+
+    values = np.where(before_start, 0, series.values[positions])
+    has_entry = ~before_start & (series.dates[positions] == axis)
 
-    return new_vaccination_total
+    return values, has_entry
 
 
 if __name__ == '__main__':
@@ -123,7 +352,8 @@ if __name__ == '__main__':
 
     import python_ta
     python_ta.check_all(config={
-        'extra-imports': ['read_data', 'vaccine_classes', 'datetime'],
+        'extra-imports': ['read_data', 'vaccine_classes', 'datetime', 'numpy', 'typing',
+                          'snapshot'],
         # the names (strs) of imported modules
         'allowed-io': [],  # the names (strs) of functions that call print/open/input
         'max-line-length': 100,
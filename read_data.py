@@ -8,13 +8,34 @@ Copyright and Usage Information
 
 This file is Copyright (c) 2021 Zachary Lee.
 """
+from typing import BinaryIO, Optional
 import csv
 import datetime
+import hashlib
+import os
+import tempfile
+import numpy as np
+import fast_csv
+import vaccine_classes
 
+# The size of the blocks of the vaccine dataset that are fingerprinted one after another
+FINGERPRINT_BLOCK_SIZE = 64 * 1024
 
-def read_vaccine_data(filename: str) -> {str: {datetime.date: int}}:
+# The fingerprint of the bytes before the first block
+FINGERPRINT_SEED = hashlib.sha256(b'vaccine dataset').hexdigest()
+
+# The version of the checkpoint format, which is increased whenever the format changes
+CHECKPOINT_VERSION = 2
+
+# The columns of the vaccine dataset that identify each row, which are parsed along with the
+# columns of the metrics
+KEY_COLUMNS = ['country', 'iso_code', 'date']
+
+
+def read_vaccine_data(filename: str, metrics: Optional[list[str]] = None) \
+        -> {str: vaccine_classes.VaccineSeries}:
     """Read all the total vaccination data over time for each country in filename and store it in
-    a dictionary.
+    a dictionary. If metrics is not None, the data of each metric in it is read instead.
 
     Preconditions:
         - len(filename) > 0
@@ -23,36 +44,309 @@ def read_vaccine_data(filename: str) -> {str: {datetime.date: int}}:
     >>> vaccine_dict['AFG'][datetime.date(2021, 3, 5)]
     8200
     """
-    vaccine_data = {}
+    return read_vaccine_file(filename, metrics)[0]
 
-    with open(filename) as file:
-        reader = csv.reader(file)
-        next(reader)
-        previous_vaccinations = 0
-        for row in reader:
-            # Slices the string that contains the date for that specific row
-            date = row[2]
-            year = int(date[0:4])
-            month = int(date[5:7])
-            day = int(date[8:10])
-
-            if row[3] == '':
-                vaccinations = 0
-            else:
-                vaccinations = int(float(row[3]))
 
-            # Keeps track of the previous total to account for empty spaces in the data
-            if vaccinations != 0 or not row[1] in vaccine_data:
-                previous_vaccinations = vaccinations
+def read_vaccine_file(filename: str, metrics: Optional[list[str]] = None) \
+        -> ({str: vaccine_classes.VaccineSeries}, {str: str}):
+    """Read the vaccine data file in a single pass and return a tuple containing the vaccination
+    data over time for each country and a dictionary of country codes mapped to country names.
 
-            # If the country is not already in the dictionary, then initialize the
-            # dictionary that is mapped to it. Otherwise, update it.
-            if row[1] in vaccine_data:
-                vaccine_data[row[1]][datetime.date(year, month, day)] = previous_vaccinations
-            else:
-                vaccine_data[row[1]] = {datetime.date(year, month, day): previous_vaccinations}
+    Every metric in metrics, or only DEFAULT_METRIC if metrics is None, is parsed in the same
+    pass. The series of each country is of the first metric and holds the others in its
+    columns, so loading another metric only costs the memory of its column.
+
+    Only the needed columns are parsed, straight from large chunks of the file, and the rows are
+    split into one VaccineSeries per country, so no Python object is created for each row.
+
+    Raise ValueError if a metric is not in METRICS.
+
+    Preconditions:
+        - len(filename) > 0
+
+    >>> vaccine_dict, country_names = read_vaccine_file('datasets/country_vaccinations.csv', \
+    ['total_vaccinations', 'people_fully_vaccinated'])
+    >>> vaccine_dict['AFG'][datetime.date(2021, 3, 5)]
+    8200
+    >>> vaccine_dict['AFG'].get_metric('people_fully_vaccinated').metric
+    'people_fully_vaccinated'
+    >>> country_names['AFG']
+    'Afghanistan'
+    """
+    rows = vaccine_classes.VaccineRows(metrics)
+
+    with open(filename, 'rb') as file:
+        columns = read_header(file)
+        for chunk in fast_csv.iter_chunks(file):
+            add_vaccine_chunk(rows, chunk, columns)
+
+    return rows.to_series(), rows.country_names
+
+
+def read_vaccine_file_incremental(filename: str, checkpoint_directory: str,
+                                  metrics: Optional[list[str]] = None) \
+        -> ({str: vaccine_classes.VaccineSeries}, {str: str}):
+    """Return the same data as read_vaccine_file, but only parse the rows that were appended to
+    filename since the checkpoint in checkpoint_directory was saved, then update the checkpoint.
+
+    If there is no checkpoint, the checkpoint has different metrics, or the end of the rows it
+    was saved from was changed or cut off, the whole file is parsed. The rows before the last
+    block of FINGERPRINT_BLOCK_SIZE bytes are assumed to only be appended to, since checking
+    them would mean reading the whole file again.
+
+    Preconditions:
+        - len(filename) > 0
+        - len(checkpoint_directory) > 0
+
+    >>> import os, tempfile
+    >>> checkpoint_directory = os.path.join(tempfile.mkdtemp(), 'checkpoint')
+    >>> vaccine_dict, country_names = read_vaccine_file_incremental( \
+    'datasets/country_vaccinations.csv', checkpoint_directory)
+    >>> vaccine_dict, country_names = read_vaccine_file_incremental( \
+    'datasets/country_vaccinations.csv', checkpoint_directory)
+    >>> vaccine_dict['AFG'][datetime.date(2021, 3, 5)]
+    8200
+    """
+    rows, checkpoint = read_checkpoint(checkpoint_directory, filename, metrics)
+    offset = checkpoint['offset']
+
+    with open(filename, 'rb') as file:
+        columns = read_header(file)
+        if offset == 0:
+            offset = file.tell()
 
-    return vaccine_data
+        file.seek(offset)
+        # Only complete lines are parsed, in case a row is still being written to the file
+        for chunk in fast_csv.iter_chunks(file, complete_lines_only=True):
+            add_vaccine_chunk(rows, chunk, columns)
+            offset += len(chunk)
+
+    write_checkpoint(checkpoint_directory, filename, rows, checkpoint, offset)
+
+    return rows.to_series(), rows.country_names
+
+
+def read_header(file: BinaryIO) -> {str: int}:
+    """Read the header line of the vaccine dataset from file and return a dictionary of column
+    names mapped to column indices.
+
+    >>> import io
+    >>> read_header(io.BytesIO(b' country,iso_code,date\\r\\nCanada,CAN,2021-01-01'))['date']
+    2
+    """
+    header = file.readline().decode('UTF-8-sig')
+    names = next(csv.reader([header]))
+
+    return {names[i].strip(): i for i in range(len(names))}
+
+
+def add_vaccine_chunk(rows: vaccine_classes.VaccineRows, buffer: np.ndarray,
+                      columns: {str: int}) -> None:
+    """Parse the lines of the vaccine dataset in buffer and add them to rows, where columns maps
+    the column names to their indices.
+
+    Only the fields up to the last column in KEY_COLUMNS and rows.metrics are looked at. Lines
+    with quotes in those fields are parsed with the csv module.
+
+    Preconditions:
+        - all(name in columns for name in KEY_COLUMNS + rows.metrics)
+    """
+    name_column, code_column, date_column = [columns[name] for name in KEY_COLUMNS]
+    metric_columns = [columns[metric] for metric in rows.metrics]
+    starts, ends = fast_csv.find_lines(buffer)
+    field_starts, field_ends, quoted = fast_csv.find_fields(
+        buffer, starts, ends, max([name_column, code_column, date_column] + metric_columns) + 1)
+    plain = ~quoted
+
+    codes = fast_csv.extract_strings(buffer, field_starts[plain, code_column],
+                                     field_ends[plain, code_column])
+    dates = fast_csv.parse_dates(buffer, field_starts[plain, date_column],
+                                 field_ends[plain, date_column])
+    values = {}
+    for metric, column in zip(rows.metrics, metric_columns):
+        if vaccine_classes.METRICS[metric] is np.int64:
+            parse = fast_csv.parse_integers
+        else:
+            parse = fast_csv.parse_floats
+        values[metric] = parse(buffer, field_starts[plain, column], field_ends[plain, column])
+
+    quoted_lines = np.flatnonzero(quoted)
+    quoted_rows = {}
+    if len(quoted_lines) > 0:
+        lines = [buffer[starts[line]:ends[line]].tobytes() for line in quoted_lines]
+        parsed_rows = fast_csv.parse_fields(lines, [name_column, code_column, date_column]
+                                            + metric_columns)
+        quoted_rows = dict(zip(quoted_lines.tolist(), parsed_rows))
+
+        quoted_codes = np.array([row[1].encode('UTF-8') for row in parsed_rows])
+        all_codes = np.zeros(len(starts), dtype=f'S{max(codes.itemsize, quoted_codes.itemsize)}')
+        all_codes[plain] = codes
+        all_codes[quoted] = quoted_codes
+        codes = all_codes
+
+        all_dates = np.empty(len(starts), dtype='datetime64[D]')
+        all_dates[plain] = dates
+        all_dates[quoted] = np.array([row[2][0:10] for row in parsed_rows],
+                                     dtype='datetime64[D]')
+        dates = all_dates
+
+        for i in range(len(rows.metrics)):
+            metric = rows.metrics[i]
+            all_values = np.empty(len(starts), dtype=vaccine_classes.METRICS[metric])
+            all_values[plain] = values[metric]
+            all_values[quoted] = [vaccine_classes.parse_metric_value(row[3 + i], metric)
+                                  for row in parsed_rows]
+            values[metric] = all_values
+
+    # Assigns each country code the country name in its last row
+    unique_codes, first_in_reverse = np.unique(codes[::-1], return_index=True)
+    country_names = {}
+    for code, line in zip(unique_codes.tolist(), (len(codes) - 1 - first_in_reverse).tolist()):
+        if line in quoted_rows:
+            country_names[code.decode('UTF-8')] = quoted_rows[line][0]
+        else:
+            name = buffer[field_starts[line, name_column]:field_ends[line, name_column]]
+            country_names[code.decode('UTF-8')] = name.tobytes().decode('UTF-8')
+
+    rows.add_columns(codes, dates, values, country_names)
+
+
+def read_checkpoint(checkpoint_directory: str, filename: str,
+                    metrics: Optional[list[str]] = None) -> (vaccine_classes.VaccineRows, dict):
+    """Return the rows of metrics saved in the checkpoint of filename, and a dictionary with the
+    offset in bytes of the first row that has not been parsed yet, the number of rows saved and
+    the fingerprint of the blocks before block_start, the start of the last block.
+
+    The checkpoint is only valid if filename is at least offset bytes long and the bytes of its
+    last block are the same as when it was saved, so only that block is read. If there is no
+    valid checkpoint for filename with the same metrics, return empty rows and an offset of 0.
+    """
+    rows = vaccine_classes.VaccineRows(metrics)
+    empty = {'offset': 0, 'rows': 0, 'block_start': 0, 'block_fingerprint': FINGERPRINT_SEED}
+    state_filename = os.path.join(checkpoint_directory, 'state.npz')
+    if not os.path.exists(state_filename):
+        return rows, empty
+
+    with np.load(state_filename) as state:
+        if 'version' not in state.files or int(state['version']) != CHECKPOINT_VERSION \
+                or state['metrics'].tolist() != rows.metrics:
+            return rows, empty
+
+        checkpoint = {'offset': int(state['offset']), 'rows': int(state['rows']),
+                      'block_start': int(state['block_start']),
+                      'block_fingerprint': str(state['block_fingerprint'])}
+        with open(filename, 'rb') as file:
+            if file.seek(0, os.SEEK_END) < checkpoint['offset'] \
+                    or extend_fingerprint(file, checkpoint['offset'], checkpoint['block_start'],
+                                          checkpoint['block_fingerprint'])[2] \
+                    != str(state['fingerprint']):
+                return rows, empty
+
+        codes = state['codes'].tolist()
+        names = state['names'].tolist()
+        previous = {metric: state[f'previous_{metric}'] for metric in rows.metrics}
+
+    columns = {}
+    for name, dtype in get_checkpoint_columns(rows.metrics).items():
+        columns[name] = np.fromfile(os.path.join(checkpoint_directory, name + '.bin'),
+                                    dtype=dtype, count=checkpoint['rows'])
+        if len(columns[name]) != checkpoint['rows']:
+            return rows, empty
+
+    rows.codes = codes
+    rows.country_names = dict(zip(codes, names))
+    rows.ids = columns['ids']
+    rows.dates = columns['dates']
+    for metric in rows.metrics:
+        rows.columns[metric] = columns[f'column_{metric}']
+        rows.previous[metric] = previous[metric]
+
+    return rows, checkpoint
+
+
+def write_checkpoint(checkpoint_directory: str, filename: str,
+                     rows: vaccine_classes.VaccineRows, checkpoint: dict, offset: int) -> None:
+    """Save rows, which were parsed from the first offset bytes of filename, as the checkpoint
+    of filename, where checkpoint is the dictionary read_checkpoint returned for the rows it
+    started from.
+
+    Only the rows and bytes added since that checkpoint are written and hashed. The rows are
+    appended to the column files first, and the state that says how many of them are valid is
+    replaced last, so the checkpoint is never left half written.
+    """
+    with open(filename, 'rb') as file:
+        block_start, block_fingerprint, fingerprint = extend_fingerprint(
+            file, offset, checkpoint['block_start'], checkpoint['block_fingerprint'])
+
+    os.makedirs(checkpoint_directory, exist_ok=True)
+    columns = {'ids': rows.ids, 'dates': rows.dates}
+    for metric in rows.metrics:
+        columns[f'column_{metric}'] = rows.columns[metric]
+
+    for name, dtype in get_checkpoint_columns(rows.metrics).items():
+        # Drops any rows written after the saved state by a run that did not finish
+        with open(os.path.join(checkpoint_directory, name + '.bin'), 'ab') as file:
+            file.truncate(checkpoint['rows'] * np.dtype(dtype).itemsize)
+            columns[name][checkpoint['rows']:].astype(dtype).tofile(file)
+
+    file_descriptor, temporary_path = tempfile.mkstemp(dir=checkpoint_directory, suffix='.tmp')
+    with os.fdopen(file_descriptor, 'wb') as file:
+        np.savez(file, version=CHECKPOINT_VERSION, offset=offset, rows=len(rows.ids),
+                 block_start=block_start, block_fingerprint=block_fingerprint,
+                 fingerprint=fingerprint, metrics=np.array(rows.metrics, dtype=str),
+                 codes=np.array(rows.codes, dtype=str),
+                 names=np.array([rows.country_names[code] for code in rows.codes], dtype=str),
+                 **{f'previous_{metric}': rows.previous[metric] for metric in rows.metrics})
+    os.replace(temporary_path, os.path.join(checkpoint_directory, 'state.npz'))
+
+
+def get_checkpoint_columns(metrics: [str]) -> {str: np.dtype}:
+    """Return the name of each column file of a checkpoint of metrics mapped to its type.
+    """
+    columns = {'ids': np.dtype(np.int64), 'dates': np.dtype('datetime64[D]')}
+    for metric in metrics:
+        columns[f'column_{metric}'] = np.dtype(vaccine_classes.METRICS[metric])
+
+    return columns
+
+
+def extend_fingerprint(file: BinaryIO, offset: int, block_start: int = 0,
+                       block_fingerprint: str = FINGERPRINT_SEED) -> (int, str, str):
+    """Return the start of the last block of the first offset bytes of file, the fingerprint
+    of the blocks before it and the fingerprint of all the first offset bytes, where
+    block_fingerprint is the fingerprint of the blocks before block_start.
+
+    The bytes are split into blocks of FINGERPRINT_BLOCK_SIZE, and the fingerprint of each block
+    is the hash of the fingerprint before it and the bytes of the block. Only the blocks from
+    block_start are read, so a fingerprint is extended over the bytes appended to file without
+    reading the earlier bytes again.
+
+    Preconditions:
+        - block_start % FINGERPRINT_BLOCK_SIZE == 0
+        - block_start <= max(0, offset - 1)
+
+    >>> import io
+    >>> data = b'a,1\\n' * FINGERPRINT_BLOCK_SIZE
+    >>> start, block_fingerprint, _ = extend_fingerprint(io.BytesIO(data), 3 * len(data) // 4)
+    >>> extend_fingerprint(io.BytesIO(data), len(data), start, block_fingerprint) \
+    == extend_fingerprint(io.BytesIO(data), len(data))
+    True
+    >>> edited = data[:-5] + b'b' + data[-4:]
+    >>> extend_fingerprint(io.BytesIO(edited), len(data))[2] \
+    == extend_fingerprint(io.BytesIO(data), len(data))[2]
+    False
+    """
+    last_start = max(0, (offset - 1) // FINGERPRINT_BLOCK_SIZE * FINGERPRINT_BLOCK_SIZE)
+    file.seek(block_start)
+
+    for _ in range(block_start, last_start, FINGERPRINT_BLOCK_SIZE):
+        block = file.read(FINGERPRINT_BLOCK_SIZE)
+        block_fingerprint = hashlib.sha256(block_fingerprint.encode('UTF-8') + block).hexdigest()
+
+    last_block = file.read(offset - last_start)
+    fingerprint = hashlib.sha256(block_fingerprint.encode('UTF-8') + last_block).hexdigest()
+
+    return last_start, block_fingerprint, fingerprint
 
 
 def read_continent_data(filename: str) -> {str: [str]}:
@@ -114,16 +408,7 @@ def read_country_names(filename: str) -> {str: str}:
     >>> read_country_names('datasets/country_vaccinations.csv')['AFG']
     'Afghanistan'
     """
-    country_data = {}
-
-    with open(filename) as file:
-        reader = csv.reader(file)
-        next(reader)
-        for row in reader:
-            # Assigns the country name to the country code
-            country_data[row[1]] = row[0]
-
-    return country_data
+    return read_vaccine_file(filename)[1]
 
 
 if __name__ == '__main__':
@@ -139,9 +424,11 @@ if __name__ == '__main__':
 
     import python_ta
     python_ta.check_all(config={
-        'extra-imports': ['csv', 'datetime'],  # the names (strs) of imported modules
-        'allowed-io': ['read_continent_data', 'read_coordinate_data', 'read_vaccine_data',
-                       'read_country_names'],
+        'extra-imports': ['csv', 'datetime', 'numpy', 'vaccine_classes', 'typing', 'hashlib',
+                          'os', 'tempfile', 'fast_csv'],
+        # the names (strs) of imported modules
+        'allowed-io': ['read_continent_data', 'read_coordinate_data', 'read_vaccine_file',
+                       'read_vaccine_file_incremental', 'read_checkpoint', 'write_checkpoint'],
         # the names (strs) of functions that call print/open/input
         'max-line-length': 100,
         'disable': ['E1136']
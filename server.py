@@ -0,0 +1,418 @@
+"""CSC111 Final Project: Visualizing COVID-19 Vaccinations In the World
+Module Description
+===============================
+This module contains a local HTTP server that keeps the datasets in memory and builds the map,
+the graph of each location and the series of each location when they are requested.
+
+The server answers these paths:
+    - /                                The map. The query can contain date=YYYY-MM-DD to show
+                                       the totals as of a date, slider=1 to add the time slider
+                                       choropleth, cluster=1 to cluster the markers and
+                                       tiles=light, dark or streets.
+    - /graphs/<kind>/<identifier>.jpg  The graph of a location, where kind is countries or
+                                       continents and identifier is the country code or the
+                                       continent name.
+    - /series/<kind>/<identifier>.json The dates and values of the metric of a location.
+
+Every response is cached in memory and sent with an ETag, so a browser that already has it
+gets an empty 304 response. The datasets are loaded again, and the cached responses dropped,
+when one of the dataset files changes. They are loaded in a background thread, and requests
+keep being answered from the datasets loaded before until the new ones are ready, or if the new
+ones cannot be loaded.
+
+Copyright and Usage Information
+===============================
+
+This file is Copyright (c) 2021 Zachary Lee.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+import datetime
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import folium
+import charts
+import derived_metrics
+import graph_cache
+import process_vaccine_data
+import vaccine_classes
+import visualize_vaccinations
+
+# The minimum time between two checks for changes to the dataset files, in seconds
+RELOAD_INTERVAL = 1.0
+
+# The maximum number of responses kept in memory
+MAX_RESPONSES = 256
+
+# The tile sets that can be selected with the tiles query parameter
+TILES = {'light': 'cartodbpositron', 'dark': 'cartodbdark_matter', 'streets': 'openstreetmap'}
+
+CONTENT_TYPES = {'html': 'text/html; charset=utf-8', 'jpg': 'image/jpeg',
+                 'json': 'application/json'}
+
+
+class MapServer:
+    """ The state of a server that builds the map, graphs and series of the datasets on request.
+    Instance Attributes:
+        - filenames: A dictionary of vaccine, coordinate, continent, country_json and
+          continent_json mapped to the filenames of those datasets.
+        - dataset: The datasets that are currently loaded.
+        - cache: The cache of rendered graphs, or None if graphs are not cached on disk.
+        - checkpoint_directory: The checkpoint of the vaccine dataset, or None.
+        - snapshot_directory: The directory of the snapshot of the datasets, or None.
+        - geometry_directory: The directory the simplified borders are cached in, or None.
+        - metric: The column of the vaccine dataset that the map and graphs show.
+        - derived: The metrics derived from the series of the countries and continents of the
+          dataset, if metric is in CUMULATIVE_METRICS. They are updated from the days that
+          changed when the datasets are loaded again.
+
+    Representation Invariants:
+        - all(name in self.filenames for name in ['vaccine', 'coordinate', 'continent', \
+        'country_json', 'continent_json'])
+        - self.metric in vaccine_classes.METRICS
+    >>> map_server = MapServer({'vaccine': 'datasets/country_vaccinations.csv', \
+    'coordinate': 'datasets/countries_codes_and_coordinates.csv', \
+    'continent': 'datasets/country-and-continent-codes-list-csv_csv.csv', \
+    'country_json': 'datasets/countries.geojson', 'continent_json': 'datasets/continents.json'})
+    >>> etag, content_type, body = map_server.get_response('/series/countries/AFG.json', {})
+    >>> json.loads(body)['total_vaccinations'][0]
+    0
+    >>> rate_server = MapServer(map_server.filenames, metric='people_fully_vaccinated_per_hundred')
+    >>> body = rate_server.get_response('/series/countries/ISR.json', {})[2]
+    >>> json.loads(body)['people_fully_vaccinated_per_hundred'][-1]
+    53.24
+    >>> map_server.get_response('/series/countries/AFG.json', {})[0] == etag
+    True
+    >>> map_server.get_response('/series/countries/XYZ.json', {}) is None
+    True
+    """
+    filenames: {str: str}
+    dataset: vaccine_classes.VaccineDataset
+    cache: Optional[graph_cache.GraphCache]
+    checkpoint_directory: Optional[str]
+    snapshot_directory: Optional[str]
+    geometry_directory: Optional[str]
+    metric: str
+    derived: {str: derived_metrics.DerivedMetrics}
+    _locations: {(str, str): vaccine_classes.Location}
+    _responses: {str: (str, str, bytes)}
+    _signature: list
+    _last_check: float
+    _reloading: bool
+    _lock: threading.Lock
+    _render_lock: threading.Lock
+
+    def __init__(self, filenames: {str: str}, cache: Optional[graph_cache.GraphCache] = None,
+                 checkpoint_directory: Optional[str] = None,
+                 snapshot_directory: Optional[str] = None,
+                 geometry_directory: Optional[str] = None,
+                 metric: str = vaccine_classes.DEFAULT_METRIC) -> None:
+        """Initialize a new server state and load the datasets in filenames.
+        """
+        self.filenames = filenames
+        self.cache = cache
+        self.checkpoint_directory = checkpoint_directory
+        self.snapshot_directory = snapshot_directory
+        self.geometry_directory = geometry_directory
+        self.metric = metric
+        self._responses = {}
+        self.derived = {}
+        self._reloading = False
+        self._lock = threading.Lock()
+        self._render_lock = threading.Lock()
+
+        self._last_check = time.monotonic()
+        self.load()
+
+    def has_continents(self) -> bool:
+        """Return whether the continents are shown, which is only the case if self.metric is a
+        count, since rates cannot be added up across countries.
+        """
+        return self.metric in vaccine_classes.COUNT_METRICS
+
+    def load(self) -> None:
+        """Load the datasets, derive their metrics and then drop every cached response.
+
+        Everything is loaded without holding the lock, so the requests are answered from the
+        datasets loaded before until the new ones replace them. Only one load runs at a time.
+        """
+        signature = self.get_signature()
+        dataset = process_vaccine_data.load_dataset(
+            self.filenames['vaccine'], self.filenames['coordinate'], self.filenames['continent'],
+            self.checkpoint_directory, self.snapshot_directory,
+            vaccine_classes.get_load_metrics(self.metric))
+
+        locations = {}
+        for country in dataset.countries:
+            locations[('countries', country.identifier)] = country
+        if self.has_continents():
+            for continent in dataset.continents:
+                locations[('continents', continent.name)] = continent
+
+        indexes = {}
+        if self.metric in derived_metrics.CUMULATIVE_METRICS:
+            indexes['countries'] = dataset.get_country_index(self.metric)
+            if self.has_continents():
+                indexes['continents'] = dataset.get_continent_index(self.metric)
+
+        derived = {}
+        for kind, index in indexes.items():
+            if kind in self.derived:
+                derived[kind] = self.derived[kind].update(index)
+            else:
+                derived[kind] = derived_metrics.compute_derived_metrics(index)
+
+        with self._lock:
+            self.dataset = dataset
+            self.derived = derived
+            self._locations = locations
+            self._signature = signature
+            self._responses = {}
+
+    def get_signature(self) -> list:
+        """Return the size and modification time of each dataset file, or None for a file that
+        does not exist.
+        """
+        signature = []
+
+        for name in sorted(self.filenames):
+            try:
+                stat = os.stat(self.filenames[name])
+                signature.append((stat.st_size, stat.st_mtime_ns))
+            except FileNotFoundError:
+                signature.append(None)
+
+        return signature
+
+    def reload_if_changed(self) -> None:
+        """Start loading the datasets again in a background thread if one of the files changed
+        since they were loaded. The files are checked at most once every RELOAD_INTERVAL
+        seconds, and not while they are being loaded again.
+        """
+        with self._lock:
+            if self._reloading or time.monotonic() - self._last_check < RELOAD_INTERVAL:
+                return
+
+            self._last_check = time.monotonic()
+            if self.get_signature() == self._signature:
+                return
+            self._reloading = True
+
+        threading.Thread(target=self.reload, daemon=True).start()
+
+    def reload(self) -> None:
+        """Load the datasets again. If that raises an error, the error is printed and the
+        datasets loaded before are kept, so the files are checked again after RELOAD_INTERVAL
+        seconds.
+        """
+        try:
+            self.load()
+        except (OSError, ValueError) as error:
+            print(f'The datasets could not be loaded again: {error}', file=sys.stderr)
+        finally:
+            with self._lock:
+                self._reloading = False
+
+    def get_response(self, path: str, query: {str: [str]}) -> Optional[tuple[str, str, bytes]]:
+        """Return the ETag, content type and body of the response to a request for path with
+        the given query parameters, or None if there is nothing at path.
+
+        Raise ValueError if a query parameter is not valid.
+        """
+        options = get_map_options(query) if path == '/' else {}
+        key = path + '?' + json.dumps(options, sort_keys=True)
+        self.reload_if_changed()
+
+        with self._lock:
+            if key in self._responses:
+                return self._responses[key]
+            dataset, locations, derived = self.dataset, self._locations, self.derived
+
+        # The response is created without holding the lock, so a slow response does not hold up
+        # the requests for responses that are already cached
+        response = self.create_response(dataset, locations, derived, path, options)
+        if response is None:
+            return None
+
+        etag = hashlib.sha256(response[1]).hexdigest()[:32]
+        with self._lock:
+            # The response is not cached if the datasets were loaded again in the meantime
+            if self.dataset is dataset:
+                if len(self._responses) >= MAX_RESPONSES:
+                    # Dictionaries keep insertion order, so the first key is the oldest response
+                    del self._responses[next(iter(self._responses))]
+                self._responses[key] = (etag, response[0], response[1])
+
+        return etag, response[0], response[1]
+
+    def create_response(self, dataset: vaccine_classes.VaccineDataset,
+                        locations: {(str, str): vaccine_classes.Location},
+                        derived: {str: derived_metrics.DerivedMetrics}, path: str,
+                        options: dict) -> Optional[tuple[str, bytes]]:
+        """Return the content type and body of the response to a request for path, where
+        locations maps the kind and identifier of each location in dataset to the location and
+        derived contains the metrics derived from dataset, or None if there is nothing at path.
+        """
+        if path == '/':
+            return CONTENT_TYPES['html'], self.build_map(dataset, derived, options)
+
+        parts = path.strip('/').split('/')
+        if len(parts) != 3 or parts[0] not in ('graphs', 'series'):
+            return None
+
+        identifier, _, extension = unquote(parts[2]).rpartition('.')
+        location = locations.get((parts[1], identifier))
+        if location is None or (parts[0], extension) not in (('graphs', 'jpg'),
+                                                             ('series', 'json')):
+            return None
+
+        if parts[0] == 'graphs':
+            with self._render_lock:
+                image = charts.render_graphs([location], processes=1, cache=self.cache,
+                                             metric=self.metric)[0]
+            return CONTENT_TYPES['jpg'], image
+        else:
+            series = location.get_series(self.metric)
+            body = json.dumps({'name': location.name,
+                               'dates': [str(date) for date in series.dates.tolist()],
+                               self.metric: series.values.tolist()})
+            return CONTENT_TYPES['json'], body.encode('UTF-8')
+
+    def build_map(self, dataset: vaccine_classes.VaccineDataset,
+                  derived: {str: derived_metrics.DerivedMetrics}, options: dict) -> bytes:
+        """Return the HTML of the map with the given options, where derived contains the
+        metrics derived from dataset. The popups link to the graphs served by this server, so
+        no graph is rendered until its popup is opened.
+        """
+        date = None if options['date'] is None else datetime.date.fromisoformat(options['date'])
+
+        metric = self.metric
+
+        folium_map = folium.Map(location=[0, 0], zoom_start=2, tiles=TILES[options['tiles']])
+        visualize_vaccinations.add_country_data(dataset, self.filenames['country_json'],
+                                                folium_map, self.geometry_directory, date,
+                                                metric=metric)
+        if self.has_continents():
+            visualize_vaccinations.add_continent_data(
+                dataset, self.filenames['continent_json'], folium_map, self.geometry_directory,
+                date, metric=metric)
+        if 'countries' in derived:
+            visualize_vaccinations.add_country_derived_data(
+                dataset, self.filenames['country_json'], folium_map, derived['countries'],
+                self.geometry_directory, date, metric=metric)
+        if options['slider']:
+            visualize_vaccinations.add_country_time_slider(
+                dataset, self.filenames['country_json'], folium_map,
+                geometry_directory=self.geometry_directory, metric=metric)
+
+        visualize_vaccinations.add_graph_markers_country(
+            dataset, folium_map,
+            graph_url=lambda country: f'graphs/countries/{quote(country.identifier)}.jpg',
+            metric=metric, clustered=options['cluster'], derived=derived.get('countries'))
+        if self.has_continents():
+            visualize_vaccinations.add_graph_markers_continent(
+                dataset, folium_map,
+                graph_url=lambda continent: f'graphs/continents/{quote(continent.name)}.jpg',
+                metric=metric, clustered=options['cluster'], derived=derived.get('continents'))
+        folium.LayerControl().add_to(folium_map)
+
+        return folium_map.get_root().render().encode('UTF-8')
+
+
+class MapRequestHandler(BaseHTTPRequestHandler):
+    """ A handler of the requests to a map server.
+    """
+
+    def do_GET(self) -> None:
+        """Answer a GET request.
+        """
+        url = urlsplit(self.path)
+
+        try:
+            response = self.server.map_server.get_response(url.path, parse_qs(url.query))
+        except ValueError as error:
+            self.send_error(400, str(error))
+            return
+
+        if response is None:
+            self.send_error(404)
+            return
+
+        etag, content_type, body = response
+        if self.headers.get('If-None-Match') == f'"{etag}"':
+            self.send_response(304)
+            self.send_header('ETag', f'"{etag}"')
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', f'"{etag}"')
+        # Browsers check with the server before reusing a response, since the data can change
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def get_map_options(query: {str: [str]}) -> dict:
+    """Return the map options in query, with the default for each missing option.
+
+    Raise ValueError if an option is not valid.
+
+    >>> get_map_options({'date': ['2021-03-01'], 'tiles': ['dark']})
+    {'date': '2021-03-01', 'slider': False, 'cluster': False, 'tiles': 'dark'}
+    """
+    date = query.get('date', [None])[0]
+    if date is not None:
+        date = datetime.date.fromisoformat(date).isoformat()
+
+    tiles = query.get('tiles', ['light'])[0]
+    if tiles not in TILES:
+        raise ValueError(f'unknown tiles: {tiles!r}')
+
+    return {'date': date, 'slider': query.get('slider', ['0'])[0] == '1',
+            'cluster': query.get('cluster', ['0'])[0] == '1', 'tiles': tiles}
+
+
+def serve(map_server: MapServer, port: int, host: str = 'localhost') -> None:
+    """Answer requests to map_server on host and port until the program is interrupted.
+    """
+    http_server = ThreadingHTTPServer((host, port), MapRequestHandler)
+    http_server.map_server = map_server
+
+    try:
+        http_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        http_server.server_close()
+
+
+if __name__ == '__main__':
+    # You can uncomment the following lines for code checking/debugging purposes.
+    # However, we recommend commenting out these lines when working with the large
+    # datasets, as checking representation invariants and preconditions greatly
+    # increases the running time of the functions/methods.
+    # import python_ta.contracts
+    # python_ta.contracts.check_all_contracts()
+
+    import doctest
+    doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'extra-imports': ['http.server', 'typing', 'urllib.parse', 'datetime', 'hashlib', 'json',
+                          'os', 'sys', 'threading', 'time', 'folium', 'charts', 'derived_metrics',
+                          'graph_cache', 'process_vaccine_data', 'vaccine_classes',
+                          'visualize_vaccinations'],
+        # the names (strs) of imported modules
+        'allowed-io': ['reload'],  # the names (strs) of functions that call print/open/input
+        'max-line-length': 100,
+        'disable': ['E1136']
+    })
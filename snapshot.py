@@ -0,0 +1,297 @@
+"""CSC111 Final Project: Visualizing COVID-19 Vaccinations In the World
+Module Description
+===============================
+This module contains functions that save the parsed datasets as a binary snapshot and load them
+back, so that the CSV files only have to be parsed again when they change.
+
+A snapshot is a directory containing a meta.json file and one .npy file for the dates and for
+each metric of the vaccine data. The columns are memory mapped when the snapshot is loaded, so
+the series of each country is a view into the file instead of a copy.
+
+Every snapshot saved in a snapshot directory is a generation in its own subdirectory, and the
+file called current names the generation that is loaded. Builds running at the same time each
+write their own generation and switch to it by replacing that file, so a build never removes
+the files another build has just written or is still loading.
+
+Copyright and Usage Information
+===============================
+
+This file is Copyright (c) 2021 Zachary Lee.
+"""
+from typing import Optional
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+import numpy as np
+import vaccine_classes
+
+# The version of the snapshot format, which is increased whenever the format changes
+SNAPSHOT_VERSION = 3
+
+# The number of seconds a generation that is no longer current is kept for, so that the builds
+# that started loading it before it was replaced can finish
+GENERATION_LIFETIME = 60.0
+
+
+def save_snapshot(directory: str, source_filenames: [str],
+                  vaccine_data: {str: vaccine_classes.VaccineSeries}, country_names: {str: str},
+                  coordinate_data: {str: [float, float]}, continent_data: {str: [str]}) -> None:
+    """Save the parsed datasets as a snapshot in directory. The snapshot stays valid until one of
+    the files in source_filenames changes.
+
+    The snapshot is written to a new generation, which is only made current once every file
+    in it is written, so a snapshot that is being loaded is never partially written. The
+    generations that have not been current for GENERATION_LIFETIME seconds are then removed.
+
+    Every series in vaccine_data must have the same metrics, which are saved in the order of the
+    columns of the series.
+
+    Preconditions:
+        - directory != ''
+        - all(code in country_names for code in vaccine_data)
+    """
+    token = uuid.uuid4().hex
+    generation = os.path.join(directory, token)
+    os.makedirs(generation)
+    codes = list(vaccine_data)
+    lengths = [len(vaccine_data[code]) for code in codes]
+    metric, metrics = get_metrics(vaccine_data)
+
+    columns = {'dates': np.concatenate([vaccine_data[code].dates for code in codes]
+                                       + [np.array([], dtype='datetime64[D]')])}
+    for name in metrics:
+        columns[name] = np.concatenate(
+            [vaccine_data[code].columns[name] for code in codes]
+            + [np.array([], dtype=vaccine_classes.METRICS[name])])
+
+    for column in columns:
+        np.save(os.path.join(generation, f'{column}.npy'), columns[column])
+
+    meta = {
+        'version': SNAPSHOT_VERSION,
+        'sources': {os.path.abspath(filename): create_source_record(filename)
+                    for filename in source_filenames},
+        'metric': metric,
+        'metrics': metrics,
+        'codes': codes,
+        'names': [country_names[code] for code in codes],
+        'offsets': np.cumsum([0] + lengths).tolist(),
+        'coordinates': coordinate_data,
+        'continents': continent_data
+    }
+    write_meta(generation, meta)
+
+    # The generation that was current is marked as replaced now, so it is kept for
+    # GENERATION_LIFETIME seconds from now
+    previous = read_current(directory)
+    file_descriptor, temporary_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(file_descriptor, 'w') as file:
+        file.write(token)
+    os.replace(temporary_path, os.path.join(directory, 'current'))
+    if previous is not None:
+        try:
+            os.utime(os.path.join(directory, previous))
+        except FileNotFoundError:
+            pass
+
+    remove_old_generations(directory)
+
+
+def read_current(directory: str) -> Optional[str]:
+    """Return the name of the current generation of the snapshots in directory, or None if
+    there is none.
+    """
+    try:
+        with open(os.path.join(directory, 'current')) as file:
+            return file.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def remove_old_generations(directory: str) -> None:
+    """Remove every generation of the snapshots in directory, other than the current one, that
+    was last written or replaced more than GENERATION_LIFETIME seconds ago.
+
+    A generation that cannot be removed, such as one that is still memory mapped on a system
+    that does not allow that, is removed by a later call.
+
+    >>> directory = tempfile.mkdtemp()
+    >>> save_snapshot(directory, [], {}, {}, {}, {})
+    >>> old = read_current(directory)
+    >>> os.utime(os.path.join(directory, old), (0, 0))
+    >>> save_snapshot(directory, [], {}, {}, {}, {})
+    >>> os.path.exists(os.path.join(directory, old))
+    True
+    >>> os.utime(os.path.join(directory, old), (0, 0))
+    >>> remove_old_generations(directory)
+    >>> sorted(os.listdir(directory)) == sorted(['current', read_current(directory)])
+    True
+    """
+    current = read_current(directory)
+    now = time.time()
+
+    for entry in os.scandir(directory):
+        if entry.is_dir() and entry.name != current \
+                and now - entry.stat().st_mtime > GENERATION_LIFETIME:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def load_snapshot(directory: str, source_filenames: [str],
+                  metrics: Optional[list[str]] = None) -> Optional[tuple]:
+    """Return a tuple containing the vaccine data, country names, coordinate data and continent
+    data saved in the snapshot in directory, or None if there is no snapshot, the snapshot does
+    not have the same metrics, or one of the files in source_filenames changed since it was
+    saved. If metrics is None, the snapshot must only have DEFAULT_METRIC.
+
+    >>> import read_data
+    >>> directory = tempfile.mkdtemp()
+    >>> sources = ['datasets/country_vaccinations.csv']
+    >>> vaccine_data, country_names = read_data.read_vaccine_file(sources[0])
+    >>> save_snapshot(directory, sources, vaccine_data, country_names, {}, {})
+    >>> snapshot = load_snapshot(directory, sources)
+    >>> snapshot[0]['AFG'] == vaccine_data['AFG']
+    True
+    >>> snapshot[1]['AFG']
+    'Afghanistan'
+    """
+    token = read_current(directory)
+    if token is None:
+        return None
+
+    generation = os.path.join(directory, token)
+    try:
+        with open(os.path.join(generation, 'meta.json')) as file:
+            meta = json.load(file)
+    except FileNotFoundError:
+        return None
+
+    if metrics is None:
+        metrics = [vaccine_classes.DEFAULT_METRIC]
+
+    sources = {os.path.abspath(filename) for filename in source_filenames}
+    if meta['version'] != SNAPSHOT_VERSION or set(meta['sources']) != sources \
+            or meta['metrics'] != metrics:
+        return None
+
+    changed = False
+    for filename in sources:
+        valid, updated = check_source_record(filename, meta['sources'][filename])
+        if not valid:
+            return None
+        elif updated is not None:
+            meta['sources'][filename] = updated
+            changed = True
+
+    # A source file was touched without changing its contents, so the new modification time is
+    # recorded to avoid hashing it again next time
+    if changed:
+        write_meta(generation, meta)
+
+    try:
+        columns = {name: np.load(os.path.join(generation, f'{name}.npy'), mmap_mode='r')
+                   for name in ['dates'] + metrics}
+    except FileNotFoundError:
+        return None
+
+    codes = meta['codes']
+    offsets = meta['offsets']
+    vaccine_data = {}
+    for i in range(len(codes)):
+        location_columns = {name: columns[name][offsets[i]:offsets[i + 1]] for name in metrics}
+        vaccine_data[codes[i]] = vaccine_classes.VaccineSeries(
+            columns['dates'][offsets[i]:offsets[i + 1]], location_columns[meta['metric']],
+            location_columns, meta['metric'])
+    country_names = dict(zip(codes, meta['names']))
+
+    return vaccine_data, country_names, meta['coordinates'], meta['continents']
+
+
+def get_metrics(vaccine_data: {str: vaccine_classes.VaccineSeries}) -> (str, [str]):
+    """Return the metric of the series in vaccine_data and the names of their columns, or
+    DEFAULT_METRIC alone if vaccine_data is empty.
+    """
+    if len(vaccine_data) == 0:
+        return vaccine_classes.DEFAULT_METRIC, [vaccine_classes.DEFAULT_METRIC]
+
+    series = next(iter(vaccine_data.values()))
+
+    return series.metric, list(series.columns)
+
+
+def create_source_record(filename: str) -> {str: object}:
+    """Return the size, modification time and hash of the file called filename.
+    """
+    stat = os.stat(filename)
+
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': hash_file(filename)}
+
+
+def check_source_record(filename: str, record: {str: object}) -> (bool, Optional[dict]):
+    """Return whether the file called filename still has the contents described by record, and
+    an updated record if only its modification time changed.
+
+    The file is only hashed when its size is unchanged but its modification time is not.
+    """
+    try:
+        stat = os.stat(filename)
+    except FileNotFoundError:
+        return False, None
+
+    if stat.st_size != record['size']:
+        return False, None
+    elif stat.st_mtime_ns == record['mtime_ns']:
+        return True, None
+    elif hash_file(filename) == record['sha256']:
+        return True, {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                      'sha256': record['sha256']}
+    else:
+        return False, None
+
+
+def hash_file(filename: str) -> str:
+    """Return the SHA-256 hash of the contents of the file called filename.
+    """
+    digest = hashlib.sha256()
+
+    with open(filename, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def write_meta(directory: str, meta: dict) -> None:
+    """Replace the meta.json file of the snapshot in directory with meta.
+    """
+    file_descriptor, temporary_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(file_descriptor, 'w') as file:
+        json.dump(meta, file)
+    os.replace(temporary_path, os.path.join(directory, 'meta.json'))
+
+
+if __name__ == '__main__':
+    # You can uncomment the following lines for code checking/debugging purposes.
+    # However, we recommend commenting out these lines when working with the large
+    # datasets, as checking representation invariants and preconditions greatly
+    # increases the running time of the functions/methods.
+    # import python_ta.contracts
+    # python_ta.contracts.check_all_contracts()
+
+    import doctest
+    doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'extra-imports': ['typing', 'hashlib', 'json', 'os', 'shutil', 'tempfile', 'time',
+                          'uuid', 'numpy', 'vaccine_classes'],
+        # the names (strs) of imported modules
+        'allowed-io': ['save_snapshot', 'load_snapshot', 'hash_file', 'write_meta',
+                       'read_current'],
+        # the names (strs) of functions that call print/open/input
+        'max-line-length': 100,
+        'disable': ['E1136']
+    })
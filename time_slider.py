@@ -0,0 +1,199 @@
+"""CSC111 Final Project: Visualizing COVID-19 Vaccinations In the World
+Module Description
+===============================
+This module contains a choropleth layer with a slider that shows the vaccination data on each
+day.
+
+The colour of every location on every day is precomputed as a bucket index and stored in a
+single matrix with one byte per location and day. The matrix is embedded in the map once, in
+base64, next to a single copy of the GeoJSON, and the browser recolours the features when the
+slider moves. The size of the map therefore grows with the number of locations times the
+number of days instead of with the size of the geometry times the number of days.
+
+Copyright and Usage Information
+===============================
+
+This file is Copyright (c) 2021 Zachary Lee.
+"""
+import base64
+import datetime
+from branca.element import Template
+import folium
+import numpy as np
+
+# The bucket index of a location that has no data on a day
+NO_DATA = 255
+
+
+class TimeSliderChoropleth(folium.map.Layer):
+    """ A choropleth layer with a slider that selects the day whose data is shown.
+    Instance Attributes:
+        - data: The GeoJSON data of the features.
+        - key: The name of the feature property that contains the location identifier.
+        - rows: The location identifiers mapped to their row in the bucket matrix.
+        - matrix: The bucket matrix, encoded in base64, with a row for each location and a
+          column for each day.
+        - day_count: The number of days in the matrix.
+        - start_day: The first day in the matrix, as the number of days since 1970-01-01.
+        - colors: The colour of each bucket.
+        - no_data_color: The colour of a location on a day it has no data, or that is not in
+          the matrix.
+
+    Representation Invariants:
+        - self.day_count > 0
+        - len(self.colors) < NO_DATA
+    """
+    data: dict
+    key: str
+    rows: {str: int}
+    matrix: str
+    day_count: int
+    start_day: int
+    colors: [str]
+    no_data_color: str
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = (function() {
+            var rows = {{ this.rows|tojson }};
+            var colors = {{ this.colors|tojson }};
+            var dayCount = {{ this.day_count }};
+            var startDay = {{ this.start_day }};
+            var encoded = atob({{ this.matrix|tojson }});
+            var buckets = new Uint8Array(encoded.length);
+            for (var i = 0; i < encoded.length; i++) {
+                buckets[i] = encoded.charCodeAt(i);
+            }
+
+            var features = [];
+            var layer = L.geoJson({{ this.data|tojson }}, {
+                style: function() {
+                    return {fillColor: {{ this.no_data_color|tojson }}, fillOpacity: 0.7,
+                            color: 'black', weight: 1, opacity: 0.5};
+                },
+                onEachFeature: function(feature, featureLayer) {
+                    var row = rows[feature.properties[{{ this.key|tojson }}]];
+                    if (row !== undefined) {
+                        features.push([row * dayCount, featureLayer]);
+                    }
+                }
+            });
+
+            function showDay(day) {
+                for (var i = 0; i < features.length; i++) {
+                    var bucket = buckets[features[i][0] + day];
+                    features[i][1].setStyle({fillColor: bucket < colors.length ?
+                        colors[bucket] : {{ this.no_data_color|tojson }}});
+                }
+                var date = new Date((startDay + day) * 86400000);
+                label.innerHTML = date.toISOString().slice(0, 10);
+            }
+
+            var slider = L.DomUtil.create('input');
+            slider.type = 'range';
+            slider.min = 0;
+            slider.max = dayCount - 1;
+            slider.value = dayCount - 1;
+            slider.style.width = '300px';
+            var label = L.DomUtil.create('div');
+            var control = L.control({position: 'bottomleft'});
+            var parent = {{ this._parent.get_name() }};
+            control.onAdd = function() {
+                var container = L.DomUtil.create('div', 'leaflet-bar');
+                container.style.background = 'white';
+                container.style.padding = '4px 8px';
+                container.appendChild(slider);
+                container.appendChild(label);
+                L.DomEvent.disableClickPropagation(container);
+                return container;
+            };
+            // The slider is only shown while the layer is on the map
+            layer.on('add', function() {
+                control.addTo(parent);
+            });
+            layer.on('remove', function() {
+                control.remove();
+            });
+            slider.addEventListener('input', function() {
+                showDay(parseInt(slider.value));
+            });
+            showDay(dayCount - 1);
+            if ({{ this.show|tojson }}) {
+                layer.addTo(parent);
+            }
+
+            return layer;
+        })();
+        {% endmacro %}
+        """)
+
+    def __init__(self, data: dict, key: str, codes: [str], buckets: np.ndarray,
+                 start_date: datetime.date, colors: [str], no_data_color: str = '#d9d9d9',
+                 name: str = 'Time Slider Choropleth', show: bool = False) -> None:
+        """Initialize a new layer for the features in data, where the bucket of the location
+        codes[i] on the j-th day after start_date is buckets[i, j].
+
+        Preconditions:
+            - buckets.shape == (len(codes), buckets.shape[1])
+            - buckets.shape[1] > 0
+            - buckets.dtype == np.uint8
+        """
+        super().__init__(name=name, overlay=True, show=show)
+        self._name = 'TimeSliderChoropleth'
+        self.data = data
+        self.key = key
+        self.rows = {codes[i]: i for i in range(len(codes))}
+        self.matrix = base64.b64encode(np.ascontiguousarray(buckets).tobytes()).decode('ascii')
+        self.day_count = buckets.shape[1]
+        self.start_day = int(np.datetime64(start_date, 'D').astype(np.int64))
+        self.colors = colors
+        self.no_data_color = no_data_color
+
+
+def create_buckets(totals: np.ndarray, thresholds: np.ndarray) -> np.ndarray:
+    """Return the bucket index of each total as a uint8 array of the same shape, where bucket i
+    contains the totals from thresholds[i] up to thresholds[i + 1]. Totals that are NaN, which
+    are the days a location has no data, are in the NO_DATA bucket.
+
+    Preconditions:
+        - 2 <= len(thresholds) <= NO_DATA
+
+    >>> create_buckets(np.array([[np.nan, 0, 5, 10, 25]]), np.array([0, 10, 20, 30])).tolist()
+    [[255, 0, 0, 1, 2]]
+    """
+    buckets = np.searchsorted(thresholds[1:-1], totals, side='right').astype(np.uint8)
+    buckets[np.isnan(totals)] = NO_DATA
+
+    return buckets
+
+
+def create_thresholds(maximum: int, bins: int) -> np.ndarray:
+    """Return bins + 1 evenly spaced integer thresholds from 0 to maximum.
+
+    >>> create_thresholds(100, 4).tolist()
+    [0, 25, 50, 75, 100]
+    """
+    return np.linspace(0, max(maximum, bins), bins + 1).round().astype(np.int64)
+
+
+if __name__ == '__main__':
+    # You can uncomment the following lines for code checking/debugging purposes.
+    # However, we recommend commenting out these lines when working with the large
+    # datasets, as checking representation invariants and preconditions greatly
+    # increases the running time of the functions/methods.
+    # import python_ta.contracts
+    # python_ta.contracts.check_all_contracts()
+
+    import doctest
+    doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'extra-imports': ['base64', 'datetime', 'branca.element', 'folium',
+                          'numpy'],
+        # the names (strs) of imported modules
+        'allowed-io': [],
+        # the names (strs) of functions that call print/open/input
+        'max-line-length': 100,
+        'disable': ['E1136']
+    })
@@ -10,8 +10,513 @@ Copyright and Usage Information
 This file is Copyright (c) 2021 Zachary Lee.
 """
 from __future__ import annotations
-from typing import Optional
+from collections.abc import Mapping
+from typing import Iterable, Iterator, Optional
 import datetime
+import numpy as np
+
+# The numeric columns of the vaccine dataset that can be loaded, mapped to the type of their
+# values. The counts are integers and the rates per hundred or per million people are floats.
+METRICS = {'total_vaccinations': np.int64, 'people_vaccinated': np.int64,
+           'people_fully_vaccinated': np.int64, 'daily_vaccinations_raw': np.int64,
+           'daily_vaccinations': np.int64, 'total_vaccinations_per_hundred': np.float64,
+           'people_vaccinated_per_hundred': np.float64,
+           'people_fully_vaccinated_per_hundred': np.float64,
+           'daily_vaccinations_per_million': np.float64}
+
+# The metrics that are counts, which are the only ones that can be added up across countries
+COUNT_METRICS = [metric for metric in METRICS if METRICS[metric] is np.int64]
+
+# The metric that is loaded and shown when no other metric is chosen
+DEFAULT_METRIC = 'total_vaccinations'
+
+# The rate whose latest value is kept in the summary of each location, and the count it is a
+# rate of, which together give the population of the location
+PER_HUNDRED_METRIC = 'total_vaccinations_per_hundred'
+
+
+class VaccineSeries(Mapping):
+    """ A read-only mapping of dates to vaccinations that stores the data in columns instead of
+    one Python object per entry.
+    Instance Attributes:
+        - dates: The dates of the series in increasing order, as a datetime64[D] array.
+        - values: The value of the metric of the series on each date.
+        - metric: The name of the metric in values.
+        - columns: Every metric loaded for the series mapped to its value on each date,
+          including the metric in values.
+
+    Representation Invariants:
+        - self.dates.shape == self.values.shape
+        - self.columns[self.metric] is self.values
+        - all(self.columns[name].shape == self.dates.shape for name in self.columns)
+        - all(self.dates[i] < self.dates[i + 1] for i in range(len(self.dates) - 1))
+    >>> series = VaccineSeries.from_dict({datetime.date(2020, 12, 16): 250, \
+    datetime.date(2020, 12, 15): 100})
+    >>> series[datetime.date(2020, 12, 16)]
+    250
+    >>> list(series)
+    [datetime.date(2020, 12, 15), datetime.date(2020, 12, 16)]
+    >>> series == {datetime.date(2020, 12, 15): 100, datetime.date(2020, 12, 16): 250}
+    True
+    """
+    dates: np.ndarray
+    values: np.ndarray
+    metric: str
+    columns: {str: np.ndarray}
+
+    def __init__(self, dates: np.ndarray, values: np.ndarray,
+                 columns: Optional[dict] = None, metric: str = DEFAULT_METRIC) -> None:
+        """Initialize a new series of metric from date and value columns that are already sorted
+        by date. columns contains the other metrics loaded for the series, if there are any.
+
+        Preconditions:
+            - dates.shape == values.shape
+            - columns is None or columns[metric] is values
+        """
+        if columns is None:
+            columns = {metric: values}
+        self.dates = dates
+        self.values = values
+        self.metric = metric
+        self.columns = columns
+
+    @classmethod
+    def from_dict(cls, data: {datetime.date: int}) -> VaccineSeries:
+        """Return a new series containing the same entries as data.
+        """
+        dates = np.array(list(data.keys()), dtype='datetime64[D]')
+        values = np.array(list(data.values()), dtype=np.int64)
+        order = np.argsort(dates, kind='stable')
+
+        return cls(dates[order], values[order])
+
+    def __getitem__(self, date: datetime.date) -> int:
+        """Return the vaccinations on date, using a binary search over the dates.
+        """
+        try:
+            key = np.datetime64(date, 'D')
+        except (TypeError, ValueError):
+            raise KeyError(date) from None
+
+        index = np.searchsorted(self.dates, key)
+        if index < len(self.dates) and self.dates[index] == key:
+            return self.values[index].item()
+        raise KeyError(date)
+
+    def get_metric(self, metric: str) -> VaccineSeries:
+        """Return the series of another metric loaded with this series, on the same dates and
+        without copying its columns.
+
+        Raise KeyError if metric was not loaded.
+
+        >>> columns = {'total_vaccinations': np.array([100]), 'people_vaccinated': np.array([80])}
+        >>> series = VaccineSeries(np.array(['2021-01-01'], dtype='datetime64[D]'), \
+        columns['total_vaccinations'], columns)
+        >>> series.get_metric('people_vaccinated')[datetime.date(2021, 1, 1)]
+        80
+        """
+        return VaccineSeries(self.dates, self.columns[metric], self.columns, metric)
+
+    def get_value_at(self, date: datetime.date) -> int:
+        """Return the vaccinations on date, or on the latest date before it if date is not in
+        the series. Return 0 if date is before the first date of the series.
+
+        >>> series = VaccineSeries.from_dict({datetime.date(2021, 1, 1): 100, \
+        datetime.date(2021, 1, 5): 500})
+        >>> series.get_value_at(datetime.date(2021, 1, 3))
+        100
+        >>> series.get_value_at(datetime.date(2020, 12, 31))
+        0
+        """
+        return self.get_values_at(np.array([date], dtype='datetime64[D]'))[0].item()
+
+    def get_values_at(self, dates: np.ndarray) -> np.ndarray:
+        """Return the forward-filled vaccinations on each date in dates, as an array of the same
+        type as self.values.
+        """
+        indices = np.searchsorted(self.dates, dates.astype('datetime64[D]'), side='right') - 1
+        values = np.zeros(len(indices), dtype=self.values.dtype)
+        values[indices >= 0] = self.values[indices[indices >= 0]]
+
+        return values
+
+    def get_slice(self, start: datetime.date, end: datetime.date) -> VaccineSeries:
+        """Return the entries of the series from start to end, including both, as a new series
+        whose columns are views of the columns of this series.
+
+        >>> series = VaccineSeries.from_dict({datetime.date(2021, 1, 1): 100, \
+        datetime.date(2021, 1, 5): 500, datetime.date(2021, 1, 9): 900})
+        >>> series.get_slice(datetime.date(2021, 1, 2), datetime.date(2021, 1, 9)).values.tolist()
+        [500, 900]
+        """
+        first = np.searchsorted(self.dates, np.datetime64(start, 'D'), side='left')
+        last = np.searchsorted(self.dates, np.datetime64(end, 'D'), side='right')
+        columns = {name: self.columns[name][first:last] for name in self.columns}
+
+        return VaccineSeries(self.dates[first:last], columns[self.metric], columns, self.metric)
+
+    def __iter__(self) -> Iterator[datetime.date]:
+        """Iterate over the dates of the series in increasing order.
+        """
+        return iter(self.dates.tolist())
+
+    def __len__(self) -> int:
+        """Return the number of entries in the series.
+        """
+        return len(self.dates)
+
+    def __repr__(self) -> str:
+        """Return a string representation of the series.
+        """
+        return f'VaccineSeries({dict(self.items())!r})'
+
+
+def split_series(keys: list[str], key_ids: np.ndarray, dates: np.ndarray,
+                 columns: {str: np.ndarray}, metric: str = DEFAULT_METRIC) \
+        -> {str: VaccineSeries}:
+    """Return a dictionary of each key in keys mapped to a series of metric made from its rows,
+    where columns maps every metric to its value in each row.
+
+    The rows are sorted once and every series is a view into the sorted columns. If a key has
+    more than one row for the same date, the last row is kept.
+
+    Preconditions:
+        - metric in columns
+        - all(key_ids.shape == dates.shape == columns[name].shape for name in columns)
+        - all(0 <= key_id < len(keys) for key_id in key_ids)
+
+    >>> dates = np.array(['2021-01-02', '2021-01-01', '2021-01-01'], dtype='datetime64[D]')
+    >>> series = split_series(['CAN', 'USA'], np.array([0, 0, 1]), dates, \
+    {'total_vaccinations': np.array([20, 10, 5])})
+    >>> series['CAN'][datetime.date(2021, 1, 2)]
+    20
+    >>> len(series['USA'])
+    1
+    """
+    order = np.lexsort((dates, key_ids))
+    key_ids = key_ids[order]
+    dates = dates[order]
+
+    # Keeps the last of every run of rows with the same key and date
+    last = np.ones(len(order), dtype=bool)
+    last[:-1] = (key_ids[1:] != key_ids[:-1]) | (dates[1:] != dates[:-1])
+    key_ids = key_ids[last]
+    dates = dates[last]
+    columns = {name: columns[name][order][last] for name in columns}
+
+    bounds = np.searchsorted(key_ids, np.arange(len(keys) + 1))
+    series = {}
+
+    for i in range(len(keys)):
+        location_columns = {name: columns[name][bounds[i]:bounds[i + 1]] for name in columns}
+        series[keys[i]] = VaccineSeries(dates[bounds[i]:bounds[i + 1]], location_columns[metric],
+                                        location_columns, metric)
+
+    return series
+
+
+def get_load_metrics(metric: str) -> [str]:
+    """Return the metrics to load to show metric on the map. The locations are summarized with
+    a count, so a rate is loaded after DEFAULT_METRIC. DEFAULT_METRIC and PER_HUNDRED_METRIC
+    are always loaded, since the summaries need them.
+
+    >>> get_load_metrics('people_vaccinated')
+    ['people_vaccinated', 'total_vaccinations', 'total_vaccinations_per_hundred']
+    >>> get_load_metrics('total_vaccinations_per_hundred')
+    ['total_vaccinations', 'total_vaccinations_per_hundred']
+    """
+    metrics = [metric] if metric in COUNT_METRICS else [DEFAULT_METRIC, metric]
+
+    return metrics + [name for name in (DEFAULT_METRIC, PER_HUNDRED_METRIC) if name not in metrics]
+
+
+def parse_metric_value(text: str, metric: str) -> float:
+    """Return the value of metric in a field of the vaccine dataset, or 0 if the field is empty.
+    Counts are truncated to integers.
+
+    >>> parse_metric_value('8200.0', 'total_vaccinations')
+    8200
+    >>> parse_metric_value('1.25', 'people_vaccinated_per_hundred')
+    1.25
+    """
+    if text == '':
+        return 0
+    elif METRICS[metric] is np.int64:
+        return int(float(text))
+    else:
+        return float(text)
+
+
+class VaccineRows:
+    """ The rows of the vaccine dataset that have been parsed so far, stored as flat columns,
+    together with everything needed to keep parsing rows that are appended to the dataset later.
+    Instance Attributes:
+        - metrics: The names of the metrics that are parsed. The first one is the metric of the
+          series made from the rows.
+        - codes: The country codes in the order they first appear. The id of a code is its index.
+        - country_names: The country codes mapped to the country names.
+        - ids: The id of the country code of each row.
+        - dates: The date of each row.
+        - columns: The metrics mapped to their value in each row, after filling in empty values.
+        - previous: The metrics mapped to the latest value of each country code, indexed by id.
+
+    Representation Invariants:
+        - self.metrics != [] and all(metric in METRICS for metric in self.metrics)
+        - self.ids.shape == self.dates.shape
+        - all(self.columns[metric].shape == self.ids.shape for metric in self.metrics)
+        - all(len(self.previous[metric]) == len(self.codes) for metric in self.metrics)
+    >>> rows = VaccineRows(['total_vaccinations', 'people_vaccinated_per_hundred'])
+    >>> rows.add_rows([['Canada', 'CAN', '2021-01-01', '10.0', '0.5'], \
+    ['Canada', 'CAN', '2021-01-02', '', '']])
+    >>> rows.add_rows([['Canada', 'CAN', '2021-01-03', '', '0.75'], \
+    ['Mexico', 'MEX', '2021-01-03', '', '']])
+    >>> rows.columns['total_vaccinations'].tolist()
+    [10, 10, 10, 0]
+    >>> rows.columns['people_vaccinated_per_hundred'].tolist()
+    [0.5, 0.5, 0.75, 0.0]
+    """
+    metrics: list[str]
+    codes: list[str]
+    country_names: {str: str}
+    ids: np.ndarray
+    dates: np.ndarray
+    columns: {str: np.ndarray}
+    previous: {str: np.ndarray}
+
+    def __init__(self, metrics: Optional[list[str]] = None) -> None:
+        """Initialize an empty set of rows with a column for each metric in metrics, or only for
+        DEFAULT_METRIC if metrics is None.
+
+        Raise ValueError if a metric is not in METRICS.
+        """
+        if metrics is None:
+            metrics = [DEFAULT_METRIC]
+        for metric in metrics:
+            if metric not in METRICS:
+                raise ValueError(f'unknown metric: {metric!r}')
+
+        self.metrics = list(metrics)
+        self.codes = []
+        self.country_names = {}
+        self.ids = np.array([], dtype=np.int64)
+        self.dates = np.array([], dtype='datetime64[D]')
+        self.columns = {metric: np.array([], dtype=METRICS[metric]) for metric in metrics}
+        self.previous = {metric: np.array([], dtype=METRICS[metric]) for metric in metrics}
+
+    def add_rows(self, rows: Iterable[list[str]]) -> None:
+        """Parse rows from the vaccine dataset and add them to the columns, where each row
+        contains the country name, the country code, the date and then the value of each metric
+        in self.metrics.
+
+        An empty or zero value is replaced by the latest value of the same metric and country,
+        unless it is the first row of that country.
+        """
+        row_codes = []
+        row_dates = []
+        row_values = {metric: [] for metric in self.metrics}
+        country_names = {}
+
+        for row in rows:
+            row_codes.append(row[1])
+            # The date column is already in ISO format, so numpy converts it directly
+            row_dates.append(row[2][0:10])
+            for i in range(len(self.metrics)):
+                row_values[self.metrics[i]].append(parse_metric_value(row[3 + i],
+                                                                      self.metrics[i]))
+
+            # Assigns the country name to the country code
+            country_names[row[1]] = row[0]
+
+        self.add_columns(np.array(row_codes, dtype=str),
+                         np.array(row_dates, dtype='datetime64[D]'),
+                         {metric: np.array(row_values[metric], dtype=METRICS[metric])
+                          for metric in self.metrics}, country_names)
+
+    def add_columns(self, row_codes: np.ndarray, dates: np.ndarray, values: {str: np.ndarray},
+                    country_names: {str: str}) -> None:
+        """Add rows from the vaccine dataset that have already been split into columns, where
+        row_codes contains the country code of each row as str or bytes and values maps each
+        metric in self.metrics to its value in each row.
+
+        An empty or zero value is replaced by the latest value of the same metric and country,
+        unless it is the first row of that country. This is done with array operations instead
+        of one step per row, and the rows are only grouped by country once for every metric.
+
+        Preconditions:
+            - all(row_codes.shape == dates.shape == values[metric].shape \
+            for metric in self.metrics)
+        """
+        self.country_names.update(country_names)
+        if len(row_codes) == 0:
+            return
+
+        unique_codes, inverse = np.unique(row_codes, return_inverse=True)
+        inverse = inverse.ravel()
+        if unique_codes.dtype.kind == 'S':
+            unique_codes = np.char.decode(unique_codes, 'UTF-8')
+
+        # New codes get the next ids, in the order they first appear
+        first_rows = np.full(len(unique_codes), len(row_codes))
+        np.minimum.at(first_rows, inverse, np.arange(len(row_codes)))
+        code_ids = {self.codes[i]: i for i in range(len(self.codes))}
+        seen_count = len(self.codes)
+        for i in np.argsort(first_rows, kind='stable'):
+            code = str(unique_codes[i])
+            if code not in code_ids:
+                code_ids[code] = len(self.codes)
+                self.codes.append(code)
+
+        id_of_code = np.array([code_ids[str(code)] for code in unique_codes], dtype=np.int64)
+        ids = id_of_code[inverse]
+
+        # Groups the rows of each country together, keeping their order within the group
+        order = np.argsort(ids, kind='stable')
+        sorted_ids = ids[order]
+        is_start = np.ones(len(order), dtype=bool)
+        is_start[1:] = sorted_ids[1:] != sorted_ids[:-1]
+        starts = np.flatnonzero(is_start)
+        ends = np.append(starts[1:], len(order)) - 1
+
+        for metric in self.metrics:
+            previous = np.zeros(len(self.codes), dtype=METRICS[metric])
+            previous[:seen_count] = self.previous[metric]
+            filled = values[metric][order].astype(METRICS[metric])
+
+            # The first row of a country continues from its previous value, if it has one
+            continues = (sorted_ids[starts] < seen_count) & (filled[starts] == 0)
+            filled[starts[continues]] = previous[sorted_ids[starts[continues]]]
+
+            # Keeps track of the previous value to account for empty spaces in the data
+            has_value = (filled != 0) | is_start
+            latest = np.maximum.accumulate(np.where(has_value, np.arange(len(order)), 0))
+            filled = filled[latest]
+            previous[sorted_ids[starts]] = filled[ends]
+
+            row_values = np.empty(len(order), dtype=METRICS[metric])
+            row_values[order] = filled
+
+            self.columns[metric] = np.concatenate([self.columns[metric], row_values])
+            self.previous[metric] = previous
+
+        self.ids = np.concatenate([self.ids, ids])
+        self.dates = np.concatenate([self.dates, dates.astype('datetime64[D]')])
+
+    def to_series(self) -> {str: VaccineSeries}:
+        """Return a dictionary of each country code mapped to the series of its rows, whose
+        metric is the first metric in self.metrics.
+        """
+        return split_series(self.codes, self.ids, self.dates, self.columns, self.metrics[0])
+
+
+class LocationSummary:
+    """ A summary of the vaccination series of a location, computed once when the location is
+    created so that it does not have to be computed from the series again.
+    Instance Attributes:
+        - first_date: The first date with vaccination data, or None if there is no data.
+        - latest_date: The latest date with vaccination data, or None if there is no data.
+        - latest_total: The latest total number of vaccinations.
+        - peak_daily_rate: The highest average number of vaccinations per day between two
+          consecutive dates with data.
+        - total_per_hundred: The latest total number of vaccinations per hundred people, or
+          None if it is not known.
+        - population: The population of the location implied by its latest total of
+          DEFAULT_METRIC and total_per_hundred, or None if it is not known.
+
+    Representation Invariants:
+        - (self.first_date is None) == (self.latest_date is None)
+        - self.first_date is None or self.first_date <= self.latest_date
+        - self.peak_daily_rate >= 0
+        - self.population is None or self.population > 0
+    >>> columns = {DEFAULT_METRIC: np.array([100, 500, 600]), \
+    PER_HUNDRED_METRIC: np.array([0.5, 2.5, 3.0])}
+    >>> summary = summarize_series(VaccineSeries(np.array(['2021-01-01', '2021-01-03', \
+    '2021-01-04'], dtype='datetime64[D]'), columns[DEFAULT_METRIC], columns))
+    >>> summary.latest_date, summary.latest_total
+    (datetime.date(2021, 1, 4), 600)
+    >>> summary.peak_daily_rate, summary.total_per_hundred, summary.population
+    (200.0, 3.0, 20000.0)
+    """
+    first_date: Optional[datetime.date]
+    latest_date: Optional[datetime.date]
+    latest_total: int
+    peak_daily_rate: float
+    total_per_hundred: Optional[float]
+    population: Optional[float]
+
+    def __init__(self, first_date: Optional[datetime.date],
+                 latest_date: Optional[datetime.date], latest_total: int,
+                 peak_daily_rate: float, total_per_hundred: Optional[float] = None,
+                 population: Optional[float] = None) -> None:
+        """Initialize a new summary with the given information."""
+        self.first_date = first_date
+        self.latest_date = latest_date
+        self.latest_total = latest_total
+        self.peak_daily_rate = peak_daily_rate
+        self.total_per_hundred = total_per_hundred
+        self.population = population
+
+
+def summarize_series(series: VaccineSeries) -> LocationSummary:
+    """Return the summary of a single series. The figures per hundred people are only known if
+    DEFAULT_METRIC and PER_HUNDRED_METRIC were loaded with the series.
+    """
+    if len(series) == 0:
+        return LocationSummary(None, None, 0, 0.0)
+
+    total_per_hundred, population = None, None
+    if DEFAULT_METRIC in series.columns and PER_HUNDRED_METRIC in series.columns:
+        total_per_hundred = float(series.columns[PER_HUNDRED_METRIC][-1])
+        if total_per_hundred > 0:
+            population = float(series.columns[DEFAULT_METRIC][-1]) * 100 / total_per_hundred
+
+    return LocationSummary(series.dates[0].item(), series.dates[-1].item(),
+                           int(series.values[-1]), get_peak_daily_rate(series),
+                           total_per_hundred, population)
+
+
+def combine_summaries(summaries: list[LocationSummary], series: VaccineSeries) \
+        -> LocationSummary:
+    """Return the summary of a location made up of locations with the given summaries, where
+    series is the sum of their series.
+
+    The peak daily rate is computed from series, since the peak of the sum is not the sum of
+    the peaks. Everything else is derived from summaries. The total per hundred people is
+    computed over the locations whose population is known, since rates cannot be added up.
+    """
+    dated = [summary for summary in summaries if summary.first_date is not None]
+    if dated == []:
+        first_date, latest_date = None, None
+    else:
+        first_date = min(summary.first_date for summary in dated)
+        latest_date = max(summary.latest_date for summary in dated)
+
+    populated = [summary for summary in summaries if summary.population is not None]
+    if populated == []:
+        total_per_hundred, population = None, None
+    else:
+        population = sum(summary.population for summary in populated)
+        total_per_hundred = sum(summary.total_per_hundred * summary.population
+                                for summary in populated) / population
+
+    return LocationSummary(first_date, latest_date,
+                           sum(summary.latest_total for summary in summaries),
+                           get_peak_daily_rate(series), total_per_hundred, population)
+
+
+def get_peak_daily_rate(series: VaccineSeries) -> float:
+    """Return the highest average number of vaccinations per day between two consecutive dates
+    in series, or 0.0 if the total never increases.
+
+    >>> get_peak_daily_rate(VaccineSeries.from_dict({datetime.date(2021, 1, 1): 100, \
+    datetime.date(2021, 1, 5): 500}))
+    100.0
+    """
+    if len(series) < 2:
+        return 0.0
+
+    rates = np.diff(series.values) / np.diff(series.dates).astype(np.int64)
+
+    return max(float(rates.max()), 0.0)
 
 
 class Location:
@@ -22,6 +527,8 @@ class Location:
         - coordinates: The latitude and longitude of the location.
         - vaccine_data: The vaccination data over an amount of time.
         - sub_locations: The countries within it if it is a continent.
+        - summary: The summary of the vaccination data. For a continent, it is derived from the
+          summaries of its countries.
 
     Representation Invariants:
         - isinstance(self.name, str)
@@ -37,26 +544,36 @@ class Location:
     name: str
     identifier: Optional[str]
     coordinates: [float, float]
-    vaccine_data: {datetime.date: int}
+    vaccine_data: VaccineSeries
     sub_locations: list[Location]
+    summary: LocationSummary
 
     def __init__(self, name: str, coordinates: [float, float],
                  vaccine_data: {datetime.date: int},
                  sub_locations: Optional[list] = None,
                  identifier: Optional[str] = None) -> None:
-        """Initialize a new location with the given information.
+        """Initialize a new location with the given information. If vaccine_data is a dictionary
+        it is converted into a VaccineSeries.
 
         Preconditions:
             - name != ''
         """
         if sub_locations is None:
             sub_locations = []
+        if not isinstance(vaccine_data, VaccineSeries):
+            vaccine_data = VaccineSeries.from_dict(vaccine_data)
         self.name = name
         self.identifier = identifier
         self.coordinates = coordinates
         self.vaccine_data = vaccine_data
         self.sub_locations = sub_locations
 
+        if self.is_country():
+            self.summary = summarize_series(vaccine_data)
+        else:
+            self.summary = combine_summaries([location.summary for location in sub_locations],
+                                             vaccine_data)
+
     def is_country(self) -> bool:
         """Return True if the location is a country. False if it is a continent.
         """
@@ -69,16 +586,230 @@ class Location:
         Preconditions:
             - self.vaccine_data != {}
         """
-        if self.is_country():
-            latest_entry = max(list(self.vaccine_data.keys()))
-            return self.vaccine_data[latest_entry]
+        return self.summary.latest_total
+
+    def get_total_at(self, date: datetime.date) -> int:
+        """Return the total number of vaccinations for the location as of date, using the latest
+        total on or before date. For a continent, this is the total of its countries as of date.
+        """
+        return self.vaccine_data.get_value_at(date)
+
+    def get_totals_between(self, start: datetime.date, end: datetime.date) -> VaccineSeries:
+        """Return the total vaccinations for the location on each date from start to end that
+        has data, including both.
+        """
+        return self.vaccine_data.get_slice(start, end)
+
+    def get_series(self, metric: str) -> VaccineSeries:
+        """Return the series of metric for the location, on the same dates as vaccine_data.
+
+        Raise KeyError if metric was not loaded for the location. Continents only have the
+        metrics in COUNT_METRICS, since rates per hundred or per million people cannot be added
+        up across their countries.
+        """
+        return self.vaccine_data.get_metric(metric)
+
+
+class SeriesIndex:
+    """ An index of the series of several locations that answers queries across all of them
+    at once.
+
+    The series of one metric are stored in one pair of columns, sorted by location and then by
+    date. Each entry has a key that combines the position of its location and its date, so the
+    entry of every location on a date is found with a single binary search over the keys.
+    Instance Attributes:
+        - locations: The locations in the index.
+        - keys: The key of each entry.
+        - metric: The metric of the series in the index, or None for the series in the
+          vaccine_data of each location.
+        - values: The value of each entry.
+        - offsets: The position of the first entry of each location, followed by the number of
+          entries.
+
+    Representation Invariants:
+        - self.keys.shape == self.values.shape
+        - len(self.offsets) == len(self.locations) + 1
+    >>> canada = Location('Canada', [56, -106], {datetime.date(2021, 1, 1): 100, \
+    datetime.date(2021, 1, 5): 500}, identifier='CAN')
+    >>> mexico = Location('Mexico', [23, -102], {datetime.date(2021, 1, 3): 300}, \
+    identifier='MEX')
+    >>> index = SeriesIndex([canada, mexico])
+    >>> index.get_totals_at(datetime.date(2021, 1, 2)).tolist()
+    [100, 0]
+    >>> index.get_totals_at(datetime.date(2021, 1, 5)).tolist()
+    [500, 300]
+    """
+    locations: list[Location]
+    metric: Optional[str]
+    keys: np.ndarray
+    values: np.ndarray
+    offsets: np.ndarray
+
+    def __init__(self, locations: list[Location], metric: Optional[str] = None) -> None:
+        """Initialize a new index of the series of metric for locations, or of their
+        vaccine_data if metric is None.
+
+        Raise KeyError if metric was not loaded for one of the locations.
+        """
+        if metric is None:
+            series_list = [location.vaccine_data for location in locations]
         else:
-            total = 0
+            series_list = [location.get_series(metric) for location in locations]
+
+        self.locations = locations
+        self.metric = metric
+        lengths = [len(series) for series in series_list]
+        self.offsets = np.cumsum([0] + lengths)
+
+        positions = np.repeat(np.arange(len(locations), dtype=np.int64), lengths)
+        days = np.concatenate([series.dates for series in series_list]
+                              + [np.array([], dtype='datetime64[D]')]).astype(np.int64)
+        self.keys = create_index_keys(positions, days)
+        value_type = np.int64 if metric is None else METRICS[metric]
+        self.values = np.concatenate([series.values for series in series_list]
+                                     + [np.array([], dtype=value_type)])
+
+    def get_totals_at(self, date: datetime.date) -> np.ndarray:
+        """Return the total vaccinations of each location as of date, in the same order as
+        self.locations, using the latest total on or before date.
+        """
+        return self.get_totals_on(np.array([date], dtype='datetime64[D]'))[:, 0]
 
-            for country in self.sub_locations:
-                total += country.get_latest_total()
+    def get_latest_totals(self) -> np.ndarray:
+        """Return the latest total of each location, in the same order as self.locations, or 0
+        for a location without any entries.
+
+        >>> canada = Location('Canada', [56, -106], {datetime.date(2021, 1, 1): 100, \
+        datetime.date(2021, 1, 5): 500}, identifier='CAN')
+        >>> SeriesIndex([canada]).get_latest_totals().tolist()
+        [500]
+        """
+        has_entries = self.offsets[1:] > self.offsets[:-1]
+        totals = np.zeros(len(self.locations), dtype=self.values.dtype)
+        totals[has_entries] = self.values[self.offsets[1:][has_entries] - 1]
+
+        return totals
+
+    def get_totals_on(self, dates: np.ndarray) -> np.ndarray:
+        """Return a matrix with a row for each location, in the same order as self.locations,
+        and a column for each date in dates, containing the total vaccinations of the location
+        as of the date.
+
+        >>> canada = Location('Canada', [56, -106], {datetime.date(2021, 1, 1): 100}, \
+        identifier='CAN')
+        >>> dates = np.arange('2020-12-31', '2021-01-03', dtype='datetime64[D]')
+        >>> SeriesIndex([canada]).get_totals_on(dates).tolist()
+        [[0, 100, 100]]
+        """
+        days = dates.astype('datetime64[D]').astype(np.int64)
+        positions = np.arange(len(self.locations), dtype=np.int64)
+        keys = create_index_keys(positions[:, np.newaxis], days[np.newaxis, :])
+        entries = np.searchsorted(self.keys, keys, side='right') - 1
+
+        # A location has no total yet if the entry found belongs to an earlier location
+        found = entries >= self.offsets[:-1, np.newaxis]
+        totals = np.zeros(keys.shape, dtype=self.values.dtype)
+        totals[found] = self.values[entries[found]]
+
+        return totals
+
+
+def create_index_keys(positions: np.ndarray, days: np.ndarray) -> np.ndarray:
+    """Return the keys of entries in a SeriesIndex with the given location positions and
+    days since 1970-01-01. Keys are ordered by position first and then by day.
+    """
+    # Shifts the days so that every date within 5000 years of 1970 is between 0 and 2 ** 22
+    return positions * 2 ** 22 + (days + 2 ** 21)
+
+
+def split_index_keys(keys: np.ndarray) -> (np.ndarray, np.ndarray):
+    """Return the location positions and days since 1970-01-01 of the entries with the given
+    keys in a SeriesIndex.
+
+    >>> positions, days = split_index_keys(create_index_keys(np.array([0, 3]), \
+    np.array([18628, -5])))
+    >>> positions.tolist(), days.tolist()
+    ([0, 3], [18628, -5])
+    """
+    return keys // 2 ** 22, keys % 2 ** 22 - 2 ** 21
+
+
+class VaccineDataset:
+    """ A custom data type that holds every dataset needed to build the map after it has been
+    read and processed once.
+    Instance Attributes:
+        - countries: The country locations.
+        - continents: The continent locations, built from the country locations.
+        - country_names: The country codes mapped to the country names.
+        - coordinates: The country codes mapped to the latitude and longitude of the country.
+        - continent_data: The continent names mapped to the country codes within them.
+        - country_index: An index of the country series, in the same order as countries.
+        - continent_index: An index of the continent series, in the same order as continents.
+        - _metric_indexes: The kind of locations, countries or continents, and a metric mapped
+          to the index of the series of that metric, for the indexes built so far.
+
+    Representation Invariants:
+        - all(country.is_country() for country in self.countries)
+        - all(not continent.is_country() for continent in self.continents)
+    >>> canada = Location('Canada', [56, -106], {datetime.date(2020, 12, 15): 100}, \
+    identifier='CAN')
+    >>> north_america = Location('North America', [54.5260, -105.2551], \
+    {datetime.date(2020, 12, 15): 100}, [canada])
+    >>> dataset = VaccineDataset([canada], [north_america], {'CAN': 'Canada'}, \
+    {'CAN': [56, -106]}, {'North America': ['CAN']})
+    >>> dataset.continents[0].sub_locations[0].name
+    'Canada'
+    """
+    countries: list[Location]
+    continents: list[Location]
+    country_names: {str: str}
+    coordinates: {str: [float, float]}
+    continent_data: {str: [str]}
+    country_index: SeriesIndex
+    continent_index: SeriesIndex
+    _metric_indexes: {(str, str): SeriesIndex}
+
+    def __init__(self, countries: list[Location], continents: list[Location],
+                 country_names: {str: str}, coordinates: {str: [float, float]},
+                 continent_data: {str: [str]}) -> None:
+        """Initialize a new dataset with the given information.
+        """
+        self.countries = countries
+        self.continents = continents
+        self.country_names = country_names
+        self.coordinates = coordinates
+        self.continent_data = continent_data
+        self.country_index = SeriesIndex(countries)
+        self.continent_index = SeriesIndex(continents)
+        self._metric_indexes = {}
+
+    def get_country_index(self, metric: Optional[str] = None) -> SeriesIndex:
+        """Return an index of the country series of metric, or self.country_index if metric is
+        None or is the metric of their vaccine data. The index of each other metric is built the
+        first time it is needed.
+        """
+        if metric is None or all(country.vaccine_data.metric == metric
+                                 for country in self.countries):
+            return self.country_index
+        if ('countries', metric) not in self._metric_indexes:
+            self._metric_indexes[('countries', metric)] = SeriesIndex(self.countries, metric)
+
+        return self._metric_indexes[('countries', metric)]
+
+    def get_continent_index(self, metric: Optional[str] = None) -> SeriesIndex:
+        """Return an index of the continent series of metric, or self.continent_index if metric
+        is None or is the metric of their vaccine data. The index of each other metric is built
+        the first time it is needed.
+
+        Raise KeyError if metric is not in COUNT_METRICS or was not loaded.
+        """
+        if metric is None or all(continent.vaccine_data.metric == metric
+                                 for continent in self.continents):
+            return self.continent_index
+        if ('continents', metric) not in self._metric_indexes:
+            self._metric_indexes[('continents', metric)] = SeriesIndex(self.continents, metric)
 
-            return total
+        return self._metric_indexes[('continents', metric)]
 
 
 if __name__ == '__main__':
@@ -94,7 +825,7 @@ if __name__ == '__main__':
 
     import python_ta
     python_ta.check_all(config={
-        'extra-imports': ['__future__', 'typing', 'datetime'],
+        'extra-imports': ['__future__', 'collections.abc', 'typing', 'datetime', 'numpy'],
         # the names (strs) of imported modules
         'allowed-io': [],  # the names (strs) of functions that call print/open/input
         'max-line-length': 100,
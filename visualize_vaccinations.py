@@ -8,148 +8,504 @@ Copyright and Usage Information
 
 This file is Copyright (c) 2021 Zachary Lee.
 """
+from typing import Callable, Optional
 import base64
+import datetime
+import os
+import tempfile
+from branca.colormap import StepColormap
+from branca.utilities import color_brewer
 import folium
-import plotly.graph_objects as go
-import process_vaccine_data
+import numpy as np
+import charts
+import derived_metrics
+import geometry
+import graph_cache
+import marker_layer
+import time_slider
 import vaccine_classes
 
 
-def add_country_data(vaccination_filename: str, country_coordinates_filename: str,
-                     country_json_filename: str, folium_map: folium.Map) -> None:
-    """Add the country vaccination data to the map.
+def add_country_data(dataset: vaccine_classes.VaccineDataset, country_json_filename: str,
+                     folium_map: folium.Map, geometry_directory: Optional[str] = None,
+                     date: Optional[datetime.date] = None,
+                     metric: Optional[str] = None, borders: Optional[dict] = None) -> None:
+    """Add the country vaccination data to the map. If date is not None, the totals as of date
+    are shown instead of the latest totals. If metric is not None, the values of that metric
+    are shown instead of the vaccine data of each country.
+
+    The country borders are simplified and only the countries in the dataset are kept. If
+    geometry_directory is not None, the simplified borders are cached in it. If borders is not
+    None, it is the GeoJSON data already prepared from country_json_filename, and the borders
+    are selected from it instead.
 
     Preconditions:
-        - vaccination_filename != ''
-        - country_code_filename != ''
+        - country_json_filename != ''
+        - metric is None or metric in vaccine_classes.METRICS
     """
-    countries = process_vaccine_data.create_country_locations(
-        vaccination_filename, country_coordinates_filename)
-    country_dictionary = {country.identifier: country.get_latest_total() // 1000000 for country
-                          in countries}
-    country_geo = country_json_filename
+    index = dataset.get_country_index(metric)
+    if date is None:
+        totals = index.get_latest_totals()
+    else:
+        totals = index.get_totals_at(date)
+
+    label, divisor, unit = get_metric_display(dataset.countries, metric)
+    country_dictionary = dict(zip([country.identifier for country in dataset.countries],
+                                  scale_values(totals, divisor)))
+    country_geo = get_borders(country_json_filename, 'ISO_A3', set(country_dictionary),
+                              geometry_directory, borders)
 
     folium.Choropleth(
         geo_data=country_geo,
         name="Country Level Choropleth",
         data=country_dictionary,
-        columns=["Country", "Total Vaccinations"],
+        columns=["Country", label],
         key_on="feature.properties.ISO_A3",
         fill_color="YlGnBu",
         fill_opacity=0.7,
         line_opacity=0.5,
-        legend_name="Country Level Total Vaccinations (In Millions)",
+        legend_name=create_legend_name('Country Level', label, unit),
         show=False).add_to(folium_map)
 
 
-def add_continent_data(vaccination_filename: str, country_coordinates_filename: str,
-                       continent_filename: str, continent_json_filename: str,
-                       folium_map: folium.Map) -> None:
-    """Add the continent vaccination data to the map.
+def add_continent_data(dataset: vaccine_classes.VaccineDataset, continent_json_filename: str,
+                       folium_map: folium.Map, geometry_directory: Optional[str] = None,
+                       date: Optional[datetime.date] = None,
+                       metric: Optional[str] = None, borders: Optional[dict] = None) -> None:
+    """Add the continent vaccination data to the map. If date is not None, the totals as of
+    date are shown instead of the latest totals. If metric is not None, the totals of that
+    metric are shown instead of the vaccine data of each continent.
+
+    The continent borders are simplified and only the continents in the dataset are kept. If
+    geometry_directory is not None, the simplified borders are cached in it. If borders is not
+    None, the borders are selected from it the same way as in add_country_data.
 
     Preconditions:
-        - vaccination_filename != ''
-        - country_code_filename != ''
+        - continent_json_filename != ''
+        - metric is None or metric in vaccine_classes.COUNT_METRICS
     """
-    countries = process_vaccine_data.create_country_locations(
-        vaccination_filename, country_coordinates_filename)
-    continents = process_vaccine_data.create_continent_locations(countries, continent_filename)
+    index = dataset.get_continent_index(metric)
+    if date is None:
+        totals = index.get_latest_totals()
+    else:
+        totals = index.get_totals_at(date)
 
-    continent_dictionary = {continent.name: continent.get_latest_total() // 1000000 for
-                            continent in continents}
+    label, divisor, unit = get_metric_display(dataset.continents, metric)
+    continent_dictionary = dict(zip([continent.name for continent in dataset.continents],
+                                    scale_values(totals, divisor)))
 
-    continent_geo = continent_json_filename
+    continent_geo = get_borders(continent_json_filename, 'continent', set(continent_dictionary),
+                                geometry_directory, borders)
 
     folium.Choropleth(
         geo_data=continent_geo,
         name="Continental Choropleth",
         data=continent_dictionary,
-        columns=["Continent", "Total Vaccinations"],
+        columns=["Continent", label],
         key_on="feature.properties.continent",
         fill_color="OrRd",
         fill_opacity=0.7,
         line_opacity=0.5,
-        legend_name="Continental Total Vaccinations (In Millions)").add_to(folium_map)
+        legend_name=create_legend_name('Continental', label, unit)).add_to(folium_map)
 
 
-def add_graph_markers_country(vaccine_filename: str, coordinate_filename: str,
-                              folium_map: folium.Map) -> None:
-    """Use plotly to generate graphs for each country and add markers for each graph to the map.
+def add_country_time_slider(dataset: vaccine_classes.VaccineDataset,
+                            country_json_filename: str, folium_map: folium.Map,
+                            bins: int = 6, geometry_directory: Optional[str] = None,
+                            metric: Optional[str] = None, borders: Optional[dict] = None) -> None:
+    """Add a choropleth of the country vaccination data with a slider that selects the day it
+    shows, from the first day with data to the latest. If metric is not None, the values of
+    that metric are shown instead of the vaccine data of each country.
+
+    The colour of every country on every day is computed here at once from the country index
+    of the dataset, and only the resulting matrix of colour buckets is added to the map. The
+    country borders are prepared the same way as in add_country_data.
 
     Preconditions:
-        - vaccine_filename != ''
-        - coordinate_filename != ''
+        - country_json_filename != ''
+        - 2 <= bins <= 9
+        - metric is None or metric in vaccine_classes.METRICS
     """
-    countries = process_vaccine_data.create_country_locations(vaccine_filename,
-                                                              coordinate_filename)
-    feature_group = folium.FeatureGroup(name='Country Level Markers and Graphs')
-    for country in countries:
-        dates = list(country.vaccine_data.keys())
-        dates.sort()
-        total_vaccinations = []
+    summaries = [country.summary for country in dataset.countries]
+    start = min(summary.first_date for summary in summaries)
+    end = max(summary.latest_date for summary in summaries)
+    dates = np.arange(start, end + datetime.timedelta(days=1), dtype='datetime64[D]')
+
+    index = dataset.get_country_index(metric)
+    totals = index.get_totals_on(dates).astype(np.float64)
+    # A country has no data before its first day, which is different from a total of 0
+    first_days, _ = derived_metrics.get_day_range(index)
+    totals[dates.astype(np.int64)[np.newaxis, :] < first_days[:, np.newaxis]] = np.nan
+
+    # Daily values can be higher on an earlier day than on the latest, so the highest value on
+    # any day is used
+    thresholds = time_slider.create_thresholds(int(np.ceil(np.nanmax(totals, initial=0))),
+                                               bins)
+    colors = color_brewer('YlGnBu', n=bins)
+    label, divisor, unit = get_metric_display(dataset.countries, metric)
+
+    codes = [country.identifier for country in dataset.countries]
+    time_slider.TimeSliderChoropleth(
+        get_borders(country_json_filename, 'ISO_A3', set(codes), geometry_directory, borders),
+        'ISO_A3', codes,
+        time_slider.create_buckets(totals, thresholds), start, colors,
+        name='Country Level Choropleth Over Time').add_to(folium_map)
+
+    StepColormap(colors, index=(thresholds / divisor).tolist(), vmin=0,
+                 vmax=thresholds[-1] / divisor,
+                 caption=create_legend_name('Country Level', f'{label} Over Time', unit)) \
+        .add_to(folium_map)
+
+
+def add_country_derived_data(dataset: vaccine_classes.VaccineDataset,
+                             country_json_filename: str, folium_map: folium.Map,
+                             derived: derived_metrics.DerivedMetrics,
+                             geometry_directory: Optional[str] = None,
+                             date: Optional[datetime.date] = None,
+                             metric: Optional[str] = None,
+                             borders: Optional[dict] = None) -> None:
+    """Add a choropleth of the average daily change of each country over the last week, from
+    the metrics derived from the country series of metric, or of the vaccine data if metric is
+    None. If date is not None, the average over the week ending on date is shown instead of the
+    week ending on the latest date of each country.
+
+    Countries without an average, such as those with less than a week of data, are left out.
+    The country borders are prepared the same way as in add_country_data.
+
+    Preconditions:
+        - country_json_filename != ''
+        - derived.index.locations == dataset.countries
+    """
+    if date is None:
+        averages = derived.get_latest('rolling_average')
+    else:
+        averages = derived.get_at('rolling_average', date)
+
+    label, divisor, unit = get_derived_display(dataset.countries, metric)
+    defined = ~np.isnan(averages)
+    codes = [country.identifier for country, has_average in zip(dataset.countries, defined)
+             if has_average]
+    country_dictionary = dict(zip(codes, scale_values(averages[defined], divisor)))
+    country_geo = get_borders(country_json_filename, 'ISO_A3', set(country_dictionary),
+                              geometry_directory, borders)
+
+    folium.Choropleth(
+        geo_data=country_geo,
+        name=f'Country Level {derived.window}-Day Average',
+        data=country_dictionary,
+        columns=["Country", label],
+        key_on="feature.properties.ISO_A3",
+        fill_color="PuBuGn",
+        fill_opacity=0.7,
+        line_opacity=0.5,
+        legend_name=create_legend_name('Country Level', label, unit),
+        show=False).add_to(folium_map)
+
+
+def get_borders(json_filename: str, key: str, identifiers: set, geometry_directory: Optional[str],
+                borders: Optional[dict]) -> dict:
+    """Return the borders of the locations in identifiers, selected from borders if it is not
+    None, or prepared from the GeoJSON file called json_filename otherwise.
+    """
+    if borders is None:
+        return geometry.prepare_geojson(json_filename, key, identifiers,
+                                        cache_directory=geometry_directory)
+
+    return geometry.select_features(borders, key, identifiers)
+
+
+def get_derived_display(locations: [vaccine_classes.Location], metric: Optional[str]) \
+        -> (str, int, Optional[str]):
+    """Return the label, divisor and unit of the average daily change of metric, or of the
+    metric of the vaccine data of locations if metric is None. The daily change of a count is
+    divided like the daily vaccinations.
+
+    >>> get_derived_display([], 'people_vaccinated')
+    ('People Vaccinated Per Day', 1000, 'In Thousands')
+    """
+    if metric is None:
+        metric = locations[0].vaccine_data.metric if locations != [] \
+            else vaccine_classes.DEFAULT_METRIC
+
+    label = f'{charts.METRIC_DISPLAY[metric][0]} Per Day'
+    if metric in vaccine_classes.COUNT_METRICS:
+        return (label,) + charts.METRIC_DISPLAY['daily_vaccinations'][1:]
+
+    return label, 1, None
+
+
+def create_derived_captions(locations: [vaccine_classes.Location],
+                            derived: derived_metrics.DerivedMetrics) -> [str]:
+    """Return the caption of the popup of each location, which shows its average daily change
+    over the last week and the growth of that change compared to the week before.
+
+    Preconditions:
+        - all(location in derived.index.locations for location in locations)
+    """
+    rows = {location.name: row for row, location in enumerate(derived.index.locations)}
+    averages = derived.get_latest('rolling_average')
+    growths = derived.get_latest('weekly_growth')
+    is_count = derived.index.metric is None \
+        or derived.index.metric in vaccine_classes.COUNT_METRICS
+    captions = []
+
+    for location in locations:
+        average, growth = averages[rows[location.name]], growths[rows[location.name]]
+        if np.isnan(average):
+            average_text = 'Not Available'
+        else:
+            average_text = f'{average:,.0f}' if is_count else f'{average:,.2f}'
+        growth_text = 'Not Available' if np.isnan(growth) else f'{growth:+.1%}'
+
+        captions.append(f'Per Day, {derived.window}-Day Average: {average_text}<br>'
+                        f'Week Over Week: {growth_text}')
+
+    return captions
+
+
+def get_metric_display(locations: [vaccine_classes.Location], metric: Optional[str]) \
+        -> (str, int, Optional[str]):
+    """Return the label, divisor and unit in charts.METRIC_DISPLAY of metric, or of the metric of
+    the vaccine data of locations if metric is None.
+    """
+    if metric is None:
+        metric = locations[0].vaccine_data.metric if locations != [] \
+            else vaccine_classes.DEFAULT_METRIC
+
+    return charts.METRIC_DISPLAY[metric]
+
+
+def scale_values(values: np.ndarray, divisor: int) -> list:
+    """Return values divided by divisor and rounded down, or unchanged if divisor is 1.
+
+    >>> scale_values(np.array([2500000, 999999]), 1000000)
+    [2, 0]
+    >>> scale_values(np.array([12.5]), 1)
+    [12.5]
+    """
+    if divisor == 1:
+        return values.tolist()
+
+    return (values // divisor).tolist()
+
+
+def create_legend_name(level: str, label: str, unit: Optional[str]) -> str:
+    """Return the legend name of a layer of the locations at level that shows label in unit.
+
+    >>> create_legend_name('Country Level', 'Total Vaccinations', 'In Millions')
+    'Country Level Total Vaccinations (In Millions)'
+    """
+    if unit is None:
+        return f'{level} {label}'
+
+    return f'{level} {label} ({unit})'
+
 
-        for date in dates:
-            total_vaccinations.append(country.vaccine_data[date])
+def add_graph_markers_country(dataset: vaccine_classes.VaccineDataset, folium_map: folium.Map,
+                              processes: Optional[int] = None,
+                              cache: Optional[graph_cache.GraphCache] = None,
+                              graph_directory: Optional[str] = None,
+                              graph_url: Optional[Callable] = None,
+                              metric: Optional[str] = None, clustered: bool = False,
+                              derived: Optional[derived_metrics.DerivedMetrics] = None) -> None:
+    """Use plotly to generate graphs for each country and add markers for each graph to the map.
+    If metric is not None, the graphs show that metric instead of the vaccine data.
+
+    The graphs are rendered in parallel by up to processes worker processes. If processes is
+    None, one worker is used for each CPU. If a cache is given, only the graphs that are not
+    already in it are rendered.
 
-        fig = go.Figure()
-        fig.add_trace(go.Scatter(x=dates, y=total_vaccinations))
-        fig.update_xaxes(title_text='Date')
-        fig.update_yaxes(title_text='Total Vaccinations')
-        title = f'Total Vaccinations in {country.name} Over Time'
-        fig.update_layout(title_text=title)
-        jpg = 'datasets/graph.jpg'
-        fig.write_image(file=jpg, format='jpg', width=500, height=410)
+    If graph_directory is None, the graphs are embedded in the map. Otherwise they are saved as
+    separate files in graph_directory, which must be relative to the directory the map is saved
+    in, and each popup only loads its graph when it is opened.
 
-        encoded = base64.b64encode(open(jpg, 'rb').read())
+    If graph_url is not None, no graphs are rendered, and each popup loads its graph from the
+    url graph_url returns for its location instead, such as a server that renders it on demand.
 
-        html = '<img src="data:image/jpg;base64,{}">'.format
+    If clustered is True, the markers are added as a single GraphMarkerLayer, which clusters
+    nearby markers and keeps the map small when there are many locations.
 
-        iframe = folium.IFrame(html(encoded.decode('UTF-8')), width='510px', height='430px')
+    If derived is not None, each popup also shows the weekly average and growth of the country
+    from those derived metrics.
+    """
+    captions = None if derived is None else create_derived_captions(dataset.countries, derived)
+
+    if clustered:
+        sources = create_graph_sources(dataset.countries, processes, cache, graph_directory,
+                                       graph_url, metric)
+        marker_layer.GraphMarkerLayer(dataset.countries, sources, 'flag', 'blue',
+                                      charts.GRAPH_WIDTH, charts.GRAPH_HEIGHT,
+                                      name='Country Level Markers and Graphs',
+                                      captions=captions).add_to(folium_map)
+        return
+
+    popups = create_graph_popups(dataset.countries, processes, cache, graph_directory,
+                                 graph_url, metric, captions)
+
+    feature_group = folium.FeatureGroup(name='Country Level Markers and Graphs')
+    for country, popup in zip(dataset.countries, popups):
         feature_group.add_child(folium.Marker(location=country.coordinates,
-                                              popup=folium.Popup(iframe, max_width=2650),
+                                              popup=popup,
                                               icon=folium.Icon(icon='flag')))
     folium_map.add_child(feature_group)
 
 
-def add_graph_markers_continent(countries: [vaccine_classes.Location],
-                                continent_filename: str, folium_map: folium.Map) -> None:
+def add_graph_markers_continent(dataset: vaccine_classes.VaccineDataset,
+                                folium_map: folium.Map,
+                                processes: Optional[int] = None,
+                                cache: Optional[graph_cache.GraphCache] = None,
+                                graph_directory: Optional[str] = None,
+                                graph_url: Optional[Callable] = None,
+                                metric: Optional[str] = None, clustered: bool = False,
+                                derived: Optional[derived_metrics.DerivedMetrics] = None) \
+        -> None:
     """Use plotly to generate graphs for each continent and add markers for each graph to the map.
+    If metric is not None, the graphs show that metric instead of the vaccine data, and it must
+    be in COUNT_METRICS.
 
-    Preconditions:
-        - vaccine_filename != ''
-        - coordinate_filename != ''
+    The graphs are rendered in parallel by up to processes worker processes. If processes is
+    None, one worker is used for each CPU. If a cache is given, only the graphs that are not
+    already in it are rendered.
+
+    If graph_directory is None, the graphs are embedded in the map. Otherwise they are saved as
+    separate files in graph_directory, which must be relative to the directory the map is saved
+    in, and each popup only loads its graph when it is opened.
+
+    If graph_url is not None, no graphs are rendered, and each popup loads its graph from the
+    url graph_url returns for its location instead, such as a server that renders it on demand.
+
+    If clustered is True, the markers are added as a single GraphMarkerLayer, which clusters
+    nearby markers and keeps the map small when there are many locations.
+
+    If derived is not None, each popup also shows the weekly average and growth of the
+    continent from those derived metrics.
     """
-    continents = process_vaccine_data.create_continent_locations(countries, continent_filename)
+    continents = charts.get_graph_continents(dataset)
+    captions = None if derived is None else create_derived_captions(continents, derived)
+
+    if clustered:
+        sources = create_graph_sources(continents, processes, cache, graph_directory, graph_url,
+                                       metric)
+        marker_layer.GraphMarkerLayer(continents, sources, 'globe', 'red', charts.GRAPH_WIDTH,
+                                      charts.GRAPH_HEIGHT, name='Continental Markers and Graphs',
+                                      captions=captions).add_to(folium_map)
+        return
+
+    popups = create_graph_popups(continents, processes, cache, graph_directory, graph_url,
+                                 metric, captions)
 
     feature_group = folium.FeatureGroup(name='Continental Markers and Graphs')
-    for continent in continents:
-        if continent.vaccine_data != {}:
-            dates = list(continent.vaccine_data.keys())
-            dates.sort()
-            total_vaccinations = []
-
-            for date in dates:
-                total_vaccinations.append(continent.vaccine_data[date])
-
-            fig = go.Figure()
-            fig.add_trace(go.Scatter(x=dates, y=total_vaccinations))
-            fig.update_xaxes(title_text='Date')
-            fig.update_yaxes(title_text='Total Vaccinations')
-            title = f'Total Vaccinations in {continent.name} Over Time'
-            fig.update_layout(title_text=title)
-            fig.write_image(file='datasets/graph.jpg', format='jpg', width=500, height=410)
-
-            encoded = base64.b64encode(open('datasets/graph.jpg', 'rb').read())
-
-            html = '<img src="data:image/jpg;base64,{}">'.format
-
-            iframe = folium.IFrame(html(encoded.decode('UTF-8')), width='510px', height='430px')
-            feature_group.add_child(folium.Marker(location=continent.coordinates,
-                                                  popup=folium.Popup(iframe, max_width=2650),
-                                                  icon=folium.Icon(icon='globe', color='red')))
+    for continent, popup in zip(continents, popups):
+        feature_group.add_child(folium.Marker(location=continent.coordinates,
+                                              popup=popup,
+                                              icon=folium.Icon(icon='globe', color='red')))
     folium_map.add_child(feature_group)
 
 
+def create_graph_popups(locations: [vaccine_classes.Location], processes: Optional[int],
+                        cache: Optional[graph_cache.GraphCache],
+                        graph_directory: Optional[str],
+                        graph_url: Optional[Callable] = None,
+                        metric: Optional[str] = None,
+                        captions: Optional[list] = None) -> [folium.Popup]:
+    """Return a popup displaying the graph of metric, or of the vaccine data if metric is None,
+    for each location, in the same order as locations. If captions is not None, captions[i] is
+    shown below the graph of locations[i].
+
+    If graph_url is not None, the popups link to the url it returns for each location. If
+    graph_directory is None, the graphs are embedded in the popups. Otherwise they are saved
+    in graph_directory and the popups link to them.
+    """
+    if captions is None:
+        captions = [None] * len(locations)
+
+    if graph_url is None and graph_directory is None:
+        images = charts.render_graphs(locations, processes, cache, metric)
+        return [create_graph_popup(image, caption) for image, caption in zip(images, captions)]
+
+    sources = create_graph_sources(locations, processes, cache, graph_directory, graph_url,
+                                   metric)
+    return [create_graph_link_popup(source, caption)
+            for source, caption in zip(sources, captions)]
+
+
+def create_graph_sources(locations: [vaccine_classes.Location], processes: Optional[int],
+                         cache: Optional[graph_cache.GraphCache],
+                         graph_directory: Optional[str],
+                         graph_url: Optional[Callable] = None,
+                         metric: Optional[str] = None) -> [str]:
+    """Return the url of the graph of metric, or of the vaccine data if metric is None, for each
+    location, in the same order as locations.
+
+    If graph_url is not None, the url it returns for each location is used. If graph_directory
+    is None, the graphs are embedded in data urls. Otherwise they are saved in graph_directory
+    and linked to.
+    """
+    if graph_url is not None:
+        return [graph_url(location) for location in locations]
+
+    return create_graph_urls(charts.render_graphs(locations, processes, cache, metric),
+                             graph_directory)
+
+
+def create_graph_urls(images: [bytes], graph_directory: Optional[str],
+                      output_directory: str = '') -> [str]:
+    """Return the url of each image from a map saved in output_directory.
+
+    If graph_directory is None, the images are embedded in data urls. Otherwise they are saved
+    in graph_directory, relative to output_directory, and the urls are relative to
+    output_directory, so they still work when the map is opened from another directory.
+
+    >>> directory = os.path.join(tempfile.mkdtemp(), 'maps')
+    >>> url = create_graph_urls([b'image'], 'graphs', directory)[0]
+    >>> url.startswith('graphs/'), os.path.exists(os.path.join(directory, url))
+    (True, True)
+    >>> create_graph_urls([b'image'], None)
+    ['data:image/jpg;base64,aW1hZ2U=']
+    """
+    if graph_directory is None:
+        return [f'data:image/jpg;base64,{base64.b64encode(image).decode("UTF-8")}'
+                for image in images]
+
+    filenames = charts.save_graphs(images, os.path.join(output_directory, graph_directory))
+    url = graph_directory.replace(os.sep, '/')
+
+    return [f'{url}/{filename}' for filename in filenames]
+
+
+def create_graph_link_popup(url: str, caption: Optional[str] = None) -> folium.Popup:
+    """Return a popup that displays the jpg image at url, followed by caption if it is not
+    None.
+
+    The image is lazily loaded, so the browser only downloads it when the popup is opened.
+
+    >>> popup = create_graph_link_popup('graphs/canada.jpg')
+    >>> 'loading="lazy"' in popup.html.render()
+    True
+    """
+    html = (f'<img src="{url}" loading="lazy" width="{charts.GRAPH_WIDTH}" '
+            f'height="{charts.GRAPH_HEIGHT}">')
+    if caption is not None:
+        html += f'<p>{caption}</p>'
+
+    return folium.Popup(html, max_width=2650)
+
+
+def create_graph_popup(image: bytes, caption: Optional[str] = None) -> folium.Popup:
+    """Return a popup that displays the jpg image inline, followed by caption if it is not None.
+    """
+    encoded = base64.b64encode(image)
+
+    html = '<img src="data:image/jpg;base64,{}">'.format(encoded.decode('UTF-8'))
+    height = 430
+    if caption is not None:
+        html += f'<p>{caption}</p>'
+        height += 50
+
+    iframe = folium.IFrame(html, width='510px', height=f'{height}px')
+    return folium.Popup(iframe, max_width=2650)
+
+
 if __name__ == '__main__':
     # You can uncomment the following lines for code checking/debugging purposes.
     # However, we recommend commenting out these lines when working with the large
@@ -163,10 +519,12 @@ if __name__ == '__main__':
 
     import python_ta
     python_ta.check_all(config={
-        'extra-imports': ['folium', 'process_vaccine_data', 'webbrowser', 'plotly.graph_objects',
-                          'base64', 'vaccine_classes'],
+        'extra-imports': ['folium', 'base64', 'vaccine_classes', 'typing', 'os', 'tempfile',
+                          'numpy', 'charts', 'graph_cache', 'datetime', 'branca.colormap',
+                          'branca.utilities', 'time_slider', 'geometry', 'marker_layer',
+                          'derived_metrics'],
         # the names (strs) of imported modules
-        'allowed-io': ['add_graph_markers_country', 'add_graph_markers_continent'],
+        'allowed-io': [],
         # the names (strs) of functions that call print/open/input
         'max-line-length': 100,
         'disable': ['E1136']